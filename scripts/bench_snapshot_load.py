@@ -0,0 +1,99 @@
+"""
+Benchmark snapshot loading, which dominates the startup time of `cimple stream update` on big
+snapshots, and snapshot diffing, which dominates `cimple snapshot diff`.
+
+Generates a synthetic snapshot and a changed copy of it, and times load_snapshot on the first and
+diff_snapshots between them.
+
+Usage: uv run python scripts/bench_snapshot_load.py [--pkgs N] [--repeat N]
+"""
+
+import argparse
+import json
+import pathlib
+import random
+import tempfile
+import timeit
+
+import cimple.constants
+import cimple.snapshot.core
+
+
+def generate_snapshot(pkg_count: int, name: str = "bench", seed: int = 0) -> dict:
+    """
+    Generate a snapshot. Snapshots generated with different seeds differ in the version and hash
+    of about 1% of their packages.
+    """
+    rng = random.Random(0)
+    changed_rng = random.Random(seed)
+    pkgs = []
+    for index in range(pkg_count):
+        # Depend on a few packages with a lower index, so the graph is a DAG
+        build_depends = [f"pkg{dep}-bin" for dep in rng.sample(range(index), min(index, 5))]
+        depends = [f"pkg{dep}-bin" for dep in rng.sample(range(index), min(index, 3))]
+        changed = seed != 0 and changed_rng.random() < 0.01
+        pkgs.append(
+            {
+                "name": f"pkg{index}",
+                "version": f"1.0-{seed + 1}" if changed else "1.0-1",
+                "pkg_type": "src",
+                "build_depends": build_depends,
+                "binary_packages": [f"pkg{index}-bin"],
+            }
+        )
+        pkgs.append(
+            {
+                "name": f"pkg{index}-bin",
+                "sha256": f"{index + seed * pkg_count * 2 if changed else index:064x}",
+                "pkg_type": "bin",
+                "compression_method": "xz",
+                "depends": depends,
+            }
+        )
+
+    empty_changes = {"add": [], "remove": [], "update": []}
+    return {
+        "version": 0,
+        "name": name,
+        "pkgs": pkgs,
+        "bootstrap_pkgs": [],
+        "ancestor": None,
+        "changes": empty_changes,
+        "bootstrap_changes": empty_changes,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pkgs", type=int, default=20000, help="Number of source packages")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of runs to time")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cimple.constants.cimple_snapshot_dir = pathlib.Path(tmp_dir)
+        snapshot_path = cimple.constants.cimple_snapshot_dir / "bench.json"
+        snapshot_json = json.dumps(generate_snapshot(args.pkgs)).encode()
+        snapshot_path.write_bytes(snapshot_json)
+        changed_snapshot = generate_snapshot(args.pkgs, name="bench-changed", seed=1)
+        (cimple.constants.cimple_snapshot_dir / "bench-changed.json").write_text(
+            json.dumps(changed_snapshot)
+        )
+
+        def load() -> None:
+            cimple.snapshot.core.load_snapshot("bench")
+
+        def diff() -> None:
+            # Time diffing snapshots that were not loaded before
+            cimple.snapshot.core._snapshot_states.clear()
+            cimple.snapshot.core.diff_snapshots("bench", "bench-changed")
+
+        load_seconds = min(timeit.repeat(load, number=1, repeat=args.repeat))
+        diff_seconds = min(timeit.repeat(diff, number=1, repeat=args.repeat))
+
+    print(f"Snapshot with {args.pkgs} source packages ({len(snapshot_json)} bytes)")
+    print(f"  load: {load_seconds * 1000:.1f} ms")
+    print(f"  diff: {diff_seconds * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
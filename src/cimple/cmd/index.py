@@ -0,0 +1,28 @@
+# Pathlib is by pydantic at runtime
+import pathlib  # noqa: TC003
+import typing
+
+import typer
+
+import cimple.logging
+import cimple.pkg.catalog
+
+index_app = typer.Typer()
+
+
+@index_app.command(name="compile")
+def compile_index(
+    pkg_index: typing.Annotated[pathlib.Path, typer.Option()],
+):
+    """
+    Compile all package configs of a package index into its catalog, for faster loading.
+
+    Only package configs that changed since the last compilation are parsed again.
+    """
+    result = cimple.pkg.catalog.compile_pkg_catalog(pkg_index)
+    cimple.logging.info(
+        "Compiled %d package configs, reused %d, removed %d",
+        result.compiled,
+        result.reused,
+        result.removed,
+    )
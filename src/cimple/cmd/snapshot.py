@@ -1,3 +1,4 @@
+import json
 import pathlib
 import typing
 
@@ -5,6 +6,7 @@ import typer
 
 import cimple.logging
 import cimple.models.snapshot
+import cimple.trace
 from cimple.models import pkg as pkg_models
 from cimple.snapshot import core as snapshot_core
 from cimple.snapshot import ops as snapshot_ops
@@ -21,6 +23,16 @@ def change(
     extra_paths: typing.Annotated[
         list[pathlib.Path] | None, typer.Option("--dangerously-add-extra-bin-path")
     ] = None,
+    delta: typing.Annotated[
+        bool, typer.Option(help="Store the snapshot as a delta from its ancestor")
+    ] = False,
+    live_output: typing.Annotated[
+        bool, typer.Option(help="Print build output as it is produced, prefixed with the package")
+    ] = False,
+    trace: typing.Annotated[
+        pathlib.Path | None,
+        typer.Option(help="Write a Chrome trace of the build, which can be loaded in Perfetto"),
+    ] = None,
 ):
     if extra_paths is None:
         extra_paths = []
@@ -55,17 +67,19 @@ def change(
         update=[],
     )
 
-    snapshot_ops.process_changes(
-        origin_snapshot=snapshot,
-        pkg_changes=changes,
-        bootstrap_changes=cimple.models.snapshot.SnapshotChanges.model_construct(
-            add=[], remove=[], update=[]
-        ),
-        pkg_index_path=pathlib.Path(pkg_index),
-        parallel=parallel,
-        extra_paths=extra_paths,
-    )
-    snapshot.dump_snapshot()
+    with cimple.trace.tracing(trace):
+        snapshot_ops.process_changes(
+            origin_snapshot=snapshot,
+            pkg_changes=changes,
+            bootstrap_changes=cimple.models.snapshot.SnapshotChanges.model_construct(
+                add=[], remove=[], update=[]
+            ),
+            pkg_index_path=pathlib.Path(pkg_index),
+            parallel=parallel,
+            extra_paths=extra_paths,
+            live_output=live_output,
+        )
+    snapshot.dump_snapshot(delta=delta)
 
 
 @snapshot_app.command()
@@ -73,9 +87,16 @@ def reproduce(
     reproduce_snapshot_name: typing.Annotated[str, typer.Option],
     pkg_index: typing.Annotated[str, typer.Option()],
     parallel: typing.Annotated[int, typer.Option(help="Number of parallel jobs")],
+    live_output: typing.Annotated[
+        bool, typer.Option(help="Print build output as it is produced, prefixed with the package")
+    ] = False,
+    trace: typing.Annotated[
+        pathlib.Path | None,
+        typer.Option(help="Write a Chrome trace of the build, which can be loaded in Perfetto"),
+    ] = None,
 ):
     snapshot = snapshot_core.load_snapshot("root")
-    snapshot_to_reproduce = snapshot_core.load_snapshot(reproduce_snapshot_name)
+    snapshot_to_reproduce = snapshot_core.get_snapshot(reproduce_snapshot_name)
 
     bootstrap_pkgs_to_add = [
         snapshot_ops.VersionedSourcePackage(id=package_id, version=package_data.version)
@@ -108,31 +129,77 @@ def reproduce(
         update=[],
     )
 
-    snapshot_ops.process_changes(
-        origin_snapshot=snapshot,
-        pkg_changes=pkg_changes,
-        bootstrap_changes=bootstrap_changes,
-        pkg_index_path=pathlib.Path(pkg_index),
-        parallel=parallel,
-    )
-
-    different_pkg_id = snapshot.compare_pkgs_with(snapshot_to_reproduce)
+    with cimple.trace.tracing(trace):
+        snapshot_ops.process_changes(
+            origin_snapshot=snapshot,
+            pkg_changes=pkg_changes,
+            bootstrap_changes=bootstrap_changes,
+            pkg_index_path=pathlib.Path(pkg_index),
+            parallel=parallel,
+            live_output=live_output,
+        )
 
-    if different_pkg_id is None:
+    if snapshot.compare_pkgs_with(snapshot_to_reproduce) is None:
         cimple.logging.info(
             "All packages in snapshot %s are reproducible!", reproduce_snapshot_name
         )
         return
 
+    different_pkg_ids = snapshot.diff_pkgs_with(snapshot_to_reproduce)
     cimple.logging.info(
-        "%s in snapshot %s is not reproducible!", different_pkg_id, reproduce_snapshot_name
-    )
-    cimple.logging.info(
-        "Dumping package data for %s obtained from reproduction...", different_pkg_id
+        "%d packages in snapshot %s are not reproducible!",
+        len(different_pkg_ids),
+        reproduce_snapshot_name,
     )
-    package_data = (
-        snapshot.src_pkg_map[different_pkg_id]
-        if different_pkg_id.type == "src"
-        else snapshot.bin_pkg_map[different_pkg_id]
-    )
-    cimple.logging.info("%s", package_data.model_dump_json(indent=2))
+    for different_pkg_id in different_pkg_ids:
+        package_data = (
+            snapshot.src_pkg_map.get(different_pkg_id)
+            if different_pkg_id.type == "src"
+            else snapshot.bin_pkg_map.get(different_pkg_id)
+        )
+        if package_data is None:
+            cimple.logging.info("%s is missing from the reproduction", different_pkg_id)
+            continue
+
+        cimple.logging.info(
+            "Dumping package data for %s obtained from reproduction...", different_pkg_id
+        )
+        cimple.logging.info("%s", package_data.model_dump_json(indent=2))
+
+
+@snapshot_app.command()
+def diff(
+    from_snapshot_name: str,
+    to_snapshot_name: str,
+    json_output: typing.Annotated[
+        bool, typer.Option("--json", help="Print the differences as JSON")
+    ] = False,
+):
+    """
+    Show the packages added, removed or changed between two snapshots.
+    """
+    pkg_diffs = snapshot_core.diff_snapshots(from_snapshot_name, to_snapshot_name)
+
+    if json_output:
+        print(json.dumps([pkg_diff.model_dump() for pkg_diff in pkg_diffs], indent=2))
+        return
+
+    change_markers = {
+        "added": "+",
+        "removed": "-",
+        "version_changed": "~",
+        "sha256_changed": "~",
+        "depends_changed": "~",
+    }
+    for pkg_diff in pkg_diffs:
+        kind = f"bootstrap {pkg_diff.pkg_type}" if pkg_diff.bootstrap else pkg_diff.pkg_type
+        line = f"{change_markers[pkg_diff.change]} {kind} {pkg_diff.name}"
+        if pkg_diff.change == "added":
+            line += f" {pkg_diff.to_value}"
+        elif pkg_diff.change == "removed":
+            line += f" {pkg_diff.from_value}"
+        elif pkg_diff.change == "depends_changed":
+            line += " (dependencies changed)"
+        else:
+            line += f" {pkg_diff.from_value} -> {pkg_diff.to_value}"
+        print(line)
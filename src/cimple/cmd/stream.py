@@ -7,19 +7,65 @@ import typer
 import cimple.constants
 import cimple.logging
 import cimple.models.stream
+import cimple.pkg.ops
 import cimple.snapshot.core
 import cimple.snapshot.ops
+import cimple.snapshot.plan
 import cimple.stream
+import cimple.trace
 
 stream_app = typer.Typer()
 
 
+def _format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(round(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}h{minutes:02}m{seconds:02}s"
+    if minutes:
+        return f"{minutes}m{seconds:02}s"
+    return f"{seconds}s"
+
+
+def _print_build_plan(build_plan: cimple.snapshot.plan.BuildPlan) -> None:
+    print(f"{build_plan.pkg_count} packages would be built in {len(build_plan.waves)} waves:")
+    for wave_index, wave in enumerate(build_plan.waves, start=1):
+        print(f"  Wave {wave_index}: {', '.join(pkg_id.name for pkg_id in wave)}")
+
+    print(
+        f"Estimated build time: {_format_duration(build_plan.serial_seconds)} serially, "
+        f"{_format_duration(build_plan.parallel_seconds)} with enough parallel builders"
+    )
+    if build_plan.unknown_duration_pkgs:
+        print(
+            f"  {len(build_plan.unknown_duration_pkgs)} packages have no recorded build duration "
+            "and are estimated at the average of the others"
+        )
+
+    if build_plan.critical_path:
+        critical_path = " -> ".join(
+            f"{pkg_id.name} ({_format_duration(seconds)})"
+            for pkg_id, seconds in build_plan.critical_path
+        )
+        print(f"Critical path: {critical_path}")
+
+
 @stream_app.command()
 def update(
     stream: str,
     pkg_index: typing.Annotated[pathlib.Path, typer.Option()],
     dry_run: typing.Annotated[bool, typer.Option(help="Do not run the actual build")] = False,
     parallel: typing.Annotated[int, typer.Option(help="Number of parallel jobs")] = 1,
+    delta: typing.Annotated[
+        bool, typer.Option(help="Store the snapshot as a delta from its ancestor")
+    ] = False,
+    live_output: typing.Annotated[
+        bool, typer.Option(help="Print build output as it is produced, prefixed with the package")
+    ] = False,
+    trace: typing.Annotated[
+        pathlib.Path | None,
+        typer.Option(help="Write a Chrome trace of the build, which can be loaded in Perfetto"),
+    ] = None,
 ):
     """
     Update stream snapshot based on the latest stream config.
@@ -53,18 +99,32 @@ def update(
         print(
             "The following bootstrap changes would be applied to the snapshot:", bootstrap_changes
         )
+
+        # Compute what would be built, without building anything
+        build_graph = snapshot.update_with_changes(
+            pkg_changes=pkg_changes,
+            bootstrap_changes=bootstrap_changes,
+            pkg_processor=cimple.pkg.ops.PkgOps(),
+            pkg_index_path=pkg_index,
+        )
+        build_plan = cimple.snapshot.plan.compute_build_plan(
+            build_graph, cimple.snapshot.plan.load_build_durations()
+        )
+        _print_build_plan(build_plan)
         return
 
     # Process changes
     cimple.logging.info("Processing snapshot changes")
-    cimple.snapshot.ops.process_changes(
-        origin_snapshot=snapshot,
-        pkg_changes=pkg_changes,
-        bootstrap_changes=bootstrap_changes,
-        pkg_index_path=pkg_index,
-        parallel=parallel,
-    )
+    with cimple.trace.tracing(trace):
+        cimple.snapshot.ops.process_changes(
+            origin_snapshot=snapshot,
+            pkg_changes=pkg_changes,
+            bootstrap_changes=bootstrap_changes,
+            pkg_index_path=pkg_index,
+            parallel=parallel,
+            live_output=live_output,
+        )
 
     # Dump updated snapshot
     cimple.logging.info("Committing updated snapshot")
-    snapshot.dump_snapshot()
+    snapshot.dump_snapshot(delta=delta)
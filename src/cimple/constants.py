@@ -12,6 +12,9 @@ cimple_pkg_dir = cimple_share_dir / "pkg"
 cimple_stream_dir = cimple_share_dir / "stream"
 
 cimple_extracted_image_dir = cimple_local_dir / "extracted_image"
-cimple_pkg_build_dir = cimple_local_dir / "pkg_build"
-cimple_pkg_output_dir = cimple_local_dir / "pkg_output"
-cimple_deps_dir = cimple_local_dir / "deps"
+cimple_workspace_dir = cimple_local_dir / "workspace"
+cimple_trash_dir = cimple_local_dir / "trash"
+cimple_source_cache_dir = cimple_local_dir / "source_cache"
+cimple_toolchain_env_dir = cimple_local_dir / "toolchain_env"
+cimple_build_durations_path = cimple_local_dir / "build_durations.json"
+cimple_build_usage_dir = cimple_local_dir / "build_usage"
@@ -1,7 +1,13 @@
+import functools
+import hashlib
+import json
 import os
 import pathlib
 import subprocess
+import threading
 
+import cimple.constants
+import cimple.logging
 import cimple.system
 
 
@@ -47,12 +53,13 @@ def baseline_env() -> dict[str, str]:
         for env in windows_required_envs:
             baseline_env[env] = os.environ[env]
 
-        baseline_env = merge_env(baseline_env, get_msvc_envs())
     else:
         tmpdir = os.environ.get("TMPDIR", "/tmp")
 
         baseline_env = {"PATH": ""}
 
+    baseline_env = merge_env(baseline_env, toolchain_env())
+
     # Reproducible builds
     baseline_env["SOURCE_DATE_EPOCH"] = "0"
 
@@ -140,3 +147,84 @@ def get_msvc_envs() -> dict[str, str]:
     envs["PATH"] = filter_msvc_path(raw_envs.get("PATH", raw_envs.get("Path", "")))
 
     return envs
+
+
+@functools.cache
+def toolchain_fingerprint() -> str:
+    """
+    Get a fingerprint of the toolchain installed on this machine, which changes whenever the
+    environment probed by probe_toolchain_env might.
+
+    The fingerprint is computed once per process, so toolchains installed while cimple runs are only
+    picked up by later processes.
+    """
+    fingerprint: list[str] = [cimple.system.platform_name()]
+    if cimple.system.is_windows():
+        msvc_path = find_msvc()
+        if msvc_path is not None:
+            fingerprint.append(str(msvc_path))
+            # Every installed toolset has its own directory, named after its version
+            msvc_tools_path = msvc_path / "VC" / "Tools" / "MSVC"
+            if msvc_tools_path.is_dir():
+                fingerprint.extend(sorted(path.name for path in msvc_tools_path.iterdir()))
+    return hashlib.sha256(json.dumps(fingerprint).encode()).hexdigest()
+
+
+def probe_toolchain_env() -> dict[str, str]:
+    """
+    Probe the environment variables needed to use the toolchain installed on this machine.
+
+    Only Windows needs any, to use MSVC. Elsewhere the toolchain is found through the environment
+    cimple already runs with, so the environment is empty.
+
+    This is expensive, use toolchain_env instead.
+    """
+    if cimple.system.is_windows():
+        return get_msvc_envs()
+
+    return {}
+
+
+# Probed toolchain environments by toolchain fingerprint
+_toolchain_envs: dict[str, dict[str, str]] = {}
+_toolchain_envs_lock = threading.Lock()
+
+
+def _load_toolchain_env(env_path: pathlib.Path) -> dict[str, str] | None:
+    try:
+        env = json.loads(env_path.read_text())
+    except FileNotFoundError:
+        return None
+    except ValueError:
+        cimple.logging.warning("Ignoring invalid toolchain environment %s", env_path)
+        return None
+
+    if not isinstance(env, dict) or not all(
+        isinstance(key, str) and isinstance(value, str) for key, value in env.items()
+    ):
+        cimple.logging.warning("Ignoring invalid toolchain environment %s", env_path)
+        return None
+    return env
+
+
+def toolchain_env() -> dict[str, str]:
+    """
+    Get the environment variables needed to use the toolchain installed on this machine.
+
+    The environment is only probed once per toolchain: the result is stored on disk, keyed by the
+    toolchain fingerprint, and reused by later processes.
+    """
+    fingerprint = toolchain_fingerprint()
+    with _toolchain_envs_lock:
+        env = _toolchain_envs.get(fingerprint)
+        if env is None:
+            env_path = cimple.constants.cimple_toolchain_env_dir / f"{fingerprint}.json"
+            env = _load_toolchain_env(env_path)
+            if env is None:
+                env = probe_toolchain_env()
+                cimple.constants.cimple_toolchain_env_dir.mkdir(parents=True, exist_ok=True)
+                tmp_path = env_path.with_name(f"{env_path.name}.{os.getpid()}.tmp")
+                tmp_path.write_text(json.dumps(env))
+                tmp_path.replace(env_path)
+            _toolchain_envs[fingerprint] = env
+    return env.copy()
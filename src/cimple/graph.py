@@ -1,33 +1,67 @@
+import array
+import collections.abc
 import typing
-from typing import TYPE_CHECKING
-
-import networkx as nx
 
 import cimple.models.pkg
 
-if TYPE_CHECKING:
-    import collections.abc
-
-
 T = typing.TypeVar("T")
 
 
 class Graph[T]:
     """
-    A wrapper around networkx DiGraph.
+    A directed graph with interned nodes and array-backed adjacency lists.
 
-    The only difference is that it does not by default remove all edges when a node is removed.
-    Instead, it keeps track of those "broken edges".
+    Nodes are interned to dense integer IDs, and edges are stored as arrays of IDs in both
+    directions. This keeps per-node overhead small and makes reversing the graph a matter of
+    swapping the two directions.
 
-    This incidentally supports better typing for the graph, but it's not the point of this class.
+    Unlike networkx, it does not by default remove all edges when a node is removed. Instead, it
+    keeps track of those "broken edges".
     """
 
     def __init__(self) -> None:
-        self.graph: nx.DiGraph[T] = nx.DiGraph()
+        # Node -> ID
+        self._ids: dict[T, int] = {}
+        # ID -> node, None for IDs that are free to be reused
+        self._nodes: list[T | None] = []
+        self._free_ids: list[int] = []
+
+        # Successor and predecessor IDs, indexed by node ID
+        self._succ: list[array.array[int]] = []
+        self._pred: list[array.array[int]] = []
+
+        # Views share storage with another graph, and must not be modified
+        self._is_view = False
 
         # The broken edges are from value to key
         self.broken_edges: dict[T, set[T]] = {}
 
+    def _intern(self, node: T) -> int:
+        """
+        Get the ID of a node, adding it to the graph if needed.
+        """
+        node_id = self._ids.get(node)
+        if node_id is not None:
+            return node_id
+
+        if self._free_ids:
+            node_id = self._free_ids.pop()
+            self._nodes[node_id] = node
+            self._succ[node_id] = array.array("I")
+            self._pred[node_id] = array.array("I")
+        else:
+            node_id = len(self._nodes)
+            self._nodes.append(node)
+            self._succ.append(array.array("I"))
+            self._pred.append(array.array("I"))
+        self._ids[node] = node_id
+        return node_id
+
+    def _node(self, node_id: int) -> T:
+        node = self._nodes[node_id]
+        assert node is not None, f"Node ID {node_id} is not in the graph"
+        return node
+
     def _remove_from_broken_edges(self, from_node: T, to_node: T) -> bool:
         """
         Remove the edge from broken_edges if it exists.
@@ -45,45 +79,96 @@ class Graph[T]:
         """
         Add a node. Restore any broken edges to this node if they exist.
         """
-        self.graph.add_node(node)
+        assert not self._is_view, "Cannot modify a graph view"
+        self._intern(node)
         if node in self.broken_edges:
             for from_node in self.broken_edges[node]:
-                self.graph.add_edge(from_node, node)
+                self._add_edge(from_node, node)
             del self.broken_edges[node]
 
+    def _add_edge(self, from_node: T, to_node: T) -> None:
+        # Avoid the call to _intern for nodes that already exist, which is the common case
+        from_id = self._ids.get(from_node)
+        if from_id is None:
+            from_id = self._intern(from_node)
+        to_id = self._ids.get(to_node)
+        if to_id is None:
+            to_id = self._intern(to_node)
+        if to_id not in self._succ[from_id]:
+            self._succ[from_id].append(to_id)
+            self._pred[to_id].append(from_id)
+
     def add_edge(self, from_node: T, to_node: T) -> None:
         """
-        Adds the edge to graph.
+        Adds the edge to graph. Nodes that are not yet in the graph are added.
 
         If the edge already exists as a broken edge, remove it from broken_edges.
         """
-        self.graph.add_edge(from_node, to_node)
-        self._remove_from_broken_edges(from_node, to_node)
+        assert not self._is_view, "Cannot modify a graph view"
+        self._add_edge(from_node, to_node)
+        if self.broken_edges:
+            self._remove_from_broken_edges(from_node, to_node)
+
+    def add_edges_from(self, from_node: T, to_nodes: typing.Iterable[T]) -> None:
+        """
+        Add edges from a node to each of the given nodes. Equivalent to calling add_edge for each
+        of them, but cheaper when loading large graphs.
+        """
+        assert not self._is_view, "Cannot modify a graph view"
+        from_id = self._ids.get(from_node)
+        if from_id is None:
+            from_id = self._intern(from_node)
+        succ = self._succ[from_id]
+        for to_node in to_nodes:
+            to_id = self._ids.get(to_node)
+            if to_id is None:
+                to_id = self._intern(to_node)
+            if to_id not in succ:
+                succ.append(to_id)
+                self._pred[to_id].append(from_id)
+            if self.broken_edges:
+                self._remove_from_broken_edges(from_node, to_node)
 
     def remove_edge(self, from_node: T, to_node: T) -> None:
         """
         Remove an edge from the graph. If it's a broken edge, remove from broken_edges instead.
         """
-        if not self._remove_from_broken_edges(from_node, to_node):
-            self.graph.remove_edge(from_node, to_node)
+        assert not self._is_view, "Cannot modify a graph view"
+        if self._remove_from_broken_edges(from_node, to_node):
+            return
+
+        if not self.has_edge(from_node, to_node):
+            raise KeyError(f"Edge {from_node} -> {to_node} is not in the graph")
+        from_id = self._ids[from_node]
+        to_id = self._ids[to_node]
+        self._succ[from_id].remove(to_id)
+        self._pred[to_id].remove(from_id)
 
     def remove_node(self, node: T) -> None:
         """
         Remove a node from the graph, and mark all its edges as broken edges.
         """
-        if node not in self.graph:
+        assert not self._is_view, "Cannot modify a graph view"
+        node_id = self._ids.get(node)
+        if node_id is None:
             return
 
         # Mark all edges to and from this node as broken edges
-        for neighbor in self.graph.successors(node):
-            self.broken_edges.setdefault(neighbor, set()).add(node)
-        for neighbor in self.graph.predecessors(node):
-            self.broken_edges.setdefault(node, set()).add(neighbor)
-
-        self.graph.remove_node(node)
+        for neighbor_id in self._succ[node_id]:
+            self.broken_edges.setdefault(self._node(neighbor_id), set()).add(node)
+            self._pred[neighbor_id].remove(node_id)
+        for neighbor_id in self._pred[node_id]:
+            self.broken_edges.setdefault(node, set()).add(self._node(neighbor_id))
+            self._succ[neighbor_id].remove(node_id)
+
+        del self._ids[node]
+        self._nodes[node_id] = None
+        self._succ[node_id] = array.array("I")
+        self._pred[node_id] = array.array("I")
+        self._free_ids.append(node_id)
 
     def has_node(self, node: T) -> bool:
-        return self.graph.has_node(node)
+        return node in self._ids
 
     def is_broken(self) -> bool:
         """
@@ -94,21 +179,49 @@ class Graph[T]:
     def generic_bfs_edges(
         self, source: T, neighbors: typing.Callable[[T], typing.Iterable[T]]
     ) -> typing.Iterable[tuple[T, T]]:
+        """
+        Iterate over edges in a breadth-first search from source, using a custom neighbor function.
+        """
         assert not self.is_broken(), "Cannot traverse a graph with broken edges"
-        # pyrefly: ignore[missing-attribute]
-        return nx.generic_bfs_edges(self.graph, source=source, neighbors=neighbors)
+
+        def bfs_edges() -> collections.abc.Generator[tuple[T, T]]:
+            visited = {source}
+            queue = collections.deque([source])
+            while queue:
+                parent = queue.popleft()
+                for child in neighbors(parent):
+                    if child not in visited:
+                        visited.add(child)
+                        queue.append(child)
+                        yield parent, child
+
+        return bfs_edges()
 
     def neighbors(self, node: T) -> typing.Iterator[T]:
         assert not self.is_broken(), "Cannot traverse a graph with broken edges"
-        return self.graph.neighbors(node)
+        return (self._node(neighbor_id) for neighbor_id in self._succ[self._ids[node]])
 
     def reverse(self, copy: bool = True) -> Graph[T]:
         """
         Return the reverse of the graph.
+
+        Without copy, the result is a view sharing storage with this graph, and cannot be modified.
         """
         assert not self.is_broken(), "Cannot reverse a graph with broken edges"
-        reversed_graph = Graph()
-        reversed_graph.graph = self.graph.reverse(copy=copy)
+        reversed_graph = Graph[T]()
+        if copy:
+            reversed_graph._ids = self._ids.copy()
+            reversed_graph._nodes = self._nodes.copy()
+            reversed_graph._free_ids = self._free_ids.copy()
+            reversed_graph._succ = [array.array("I", adjacency) for adjacency in self._pred]
+            reversed_graph._pred = [array.array("I", adjacency) for adjacency in self._succ]
+        else:
+            reversed_graph._ids = self._ids
+            reversed_graph._nodes = self._nodes
+            reversed_graph._free_ids = self._free_ids
+            reversed_graph._succ = self._pred
+            reversed_graph._pred = self._succ
+            reversed_graph._is_view = True
         return reversed_graph
 
     def descendants(self, node: T) -> set[T]:
@@ -116,43 +229,234 @@ class Graph[T]:
         Return the descendants of a node in the graph.
         """
         assert not self.is_broken(), "Cannot get descendants of a graph with broken edges"
-        return nx.descendants(self.graph, node)  # pyrefly: ignore[missing-attribute]
+        source_id = self._ids[node]
+        visited = {source_id}
+        stack = [source_id]
+        while stack:
+            for child_id in self._succ[stack.pop()]:
+                if child_id not in visited:
+                    visited.add(child_id)
+                    stack.append(child_id)
+        visited.remove(source_id)
+        return {self._node(node_id) for node_id in visited}
+
+    def ancestors_of_all(self, nodes: typing.Iterable[T]) -> set[T]:
+        """
+        Return the union of the ancestors of the given nodes, in a single traversal.
 
-    def subgraph(self, nodes: typing.Iterable[T]) -> Graph[T]:
+        A given node is only included if it is an ancestor of one of the given nodes.
+        """
+        assert not self.is_broken(), "Cannot get ancestors of a graph with broken edges"
+        visited: set[int] = set()
+        stack = [self._ids[node] for node in nodes]
+        while stack:
+            for parent_id in self._pred[stack.pop()]:
+                if parent_id not in visited:
+                    visited.add(parent_id)
+                    stack.append(parent_id)
+        return {self._node(node_id) for node_id in visited}
+
+    def subgraph(self, nodes: typing.Iterable[T], *, reverse: bool = False) -> Graph[T]:
         """
         Return the subgraph induced by the given nodes.
+
+        With reverse, the edges of the subgraph are reversed, which is cheaper than reversing the
+        whole graph first.
         """
         assert not self.is_broken(), "Cannot get subgraph of a graph with broken edges"
-        subgraph = Graph()
-        subgraph.graph = self.graph.subgraph(nodes).copy()
+        subgraph = Graph[T]()
+        old_ids = [self._ids[node] for node in nodes if node in self._ids]
+        for old_id in old_ids:
+            subgraph._intern(self._node(old_id))
+        old_succ = self._pred if reverse else self._succ
+        for old_id in old_ids:
+            new_succ = subgraph._succ[subgraph._ids[self._node(old_id)]]
+            for old_child_id in old_succ[old_id]:
+                new_child_id = subgraph._ids.get(self._node(old_child_id))
+                if new_child_id is not None:
+                    new_succ.append(new_child_id)
+                    subgraph._pred[new_child_id].append(subgraph._ids[self._node(old_id)])
         return subgraph
 
     def in_degrees(self) -> typing.Iterable[tuple[T, int]]:
         assert not self.is_broken(), "Cannot get in-degrees of a graph with broken edges"
-        return self.graph.in_degree()
+        return ((node, len(self._pred[node_id])) for node, node_id in self._ids.items())
 
     def in_degree(self, node: T) -> int:
         assert not self.is_broken(), "Cannot get in-degree of a graph with broken edges"
-        return self.graph.in_degree(node)
+        return len(self._pred[self._ids[node]])
 
     def number_of_nodes(self) -> int:
-        return self.graph.number_of_nodes()
+        return len(self._ids)
 
     def has_edge(self, from_node: T, to_node: T) -> bool:
         """
         Check if the graph has the edge from from_node to to_node.
         Broken edges are not considered as edges in the graph.
         """
-        return self.graph.has_edge(from_node, to_node)
+        from_id = self._ids.get(from_node)
+        to_id = self._ids.get(to_node)
+        if from_id is None or to_id is None:
+            return False
+        return to_id in self._succ[from_id]
 
     def edges(self) -> typing.Iterable[tuple[T, T]]:
         """
         Return the edges in the graph. Broken edges are not included.
         """
-        return self.graph.edges()
+        return {
+            (node, self._node(child_id))
+            for node, node_id in self._ids.items()
+            for child_id in self._succ[node_id]
+        }
 
     def nodes(self) -> typing.Iterable[T]:
-        return self.graph.nodes()
+        return self._ids.keys()
+
+
+def _strongly_connected_components(
+    succ: list[array.array[int]], node_ids: typing.Iterable[int]
+) -> list[list[int]]:
+    """
+    Find the strongly connected components of a graph given as adjacency lists, using an iterative
+    version of Tarjan's algorithm.
+
+    Components are returned in reverse topological order: a component comes after all components
+    reachable from it.
+    """
+    order: dict[int, int] = {}
+    lowlink: dict[int, int] = {}
+    stack: list[int] = []
+    on_stack: set[int] = set()
+    components: list[list[int]] = []
+
+    for root in node_ids:
+        if root in order:
+            continue
+
+        order[root] = lowlink[root] = len(order)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, 0)]
+        while work:
+            node, child_index = work[-1]
+            if child_index < len(succ[node]):
+                work[-1] = (node, child_index + 1)
+                child = succ[node][child_index]
+                if child not in order:
+                    order[child] = lowlink[child] = len(order)
+                    stack.append(child)
+                    on_stack.add(child)
+                    work.append((child, 0))
+                elif child in on_stack:
+                    lowlink[node] = min(lowlink[node], order[child])
+                continue
+
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                lowlink[parent] = min(lowlink[parent], lowlink[node])
+
+            if lowlink[node] == order[node]:
+                component: list[int] = []
+                while True:
+                    member = stack.pop()
+                    on_stack.remove(member)
+                    component.append(member)
+                    if member == node:
+                        break
+                components.append(component)
+
+    return components
+
+
+def _transitive_closures(succ: list[array.array[int]], node_ids: list[int]) -> list[int]:
+    """
+    Compute the transitive closure of every node as a bitset, indexed by node ID.
+
+    A node is only part of its own closure if it is on a cycle.
+    """
+    closures = [0] * len(succ)
+    for component in _strongly_connected_components(succ, node_ids):
+        # Successors within the same component are reachable from every member. Their own
+        # closures are not known yet, but they are covered by iterating over all members.
+        closure = 0
+        for member in component:
+            for child in succ[member]:
+                closure |= (1 << child) | closures[child]
+        for member in component:
+            closures[member] = closure
+    return closures
+
+
+class ReachabilityIndex[T]:
+    """
+    A precomputed index of the transitive closure of a graph, in both directions.
+
+    Each node's descendants and ancestors are stored as bitsets over the node IDs of the graph,
+    so closure and set-union queries are bitwise operations. The index is a snapshot of the graph
+    at construction time, and must be rebuilt after the graph changes.
+    """
+
+    def __init__(self, graph: Graph[T]) -> None:
+        assert not graph.is_broken(), "Cannot index a graph with broken edges"
+        self._ids = graph._ids.copy()
+        self._nodes = graph._nodes.copy()
+
+        node_ids = list(self._ids.values())
+        self._descendants = _transitive_closures(graph._succ, node_ids)
+        self._ancestors = _transitive_closures(graph._pred, node_ids)
+
+    def _decode(self, bits: int) -> set[T]:
+        # Least significant bit first, so that string indices are node IDs
+        digits = bin(bits)[:1:-1]
+        nodes: set[T] = set()
+        node_id = digits.find("1")
+        while node_id != -1:
+            node = self._nodes[node_id]
+            assert node is not None, f"Node ID {node_id} is not in the graph"
+            nodes.add(node)
+            node_id = digits.find("1", node_id + 1)
+        return nodes
+
+    def _union(self, closures: list[int], nodes: typing.Iterable[T]) -> int:
+        bits = 0
+        for node in nodes:
+            node_id = self._ids[node]
+            bits |= closures[node_id] & ~(1 << node_id)
+        return bits
+
+    def descendants(self, node: T) -> set[T]:
+        """
+        Return all nodes reachable from a node.
+        """
+        return self._decode(self._union(self._descendants, [node]))
+
+    def ancestors(self, node: T) -> set[T]:
+        """
+        Return all nodes that can reach a node.
+        """
+        return self._decode(self._union(self._ancestors, [node]))
+
+    def descendants_of_all(self, nodes: typing.Iterable[T]) -> set[T]:
+        """
+        Return the union of the descendants of the given nodes.
+        """
+        return self._decode(self._union(self._descendants, nodes))
+
+    def ancestors_of_all(self, nodes: typing.Iterable[T]) -> set[T]:
+        """
+        Return the union of the ancestors of the given nodes.
+        """
+        return self._decode(self._union(self._ancestors, nodes))
+
+    def reaches(self, from_node: T, to_node: T) -> bool:
+        """
+        Check if to_node is reachable from from_node.
+        """
+        if from_node == to_node:
+            return False
+        return bool(self._descendants[self._ids[from_node]] >> self._ids[to_node] & 1)
 
 
 def binary_neighbors(
@@ -8,6 +8,7 @@ import requests
 
 import cimple.constants
 import cimple.logging
+import cimple.util
 from cimple.images import ops
 
 # Re-exports
@@ -29,20 +30,28 @@ def get_image(image_name: str):
     url = f"https://cimple-pi.lunacd.com/image/{image_file_name}"
     r = requests.get(url, allow_redirects=True)
     r.raise_for_status()
-    with target_path.open("wb") as f:
+
+    # Write to a temporary file first so that an interrupted download is never mistaken for a
+    # complete image
+    tmp_path = target_path.with_name(f"{image_file_name}.tmp")
+    with tmp_path.open("wb") as f:
         f.write(r.content)
+    tmp_path.replace(target_path)
 
 
 def prepare_image(platform: str, arch: str, variant: str) -> pathlib.Path:
+    """
+    Extract an image and return its path.
+
+    Extracted images are shared between concurrent builds, and are therefore read-only.
+    """
     if not cimple.constants.cimple_image_dir.is_dir():
         cimple.constants.cimple_image_dir.mkdir(parents=True)
 
     image_name = f"{platform}-{variant}-{arch}"
     target_path = cimple.constants.cimple_extracted_image_dir / image_name
 
-    if target_path.is_dir():
-        cimple.logging.info("Using existing %s image", image_name)
-    else:
+    def extract_image(extract_path: pathlib.Path) -> None:
         cimple.logging.info("Downloading %s image", image_name)
         get_image(image_name)
 
@@ -51,7 +60,12 @@ def prepare_image(platform: str, arch: str, variant: str) -> pathlib.Path:
             str(cimple.constants.cimple_image_dir / f"{image_name}.tar.gz"),
             "r:gz",
         ) as tar:
-            tar.extractall(path=target_path, filter=writable_extract_filter)
+            tar.extractall(path=extract_path, filter=writable_extract_filter)
+
+        cimple.util.make_read_only(extract_path)
+
+    if not cimple.util.populate_directory_atomically(target_path, extract_image):
+        cimple.logging.info("Using existing %s image", image_name)
 
     return target_path
 
@@ -60,4 +74,5 @@ def clean_images():
     if cimple.constants.cimple_image_dir.is_dir():
         shutil.rmtree(cimple.constants.cimple_image_dir)
     if cimple.constants.cimple_extracted_image_dir.is_dir():
-        shutil.rmtree(cimple.constants.cimple_extracted_image_dir)
+        # Extracted images are read-only
+        cimple.util.remove_tree(cimple.constants.cimple_extracted_image_dir)
@@ -1,10 +1,14 @@
 import typer
 
+import cimple.cmd.index
 import cimple.cmd.snapshot
 import cimple.cmd.stream
 import cimple.images as images
+import cimple.source_cache
+import cimple.workspace
 
 app = typer.Typer()
+app.add_typer(cimple.cmd.index.index_app, name="index")
 app.add_typer(cimple.cmd.snapshot.snapshot_app, name="snapshot")
 app.add_typer(cimple.cmd.stream.stream_app, name="stream")
 
@@ -14,11 +18,17 @@ def clean(target: str):
     # TODO: support all of the added directories
     if target == "all":
         images.clean_images()
+        cimple.workspace.clean_workspaces()
+        cimple.source_cache.clean_source_cache()
 
     if target == "images":
         images.clean_images()
+    elif target == "workspaces":
+        cimple.workspace.clean_workspaces()
+    elif target == "sources":
+        cimple.source_cache.clean_source_cache()
     elif target != "all":
-        print(f"Unknown target: {target}. Supported targets: images.")
+        print(f"Unknown target: {target}. Supported targets: images, workspaces, sources.")
 
 
 def main():
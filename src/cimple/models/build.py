@@ -0,0 +1,55 @@
+import typing
+
+import pydantic
+
+
+class ResourceUsage(pydantic.BaseModel):
+    """
+    Resources used by a command and the children it waited for.
+
+    Fields other than the wall time are None on platforms where they cannot be measured.
+    """
+
+    wall_seconds: float
+    user_seconds: float | None = None
+    system_seconds: float | None = None
+    max_rss_bytes: int | None = None
+    # Bytes read from and written to the file system by block I/O, not counting the page cache
+    read_bytes: int | None = None
+    written_bytes: int | None = None
+
+
+class RuleResourceUsage(pydantic.BaseModel):
+    rule: list[str]
+    usage: ResourceUsage
+
+
+class PkgBuildUsage(pydantic.BaseModel):
+    """
+    Resources used by the latest build of a source package, recorded on this machine.
+    """
+
+    version: typing.Literal[0]
+    name: str
+    pkg_version: str
+    total: ResourceUsage
+    rules: list[RuleResourceUsage]
+
+
+def sum_resource_usage(usages: list[ResourceUsage]) -> ResourceUsage:
+    """
+    Add up the resources used by commands run one after the other.
+
+    Times and I/O are summed, while the maximum RSS is the largest of all commands. A resource is
+    only known in total if it is known for every command.
+    """
+    totals: dict[str, typing.Any] = {}
+    for field in ResourceUsage.model_fields:
+        values = [getattr(usage, field) for usage in usages]
+        if any(value is None for value in values):
+            totals[field] = None
+        elif field == "max_rss_bytes":
+            totals[field] = max(values, default=0)
+        else:
+            totals[field] = sum(values)
+    return ResourceUsage(**totals)
@@ -1,35 +1,110 @@
-import dataclasses
 import typing
 
 import pydantic
+import pydantic_core
 
 
-@dataclasses.dataclass
-class SrcPkgId:
+class _InternedPkgId:
+    """
+    Base class for package IDs.
+
+    IDs are immutable and interned: there is exactly one object per (type, name). Equality and
+    hashing are therefore by identity, which keeps dict and set lookups in C.
+
+    Interned IDs are never freed, so the intern table grows with every distinct package name seen
+    by the process. That is bounded by the size of the package index, and an ID is only a name.
+    """
+
+    __slots__ = ("name",)
+
+    # Type of the ID for checks on the class, subclasses also expose it with a literal type as the
+    # `type` property
+    _type: typing.ClassVar[str]
+    _instances: typing.ClassVar[dict[str, typing.Any]]
+
     name: str
-    type: typing.Literal["src"]
 
-    def __init__(self, name: str) -> None:
-        self.name = name
-        self.type = "src"
+    def __init_subclass__(cls) -> None:
+        super().__init_subclass__()
+        cls._instances = {}
+
+    def __new__(cls, name: str) -> typing.Self:
+        pkg_id = cls._instances.get(name)
+        if pkg_id is not None:
+            return pkg_id
+
+        pkg_id = super().__new__(cls)
+        object.__setattr__(pkg_id, "name", name)
+        # setdefault keeps a single canonical object if another thread interned the same name
+        return cls._instances.setdefault(name, pkg_id)
 
     @typing.override
-    def __hash__(self):
-        return hash(f"src:{self.name}")
+    def __setattr__(self, name: str, value: typing.Any) -> None:
+        raise AttributeError(f"{type(self).__name__} is immutable")
 
+    @typing.override
+    def __delattr__(self, name: str) -> None:
+        raise AttributeError(f"{type(self).__name__} is immutable")
 
-@dataclasses.dataclass
-class BinPkgId:
-    name: str
-    type: typing.Literal["bin"]
+    @property
+    def type(self) -> str:
+        return self._type
+
+    @typing.override
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(name={self.name!r}, type={self.type!r})"
+
+    @typing.override
+    def __reduce__(self) -> tuple[type[typing.Self], tuple[str]]:
+        # Make sure copies and unpickled objects are interned as well
+        return (type(self), (self.name,))
 
-    def __init__(self, name: str) -> None:
-        self.name = name
-        self.type = "bin"
+    def __copy__(self) -> typing.Self:
+        return self
 
+    def __deepcopy__(self, memo: dict[int, typing.Any]) -> typing.Self:
+        return self
+
+    @classmethod
+    def _validate(cls, value: typing.Any) -> typing.Self:
+        if isinstance(value, cls):
+            return value
+        if isinstance(value, dict) and value.get("type", cls._type) == cls._type:
+            return cls(value["name"])
+        raise ValueError(f"Cannot convert {value!r} to {cls.__name__}")
+
+    @classmethod
+    def __get_pydantic_core_schema__(
+        cls, source_type: typing.Any, handler: pydantic.GetCoreSchemaHandler
+    ) -> pydantic_core.CoreSchema:
+        return pydantic_core.core_schema.no_info_plain_validator_function(
+            cls._validate,
+            serialization=pydantic_core.core_schema.plain_serializer_function_ser_schema(
+                lambda pkg_id: {"name": pkg_id.name, "type": pkg_id.type}
+            ),
+        )
+
+
+class SrcPkgId(_InternedPkgId):
+    __slots__ = ()
+
+    _type = "src"
+
+    @property
+    @typing.override
+    def type(self) -> typing.Literal["src"]:
+        return "src"
+
+
+class BinPkgId(_InternedPkgId):
+    __slots__ = ()
+
+    _type = "bin"
+
+    @property
     @typing.override
-    def __hash__(self):
-        return hash(f"bin:{self.name}")
+    def type(self) -> typing.Literal["bin"]:
+        return "bin"
 
 
 class VersionedSrcPkg(pydantic.BaseModel):
@@ -49,23 +124,14 @@ PkgId = SrcPkgId | BinPkgId
 
 
 def bin_pkg_id_list_validator(input: list[str]) -> list[typing.Any]:
-    return [
-        {
-            "name": name,
-            "type": "bin",
-        }
-        for name in input
-    ]
+    # Look up already interned IDs directly, this is hot when loading snapshots
+    instances = BinPkgId._instances
+    return [instances.get(name) or BinPkgId(name) for name in input]
 
 
 def src_pkg_id_list_validator(input: list[str]) -> list[typing.Any]:
-    return [
-        {
-            "name": name,
-            "type": "src",
-        }
-        for name in input
-    ]
+    instances = SrcPkgId._instances
+    return [instances.get(name) or SrcPkgId(name) for name in input]
 
 
 def bootstrap_src_id(pkg_id: SrcPkgId) -> SrcPkgId:
@@ -1,11 +1,13 @@
 import os
 import pathlib  # noqa: TC003
+import threading
 import tomllib
 import typing
 
 import pydantic
 
 import cimple.env
+import cimple.logging
 import cimple.models.pkg
 import cimple.str_interpolation
 
@@ -130,15 +132,116 @@ class PkgConfig(pydantic.BaseModel):
         return self.pkg.build_depends
 
 
+class PkgCatalogEntry(pydantic.BaseModel):
+    """
+    A package config compiled into a package index catalog.
+    """
+
+    name: str
+    version: str
+    # Modification time and size of pkg.toml when it was compiled
+    mtime_ns: int
+    size: int
+    # Hash of the content of pkg.toml
+    sha256: str
+    config: PkgConfig
+
+
+class PkgCatalog(pydantic.BaseModel):
+    """
+    All package configs of a package index, compiled into a single file, see cimple.pkg.catalog.
+    """
+
+    version: typing.Literal[0]
+    pkgs: list[PkgCatalogEntry]
+
+
+def pkg_catalog_path(pi_path: pathlib.Path) -> pathlib.Path:
+    return pi_path / "catalog.json"
+
+
+def pkg_config_path(pi_path: pathlib.Path, package_name: str, package_version: str) -> pathlib.Path:
+    return pi_path / "pkg" / package_name / package_version / "pkg.toml"
+
+
+# Loaded package configs by (pi_path, name, version), with the modification time and size of the
+# pkg.toml they were loaded from
+_pkg_configs: dict[tuple[pathlib.Path, str, str], tuple[int, int, PkgConfig]] = {}
+# Loaded catalogs by pi_path, with the modification time and size of the catalog file
+_pkg_catalogs: dict[pathlib.Path, tuple[int, int, dict[tuple[str, str], PkgCatalogEntry]]] = {}
+_pkg_configs_lock = threading.Lock()
+
+
+def _pkg_catalog_entry(
+    pi_path: pathlib.Path, package_name: str, package_version: str
+) -> PkgCatalogEntry | None:
+    """
+    Look up a package in the catalog of a package index, if it has been compiled.
+
+    The catalog is loaded again when it changes. An invalid catalog is ignored, as if it had not
+    been compiled.
+    """
+    catalog_path = pkg_catalog_path(pi_path)
+    try:
+        stat = catalog_path.stat()
+    except FileNotFoundError:
+        return None
+
+    with _pkg_configs_lock:
+        cached = _pkg_catalogs.get(pi_path)
+    if cached is None or cached[:2] != (stat.st_mtime_ns, stat.st_size):
+        try:
+            catalog = PkgCatalog.model_validate_json(catalog_path.read_bytes())
+        except ValueError:
+            cimple.logging.warning("Ignoring invalid package catalog %s", catalog_path)
+            entries = {}
+        else:
+            entries = {(entry.name, entry.version): entry for entry in catalog.pkgs}
+        cached = (stat.st_mtime_ns, stat.st_size, entries)
+        with _pkg_configs_lock:
+            _pkg_catalogs[pi_path] = cached
+
+    return cached[2].get((package_name, package_version))
+
+
 def load_pkg_config(
     pi_path: pathlib.Path, package: cimple.models.pkg.SrcPkgId, package_version: str
-):
+) -> PkgConfig:
+    """
+    Load the config of a package from a package index.
+
+    The returned config is shared by all callers and must not be modified.
+
+    If the package index has a compiled catalog, and pkg.toml has not changed since it was compiled,
+    the config is taken from the catalog instead of parsing pkg.toml. Otherwise pkg.toml is parsed,
+    and cached for the whole process until it changes again.
+    """
     if cimple.models.pkg.is_bootstrap_pkg(package):
         package = cimple.models.pkg.SrcPkgId(package.name.removeprefix("bootstrap:"))
-    config_path = pi_path / "pkg" / package.name / package_version / "pkg.toml"
+
+    config_path = pkg_config_path(pi_path, package.name, package_version)
+    stat = config_path.stat()
+    catalog_entry = _pkg_catalog_entry(pi_path, package.name, package_version)
+    if catalog_entry is not None and (catalog_entry.mtime_ns, catalog_entry.size) == (
+        stat.st_mtime_ns,
+        stat.st_size,
+    ):
+        return catalog_entry.config
+
+    cache_key = (pi_path, package.name, package_version)
+    with _pkg_configs_lock:
+        cached = _pkg_configs.get(cache_key)
+    if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+        return cached[2]
+
+    # Parse outside of the lock, so that concurrent builds do not wait on unrelated configs
     with config_path.open("rb") as f:
         config_dict = tomllib.load(f)
-        return PkgConfig.model_validate(config_dict)
+    config = PkgConfig.model_validate(config_dict)
+
+    with _pkg_configs_lock:
+        _pkg_configs[cache_key] = (stat.st_mtime_ns, stat.st_size, config)
+    return config
 
 
 def normalize_rules(
@@ -150,46 +253,40 @@ def normalize_rules(
     def interpolate_variables(input_str: str):
         return cimple.str_interpolation.interpolate(input_str, builtin_variables)
 
+    baseline_env: dict[str, str] = (
+        {"PATH": os.pathsep.join([path.as_posix() for path in bin_paths])}
+        if len(bin_paths) > 0
+        else {}
+    )
+
     # TODO: support overriding rules per-platform
     normalized_rules: list[PkgConfigNormalizedRule] = []
     for rule in rules.default:
-        baseline_env: dict[str, str] = (
-            {"PATH": os.pathsep.join([path.as_posix() for path in bin_paths])}
-            if len(bin_paths) > 0
-            else {}
-        )
-
         if isinstance(rule, str):
-            normalized_rule = PkgConfigNormalizedRule(
-                cwd=default_cwd,
-                env=baseline_env,
-                rule=[
-                    cimple.str_interpolation.interpolate(segment, context=builtin_variables)
-                    for segment in rule.split(" ")
-                ],
+            normalized_rules.append(
+                PkgConfigNormalizedRule(
+                    cwd=default_cwd,
+                    env=baseline_env.copy(),
+                    rule=[interpolate_variables(segment) for segment in rule.split(" ")],
+                )
             )
-            normalized_rules.append(normalized_rule)
             continue
 
         final_env = cimple.env.merge_env(
             baseline_env,
-            rule.env if rule.env else {},
+            {
+                interpolate_variables(k): interpolate_variables(v)
+                for k, v in (rule.env or {}).items()
+            },
         )
-
-        normalized_rule = PkgConfigNormalizedRule(
-            # TODO: Check to make sure cwd is valid and relative
-            cwd=default_cwd / interpolate_variables(rule.cwd) if rule.cwd else default_cwd,
-            env=final_env,
-            rule=rule.rule if isinstance(rule.rule, list) else rule.rule.split(" "),
+        array_rule = rule.rule.split(" ") if isinstance(rule.rule, str) else rule.rule
+        normalized_rules.append(
+            PkgConfigNormalizedRule(
+                # TODO: Check to make sure cwd is valid and relative
+                cwd=default_cwd / interpolate_variables(rule.cwd) if rule.cwd else default_cwd,
+                env=final_env,
+                rule=[interpolate_variables(segment) for segment in array_rule],
+            )
         )
 
-        # NOTE: at this point, cwd is interpolated, but env and rules are not.
-        normalized_rule.env = {
-            interpolate_variables(k): interpolate_variables(v)
-            for k, v in normalized_rule.env.items()
-        }
-        array_rules = rule.rule.split(" ") if isinstance(rule.rule, str) else rule.rule
-        normalized_rule.rule = [interpolate_variables(segment) for segment in array_rules]
-        normalized_rules.append(normalized_rule)
-
     return PkgConfigNormalizedRulesList(root=normalized_rules)
@@ -106,3 +106,53 @@ class SnapshotModel(pydantic.BaseModel):
     ancestor: str | None
     changes: SnapshotChanges
     bootstrap_changes: SnapshotChanges
+
+
+class SnapshotPkgRef(pydantic.BaseModel):
+    name: str
+    pkg_type: typing.Literal["src", "bin"]
+
+
+class SnapshotDeltaModel(pydantic.BaseModel):
+    """
+    A snapshot stored as the difference from its ancestor snapshot.
+    """
+
+    version: typing.Literal[0]
+    name: str
+    ancestor: str
+    # Number of deltas between this snapshot and the nearest full snapshot, including this one
+    depth: int
+    changes: SnapshotChanges
+    bootstrap_changes: SnapshotChanges
+    # Packages that are not in this snapshot any more
+    removed_pkgs: list[SnapshotPkgRef]
+    removed_bootstrap_pkgs: list[SnapshotPkgRef]
+    # Packages that are new, or differ from the ancestor snapshot
+    upserted_pkgs: list[SnapshotPkg]
+    upserted_bootstrap_pkgs: list[SnapshotPkg]
+
+
+class SnapshotPkgDiff(pydantic.BaseModel):
+    """
+    A difference in a package between two snapshots.
+    """
+
+    name: str
+    pkg_type: typing.Literal["src", "bin"]
+    bootstrap: bool
+    change: typing.Literal[
+        "added", "removed", "version_changed", "sha256_changed", "depends_changed"
+    ]
+    # Version of source packages, or sha256 of binary packages, before and after the change
+    from_value: str | None
+    to_value: str | None
+
+
+class BuildDurationsModel(pydantic.BaseModel):
+    """
+    Wall time of the latest build of each source package, in seconds, recorded on this machine.
+    """
+
+    version: typing.Literal[0]
+    durations: dict[str, float]
@@ -0,0 +1,96 @@
+import tomllib
+import typing
+
+import cimple.hash
+import cimple.logging
+import cimple.models.pkg_config
+
+if typing.TYPE_CHECKING:
+    import pathlib
+
+
+class PkgCatalogCompileResult(typing.NamedTuple):
+    # Packages whose config was parsed and validated again
+    compiled: int
+    # Packages whose config was kept from the previous catalog
+    reused: int
+    # Packages that were in the previous catalog but do not exist anymore
+    removed: int
+
+
+def _load_previous_catalog(
+    catalog_path: pathlib.Path,
+) -> dict[tuple[str, str], cimple.models.pkg_config.PkgCatalogEntry]:
+    if not catalog_path.exists():
+        return {}
+
+    try:
+        catalog = cimple.models.pkg_config.PkgCatalog.model_validate_json(catalog_path.read_bytes())
+    except ValueError:
+        cimple.logging.warning("Ignoring invalid package catalog %s", catalog_path)
+        return {}
+    return {(entry.name, entry.version): entry for entry in catalog.pkgs}
+
+
+def compile_pkg_catalog(pi_path: pathlib.Path) -> PkgCatalogCompileResult:
+    """
+    Compile the configs of all packages in a package index into its catalog.
+
+    Only configs whose pkg.toml changed since the previous catalog are parsed and validated again.
+    A pkg.toml whose modification time changed but whose content did not, such as after a fresh
+    checkout, is not parsed again either.
+    """
+    catalog_path = cimple.models.pkg_config.pkg_catalog_path(pi_path)
+    previous_entries = _load_previous_catalog(catalog_path)
+
+    entries: list[cimple.models.pkg_config.PkgCatalogEntry] = []
+    compiled = reused = 0
+    for config_path in sorted((pi_path / "pkg").glob("*/*/pkg.toml")):
+        package_name = config_path.parent.parent.name
+        package_version = config_path.parent.name
+        stat = config_path.stat()
+
+        previous_entry = previous_entries.get((package_name, package_version))
+        if previous_entry is not None and (previous_entry.mtime_ns, previous_entry.size) == (
+            stat.st_mtime_ns,
+            stat.st_size,
+        ):
+            entries.append(previous_entry)
+            reused += 1
+            continue
+
+        config_bytes = config_path.read_bytes()
+        config_sha256 = cimple.hash.hash_bytes(config_bytes, "sha256")
+        if previous_entry is not None and previous_entry.sha256 == config_sha256:
+            config = previous_entry.config
+            reused += 1
+        else:
+            config = cimple.models.pkg_config.PkgConfig.model_validate(
+                tomllib.loads(config_bytes.decode())
+            )
+            if (config.name, config.version) != (package_name, package_version):
+                raise RuntimeError(
+                    f"{config_path} is for package {config.name}={config.version}, which does not "
+                    "match its location in the package index."
+                )
+            compiled += 1
+
+        entries.append(
+            cimple.models.pkg_config.PkgCatalogEntry(
+                name=package_name,
+                version=package_version,
+                mtime_ns=stat.st_mtime_ns,
+                size=stat.st_size,
+                sha256=config_sha256,
+                config=config,
+            )
+        )
+
+    removed = len(previous_entries.keys() - {(entry.name, entry.version) for entry in entries})
+
+    catalog = cimple.models.pkg_config.PkgCatalog(version=0, pkgs=entries)
+    tmp_path = catalog_path.with_name(f"{catalog_path.name}.tmp")
+    tmp_path.write_bytes(catalog.model_dump_json().encode())
+    tmp_path.replace(catalog_path)
+
+    return PkgCatalogCompileResult(compiled=compiled, reused=reused, removed=removed)
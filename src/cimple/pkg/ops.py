@@ -10,12 +10,17 @@ import cimple.hash
 import cimple.logging
 import cimple.models.pkg
 import cimple.pkg.core
+import cimple.pkg.rules
 import cimple.process
 import cimple.snapshot.core
-import cimple.str_interpolation
+import cimple.snapshot.plan
+import cimple.source_cache
 import cimple.tarfile
+import cimple.trace
 import cimple.util
+import cimple.workspace
 from cimple import images
+from cimple.models import build as build_models
 from cimple.models import pkg as pkg_models
 from cimple.models import pkg_config as pkg_config_models
 from cimple.models import snapshot as snapshot_models
@@ -28,6 +33,8 @@ if typing.TYPE_CHECKING:
 class PackageBuildOptions:
     parallel: int = 1
     extra_paths: list[pathlib.Path] = dataclasses.field(default_factory=list)
+    # Print build output as it is produced, instead of only writing it to the build log
+    live_output: bool = False
 
 
 class PkgOps:
@@ -66,10 +73,23 @@ class PkgOps:
             assert prev_snapshot_name is not None, (
                 "Cannot install package from previous snapshot without an ancestor snapshot"
             )
-            prev_snapshot = cimple.snapshot.core.load_snapshot(prev_snapshot_name)
-            PkgOps.install_pkg(
-                target_path, cimple.models.pkg.BinPkgId(pkg_id.name[len("prev:") :]), prev_snapshot
-            )
+            prev_pkg_id = cimple.models.pkg.BinPkgId(pkg_id.name[len("prev:") :])
+
+            # Only a single package is needed, look it up without loading the whole snapshot
+            binary_snapshot = cimple.snapshot.core.load_binary_snapshot(prev_snapshot_name)
+            if binary_snapshot is not None:
+                with binary_snapshot:
+                    prev_pkg_data = binary_snapshot.get_bin_pkg(prev_pkg_id)
+                if prev_pkg_data is None:
+                    raise RuntimeError(
+                        f"Requested package {prev_pkg_id} not found in snapshot "
+                        f"{prev_snapshot_name}."
+                    )
+                PkgOps._extract_pkg(target_path, prev_pkg_data)
+                return
+
+            prev_snapshot = cimple.snapshot.core.get_snapshot(prev_snapshot_name)
+            PkgOps.install_pkg(target_path, prev_pkg_id, prev_snapshot)
             return
 
         pkg_data = cimple_snapshot.bootstrap_bin_pkg_map.get(
@@ -81,9 +101,12 @@ class PkgOps:
                 f"Requested package {pkg_id} not found in snapshot {cimple_snapshot.name}."
             )
         assert snapshot_models.snapshot_pkg_is_bin(pkg_data)
+        PkgOps._extract_pkg(target_path, pkg_data)
 
+    @staticmethod
+    def _extract_pkg(target_path: pathlib.Path, pkg_data: snapshot_models.SnapshotBinPkg):
         if pkg_data.sha256 == "placeholder":
-            raise RuntimeError(f"Package {pkg_id.name} is not ready yet and cannot be installed.")
+            raise RuntimeError(f"Package {pkg_data.name} is not ready yet and cannot be installed.")
 
         with tarfile.open(
             cimple.constants.cimple_pkg_dir / pkg_data.tarball_name,
@@ -99,39 +122,39 @@ class PkgOps:
         pi_path: pathlib.Path,
         cimple_snapshot: cimple.snapshot.core.CimpleSnapshot,
         build_options: PackageBuildOptions,
+        workspace: cimple.workspace.Workspace,
         bootstrap: bool = False,
     ) -> dict[str, pathlib.Path]:
         # Prepare chroot image
         cimple.logging.info("Preparing image")
         # TODO: support multiple platforms and arch
-        if config.input.image_type is None:
-            image_path = None
-        else:
-            image_path = images.prepare_image("windows", "x86_64", config.input.image_type)
+        with cimple.trace.span("prepare image"):
+            if config.input.image_type is None:
+                image_path = None
+            else:
+                image_path = images.prepare_image("windows", "x86_64", config.input.image_type)
 
         # Ensure needed directories exist
         cimple.util.ensure_path(cimple.constants.cimple_orig_dir)
-        cimple.util.ensure_path(cimple.constants.cimple_pkg_build_dir)
-        cimple.util.ensure_path(cimple.constants.cimple_pkg_output_dir)
-        cimple.util.ensure_path(cimple.constants.cimple_deps_dir)
 
         # Get source tarball
         cimple.logging.info("Fetching original source")
-        pkg_full_name = f"{config.name}-{config.version}"
         pkg_tarball_name = (
             f"{config.name}-{config.input.source_version}.tar.{config.input.tarball_compression}"
         )
         orig_file = cimple.constants.cimple_orig_dir / pkg_tarball_name
         if not orig_file.exists():
-            source_url = f"https://cimple-pi.lunacd.com/orig/{pkg_tarball_name}"
-            res = requests.get(source_url)
-            res.raise_for_status()
-            with orig_file.open("wb") as f:
-                _ = f.write(res.content)
+            with cimple.trace.span("fetch source", lambda: {"tarball": pkg_tarball_name}):
+                source_url = f"https://cimple-pi.lunacd.com/orig/{pkg_tarball_name}"
+                res = requests.get(source_url)
+                res.raise_for_status()
+                with orig_file.open("wb") as f:
+                    _ = f.write(res.content)
 
         # Verify source tarball
         cimple.logging.info("Verifying original source")
-        orig_hash = cimple.hash.hash_file(orig_file, sha_type="sha256")
+        with cimple.trace.span("verify source"):
+            orig_hash = cimple.hash.hash_file(orig_file, sha_type="sha256")
         if orig_hash != config.input.sha256:
             raise RuntimeError(
                 "Corrupted original source tarball, "
@@ -140,55 +163,69 @@ class PkgOps:
 
         # Install dependencies
         cimple.logging.info("Installing dependencies")
-        deps_dir = cimple.constants.cimple_deps_dir / pkg_full_name
+        deps_dir = workspace.deps_dir
+
+        with cimple.trace.span("install dependencies"):
+            deps = self.resolve_dependencies(
+                pkg_models.SrcPkgId(config.name),
+                config.version,
+                pi_path=pi_path,
+                is_bootstrap=bootstrap,
+            )
+            for dep in deps.build_depends[package_id]:
+                self.install_package_and_deps(deps_dir, dep, cimple_snapshot)
 
-        deps = self.resolve_dependencies(
-            pkg_models.SrcPkgId(config.name),
-            config.version,
-            pi_path=pi_path,
-            is_bootstrap=bootstrap,
-        )
-        cimple.util.clear_path(deps_dir)
-        for dep in deps.build_depends[package_id]:
-            self.install_package_and_deps(deps_dir, dep, cimple_snapshot)
-
-        # Prepare build and output directories
-        build_dir = cimple.constants.cimple_pkg_build_dir / pkg_full_name
-        output_dir = cimple.constants.cimple_pkg_output_dir / pkg_full_name
-        cimple.util.clear_path(build_dir)
-        cimple.util.clear_path(output_dir)
-
-        # Extract source tarball
-        # TODO: make this unique per build somehow
-        cimple.logging.info("Extracting original source")
-        with tarfile.open(
-            orig_file, cimple.tarfile.get_tarfile_mode("r", config.input.tarball_compression)
-        ) as tar:
-            if config.input.tarball_root_dir is None:
-                tar.extractall(build_dir, filter=cimple.tarfile.writable_extract_filter)
-            else:
-                cimple.tarfile.extract_directory_from_tar(
-                    tar, config.input.tarball_root_dir, build_dir
-                )
+        build_dir = workspace.build_dir
+        output_dir = workspace.output_dir
 
-        cimple.logging.info("Patching source")
+        # Extract and patch source tarball, or reuse a cached copy
         pkg_path = pi_path / "pkg" / config.name / config.version
         patch_dir = pkg_path / "patches"
+        patch_paths: list[pathlib.Path] = []
         for patch_name in config.input.patches:
-            cimple.logging.info("Applying %s", patch_name)
             patch_path = patch_dir / patch_name
             if not patch_path.exists():
                 raise RuntimeError(f"Patch {patch_name} is not found in {patch_dir}.")
-
-            patch = patch_ng.fromfile(patch_path)
-            if isinstance(patch, bool):
-                raise RuntimeError(f"Failed to load patch {patch_name}")
-            # NOTE: It'll be nice to check whether the patch applies correctly in this step and
-            # give error message about what patch fails with what file. I haven't figured out
-            # how to do this with patch-ng.
-            patch_success = patch.apply(root=build_dir)
-            if not patch_success:
-                raise RuntimeError(f"Failed to apply {patch_name}.")
+            patch_paths.append(patch_path)
+
+        def prepare_source(source_dir: pathlib.Path) -> None:
+            cimple.logging.info("Extracting original source")
+            with (
+                cimple.trace.span("extract source"),
+                tarfile.open(
+                    orig_file,
+                    cimple.tarfile.get_tarfile_mode("r", config.input.tarball_compression),
+                ) as tar,
+            ):
+                if config.input.tarball_root_dir is None:
+                    tar.extractall(source_dir, filter=cimple.tarfile.writable_extract_filter)
+                else:
+                    cimple.tarfile.extract_directory_from_tar(
+                        tar, config.input.tarball_root_dir, source_dir
+                    )
+
+            cimple.logging.info("Patching source")
+            for patch_path in patch_paths:
+                cimple.logging.info("Applying %s", patch_path.name)
+                with cimple.trace.span("apply patch", lambda: {"patch": patch_path.name}):
+                    patch = patch_ng.fromfile(patch_path)
+                    if isinstance(patch, bool):
+                        raise RuntimeError(f"Failed to load patch {patch_path.name}")
+                    # NOTE: It'll be nice to check whether the patch applies correctly in this
+                    # step and give error message about what patch fails with what file. I haven't
+                    # figured out how to do this with patch-ng.
+                    patch_success = patch.apply(root=source_dir)
+                if not patch_success:
+                    raise RuntimeError(f"Failed to apply {patch_path.name}.")
+
+        source_key = cimple.source_cache.source_tree_key(
+            orig_hash,
+            [cimple.hash.hash_file(patch_path, "sha256") for patch_path in patch_paths],
+            config.input.tarball_root_dir,
+        )
+        with cimple.trace.span("prepare source"):
+            source_tree = cimple.source_cache.get_source_tree(source_key, prepare_source)
+            cimple.source_cache.clone_source_tree(source_tree, build_dir)
 
         cimple.logging.info("Starting build")
 
@@ -207,42 +244,67 @@ class PkgOps:
             )
         )
 
-        def interpolate_variables(input_str: str):
-            return cimple.str_interpolation.interpolate(input_str, cimple_builtin_variables)
-
-        # TODO: support overriding rules per-platform
-        for rule in config.rules.default:
-            if isinstance(rule, str):
-                cmd: list[str] = rule.split(" ")
-                cwd = build_dir
-                env = {}
-            else:
-                cmd = rule.rule if isinstance(rule.rule, list) else rule.rule.split(" ")
-                # TODO: Check to make sure cwd is valid and relative
-                cwd = build_dir / interpolate_variables(rule.cwd) if rule.cwd else build_dir
-                env = rule.env if rule.env else {}
-
-            interpolated_cmd: list[str] = []
-            interpolated_env: dict[str, str] = {}
-
-            for cmd_item in cmd:
-                interpolated_cmd.append(interpolate_variables(cmd_item))
-            for env_key, env_val in env.items():
-                interpolated_env[interpolate_variables(env_key)] = interpolate_variables(env_val)
-
-            process = cimple.process.run_command(
-                interpolated_cmd,
-                image_path=image_path,
-                dependency_path=deps_dir,
-                cwd=cwd,
-                env=interpolated_env,
-                extra_paths=build_options.extra_paths,
+        build_log = cimple.process.BuildLog(
+            workspace.path / "build.log",
+            name=package_id.name,
+            live_output=build_options.live_output,
+        )
+        execution_context = cimple.process.ExecutionContext(
+            image_path, deps_dir, build_options.extra_paths, log=build_log
+        )
+        with cimple.trace.span("plan rules"):
+            # Normalize all rules up front, and keep them with the workspace so that the rules of a
+            # failed build can be inspected and run again
+            rules_plan = cimple.pkg.rules.compute_rules_plan(
+                config.rules,
+                default_cwd=build_dir,
+                builtin_variables=cimple_builtin_variables,
+                bin_paths=[],
             )
-            if process.returncode != 0:
-                raise RuntimeError(
-                    f"Failed executing {' '.join(cmd)}, return code {process.returncode}."
-                )
-
+            rules_plan.dump(workspace.path / "rules.json")
+
+        def write_build_usage() -> build_models.PkgBuildUsage:
+            # Resources used by each rule are kept with the build log, also for failed builds
+            build_usage = build_models.PkgBuildUsage(
+                version=0,
+                name=package_id.name,
+                pkg_version=config.version,
+                total=execution_context.total_usage(),
+                rules=execution_context.usage,
+            )
+            (workspace.path / "usage.json").write_text(build_usage.model_dump_json())
+            return build_usage
+
+        try:
+            for rule in rules_plan.rules.root:
+                with cimple.trace.span("run rule", lambda: {"rule": " ".join(rule.rule)}):
+                    process = execution_context.run_command(rule.rule, cwd=rule.cwd, env=rule.env)
+                if process.returncode != 0:
+                    raise RuntimeError(
+                        f"Failed executing {' '.join(rule.rule)}, "
+                        f"return code {process.returncode}. "
+                        f"Last lines of {build_log.path}:\n" + "\n".join(build_log.tail())
+                    )
+        except BaseException:
+            # Failing to keep the resources used must not hide why the build failed
+            try:
+                write_build_usage()
+            except OSError as e:
+                cimple.logging.warning("Failed to write build usage of %s: %s", package_id.name, e)
+            raise
+
+        build_usage = write_build_usage()
+        cimple.snapshot.plan.record_build_usage(package_id, build_usage)
+        cimple.logging.info(
+            "Build took %.1fs wall time, %s CPU time, %s max RSS",
+            build_usage.total.wall_seconds,
+            "unknown"
+            if build_usage.total.user_seconds is None or build_usage.total.system_seconds is None
+            else f"{build_usage.total.user_seconds + build_usage.total.system_seconds:.1f}s",
+            "unknown"
+            if build_usage.total.max_rss_bytes is None
+            else f"{build_usage.total.max_rss_bytes // (1024 * 1024)}MiB",
+        )
         cimple.logging.info("Build result is available in %s", output_dir)
         return {
             binary_id.name: output_dir / binary_data.output_dir
@@ -258,13 +320,23 @@ class PkgOps:
         pi_path: pathlib.Path,
         cimple_snapshot: cimple.snapshot.core.CimpleSnapshot,
         build_options: PackageBuildOptions,
+        workspace: cimple.workspace.Workspace | None = None,
         bootstrap: bool = False,
     ) -> dict[str, pathlib.Path]:
+        """
+        Build a package, returning the output directory of each of its binary packages.
+
+        The outputs live in the given workspace. If no workspace is given, a new one is allocated
+        and left for the caller to clean up.
+        """
         package_version = cimple_snapshot.get_src_pkg(package_id).version
         config = pkg_config_models.load_pkg_config(pi_path, package_id, package_version)
 
         cimple.logging.info("Building package %s-%s", package_id.name, package_version)
 
+        if workspace is None:
+            workspace = cimple.workspace.allocate_workspace(f"{package_id.name}-{package_version}")
+
         # NOTE: package ID has to be provided separately because bootstrap packages have
         # different package IDs (`bootstrap:` variant + normal variant), but they share the
         # same config file
@@ -274,6 +346,7 @@ class PkgOps:
             cimple_snapshot=cimple_snapshot,
             pi_path=pi_path,
             build_options=build_options,
+            workspace=workspace,
             bootstrap=bootstrap,
         )
 
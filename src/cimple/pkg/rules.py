@@ -0,0 +1,44 @@
+import typing
+
+import cimple.models.pkg_config
+
+if typing.TYPE_CHECKING:
+    import pathlib
+
+
+class RulesPlan(typing.NamedTuple):
+    """
+    The rules of a package build, normalized and interpolated.
+
+    Executables are not resolved yet. Each rule's executable is looked up by the ExecutionContext
+    running it, right before it runs, so rules can run tools created or put on PATH by earlier
+    rules.
+    """
+
+    rules: cimple.models.pkg_config.PkgConfigNormalizedRulesList
+
+    def dump(self, rules_path: pathlib.Path) -> None:
+        """
+        Write the plan as a rules file, which can be run with `cimple run-rules`.
+        """
+        rules_path.write_text(self.rules.model_dump_json())
+
+
+def compute_rules_plan(
+    rules: cimple.models.pkg_config.PkgConfigRulesSection,
+    *,
+    default_cwd: pathlib.Path,
+    builtin_variables: dict[str, str],
+    bin_paths: list[pathlib.Path],
+) -> RulesPlan:
+    """
+    Compute the rules plan of a package build.
+    """
+    return RulesPlan(
+        rules=cimple.models.pkg_config.normalize_rules(
+            rules,
+            default_cwd=default_cwd,
+            builtin_variables=builtin_variables,
+            bin_paths=bin_paths,
+        )
+    )
@@ -1,13 +1,30 @@
+import collections
+import contextlib
 import os
 import shutil
 import subprocess
+import sys
+import threading
+import time
 import typing
 
 import cimple.env
 import cimple.logging
+from cimple.models import build as build_models
 
 if typing.TYPE_CHECKING:
     import pathlib
+    from collections.abc import Iterator
+
+# Number of lines of build output kept in memory for error messages
+BUILD_LOG_TAIL_LINES = 50
+
+# Live output of concurrent builds is written line by line under this lock, so that lines of
+# different builds do not interleave
+_live_output_lock = threading.Lock()
+
+# Size of the blocks counted by ru_inblock and ru_oublock
+_RUSAGE_BLOCK_SIZE = 512
 
 
 def construct_path_env_var(
@@ -29,6 +46,185 @@ def construct_path_env_var(
     return os.pathsep.join(path_arr)
 
 
+class BuildLog:
+    """
+    The output of the commands of a single package build.
+
+    Output is written to a log file, and its last lines are kept in memory for error messages. With
+    live output, every line is also printed as soon as it is produced, prefixed with the package
+    name.
+    """
+
+    def __init__(
+        self,
+        log_path: pathlib.Path,
+        *,
+        name: str,
+        live_output: bool = False,
+        tail_lines: int = BUILD_LOG_TAIL_LINES,
+    ) -> None:
+        self.path = log_path
+        self.name = name
+        self.live_output = live_output
+        self._tail: collections.deque[str] = collections.deque(maxlen=tail_lines)
+        self._tail_lock = threading.Lock()
+
+    def tail(self) -> list[str]:
+        """
+        Get the last lines of output.
+        """
+        with self._tail_lock:
+            return list(self._tail)
+
+    def _pump(self, output: typing.IO[bytes], log_file: typing.IO[bytes]) -> None:
+        """
+        Copy the output of a command to the log until the command closes it.
+        """
+        for line in iter(output.readline, b""):
+            log_file.write(line)
+            text = line.decode(errors="replace").rstrip("\r\n")
+            with self._tail_lock:
+                self._tail.append(text)
+            if self.live_output:
+                with _live_output_lock:
+                    sys.stdout.write(f"[{self.name}] {text}\n")
+                    sys.stdout.flush()
+        output.close()
+
+    @contextlib.contextmanager
+    def capture(
+        self, args: list[str], *, cwd: pathlib.Path, env: dict[str, str]
+    ) -> Iterator[subprocess.Popen[bytes]]:
+        """
+        Start a command, capturing its stdout and stderr into the log.
+
+        The caller waits for the command to exit within the context.
+        """
+        with self.path.open("ab") as log_file:
+            log_file.write(f"$ {' '.join(args)}\n".encode())
+            log_file.flush()
+            with subprocess.Popen(
+                args,
+                env=env,
+                cwd=cwd,
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+            ) as process:
+                assert process.stdout is not None
+
+                # The output is drained on its own thread as it is produced, so the command never
+                # blocks on a full pipe
+                pump = threading.Thread(
+                    target=self._pump, args=(process.stdout, log_file), daemon=True
+                )
+                pump.start()
+                try:
+                    yield process
+                finally:
+                    pump.join()
+
+
+def wait_with_usage(
+    process: subprocess.Popen[typing.Any], start_time: float
+) -> build_models.ResourceUsage:
+    """
+    Wait for a process to exit, and measure the resources used by it and the children it waited
+    for since start_time.
+
+    Only the wall time is measured on platforms without os.wait4.
+    """
+    if not hasattr(os, "wait4"):
+        process.wait()
+        return build_models.ResourceUsage(wall_seconds=time.monotonic() - start_time)
+
+    _, status, rusage = os.wait4(process.pid, 0)
+    wall_seconds = time.monotonic() - start_time
+    # The process is reaped already, Popen must not wait for it again
+    process.returncode = os.waitstatus_to_exitcode(status)
+    return build_models.ResourceUsage(
+        wall_seconds=wall_seconds,
+        user_seconds=rusage.ru_utime,
+        system_seconds=rusage.ru_stime,
+        # ru_maxrss is in bytes on macOS, and in kilobytes everywhere else
+        max_rss_bytes=rusage.ru_maxrss if sys.platform == "darwin" else rusage.ru_maxrss * 1024,
+        read_bytes=rusage.ru_inblock * _RUSAGE_BLOCK_SIZE,
+        written_bytes=rusage.ru_oublock * _RUSAGE_BLOCK_SIZE,
+    )
+
+
+class ExecutionContext:
+    """
+    Everything needed to run the commands of a single build, within the constructed image and
+    dependency tree.
+
+    The PATH and baseline environment are computed once, and executables are only looked up once.
+    """
+
+    def __init__(
+        self,
+        image_path: pathlib.Path | None,
+        dependency_path: pathlib.Path | None,
+        extra_paths: list[pathlib.Path] | None = None,
+        *,
+        log: BuildLog | None = None,
+    ) -> None:
+        self.image_path = image_path
+        self.dependency_path = dependency_path
+        self.extra_paths = extra_paths if extra_paths is not None else []
+        # Output of commands goes to the log if there is one, or to the output of cimple otherwise
+        self.log = log
+
+        self.path = construct_path_env_var(image_path, dependency_path, self.extra_paths)
+        self.baseline_env = cimple.env.baseline_env()
+
+        # Resources used by every command run so far, in order
+        self.usage: list[build_models.RuleResourceUsage] = []
+
+        # Resolved executables by command
+        self._executables: dict[str, str] = {}
+
+    def which(self, cmd: str) -> str:
+        """
+        Resolve a command to an executable in the PATH of this context.
+        """
+        executable = self._executables.get(cmd)
+        if executable is None:
+            executable = shutil.which(cmd, path=self.path)
+            if executable is None:
+                raise RuntimeError(f"{cmd} is not found in {self.path}")
+            self._executables[cmd] = executable
+        return executable
+
+    def run_command(
+        self, args: list[str], *, cwd: pathlib.Path, env: dict[str, str] | None
+    ) -> subprocess.CompletedProcess[str]:
+        """
+        Run a command in this context, recording the resources it uses.
+        """
+        args = [self.which(args[0]), *args[1:]]
+
+        env = cimple.env.merge_env(env or {}, self.baseline_env)
+        env = cimple.env.merge_env(env, {"PATH": self.path})
+
+        cimple.logging.debug("Executing %s in %s, env %s", " ".join(args), cwd, env)
+        start_time = time.monotonic()
+        if self.log is not None:
+            with self.log.capture(args, cwd=cwd, env=env) as process:
+                usage = wait_with_usage(process, start_time)
+        else:
+            with subprocess.Popen(args, text=True, env=env, cwd=cwd) as process:
+                usage = wait_with_usage(process, start_time)
+        self.usage.append(build_models.RuleResourceUsage(rule=args, usage=usage))
+        return subprocess.CompletedProcess(args, process.returncode)
+
+    def total_usage(self) -> build_models.ResourceUsage:
+        """
+        Get the resources used by all commands run so far.
+        """
+        return build_models.sum_resource_usage([rule_usage.usage for rule_usage in self.usage])
+
+
 def run_command(
     args: list[str],
     image_path: pathlib.Path | None,
@@ -39,23 +235,9 @@ def run_command(
 ) -> subprocess.CompletedProcess[str]:
     """
     Run a command within the constructed image and dependency tree.
-    """
-
-    if extra_paths is None:
-        extra_paths = []
 
-    path = construct_path_env_var(image_path, dependency_path, extra_paths)
-
-    cmd = shutil.which(args[0], path=path)
-    if cmd is None:
-        raise RuntimeError(f"{args[0]} is not found in {path}")
-
-    args[0] = cmd
-
-    if env is None:
-        env = {}
-    env = cimple.env.merge_env(env, cimple.env.baseline_env())
-    env = cimple.env.merge_env(env, {"PATH": path})
-
-    cimple.logging.debug("Executing %s in %s, env %s", " ".join(args), cwd, env)
-    return subprocess.run(args, text=True, env=env, cwd=cwd)
+    Builds running several commands should use an ExecutionContext instead.
+    """
+    return ExecutionContext(image_path, dependency_path, extra_paths).run_command(
+        args, cwd=cwd, env=env
+    )
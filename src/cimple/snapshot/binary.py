@@ -0,0 +1,351 @@
+"""
+Compact binary encoding of snapshots.
+
+The binary encoding is written next to the JSON snapshot, and allows looking up individual packages
+without parsing the whole snapshot. JSON stays the interchange format, the binary encoding is only
+a cache of it and is ignored when it does not match the JSON snapshot.
+
+Layout, all integers are little-endian:
+- Header, see _HEADER.
+- String offsets: (string count + 1) u32 offsets into the string data.
+- String data: UTF-8 encoded strings, such as package names and versions.
+- Package records: fixed-width records sorted by (type, name), see _RECORD.
+- Edges: u32 string indices of dependency names. Each record refers to a slice of it (CSR-style).
+- Metadata: JSON of the snapshot fields other than packages.
+"""
+
+import bisect
+import json
+import mmap
+import struct
+import typing
+
+from cimple.models import pkg as pkg_models
+from cimple.models import snapshot as snapshot_models
+
+if typing.TYPE_CHECKING:
+    import os
+    import pathlib
+
+_MAGIC = b"CIMPLESN"
+_FORMAT_VERSION = 2
+
+# magic, format version, size and modification time in nanoseconds of the JSON snapshot, string
+# count, record count, edge count, metadata length
+_HEADER = struct.Struct("<8sIQQIIII")
+
+# type, flags, padding, name, version (source) or compression method (binary), first edge of
+# build_depends or depends, number of those edges, first edge of binary_packages, number of those
+# edges, sha256 string when not stored raw, raw sha256
+_RECORD = struct.Struct("<BBHIIIIIII32s")
+
+_U32 = struct.Struct("<I")
+
+_TYPE_SRC = 0
+_TYPE_BIN = 1
+
+_FLAG_BOOTSTRAP = 1
+# Set when the sha256 is not a 64-character hex string, and is stored in the string table instead
+_FLAG_SHA256_STRING = 2
+
+
+def binary_snapshot_path(snapshot_path: pathlib.Path) -> pathlib.Path:
+    """
+    Get the path of the binary encoding of a JSON snapshot.
+    """
+    return snapshot_path.with_suffix(".snap")
+
+
+def _raw_sha256(sha256: str) -> bytes | None:
+    if len(sha256) != 64:
+        return None
+    try:
+        return bytes.fromhex(sha256)
+    except ValueError:
+        return None
+
+
+def write_binary_snapshot(
+    path: pathlib.Path, snapshot_data: snapshot_models.SnapshotModel, json_stat: os.stat_result
+) -> None:
+    """
+    Write the binary encoding of a snapshot.
+
+    json_stat is the stat of the JSON snapshot it is derived from, and is checked when opening it.
+    """
+    strings: dict[str, int] = {}
+
+    def intern(string: str) -> int:
+        return strings.setdefault(string, len(strings))
+
+    packages = [(package.root, False) for package in snapshot_data.pkgs] + [
+        (package.root, True) for package in snapshot_data.bootstrap_pkgs
+    ]
+    packages.sort(key=lambda item: (item[0].pkg_type != "src", item[0].name.encode()))
+
+    records: list[tuple[typing.Any, ...]] = []
+    depends_edges: list[int] = []
+    binary_package_edges: list[int] = []
+    for package, bootstrap in packages:
+        flags = _FLAG_BOOTSTRAP if bootstrap else 0
+        sha256_string = 0
+        raw_sha256 = b""
+        if snapshot_models.snapshot_pkg_is_src(package):
+            pkg_type = _TYPE_SRC
+            text = intern(package.version)
+            depends = package.build_depends
+            binary_packages = package.binary_packages
+        else:
+            assert snapshot_models.snapshot_pkg_is_bin(package)
+            pkg_type = _TYPE_BIN
+            text = intern(package.compression_method)
+            depends = package.depends
+            binary_packages = []
+            raw_sha256 = _raw_sha256(package.sha256)
+            if raw_sha256 is None:
+                flags |= _FLAG_SHA256_STRING
+                sha256_string = intern(package.sha256)
+                raw_sha256 = b""
+
+        records.append(
+            (
+                pkg_type,
+                flags,
+                intern(package.name),
+                text,
+                len(depends_edges),
+                len(depends),
+                len(binary_package_edges),
+                len(binary_packages),
+                sha256_string,
+                raw_sha256,
+            )
+        )
+        depends_edges.extend(intern(dep.name) for dep in depends)
+        binary_package_edges.extend(intern(bin_pkg.name) for bin_pkg in binary_packages)
+
+    # Binary package edges are stored after all depends edges
+    edges = depends_edges + binary_package_edges
+    packed_records = [
+        _RECORD.pack(
+            pkg_type,
+            flags,
+            0,
+            name,
+            text,
+            deps_start,
+            deps_count,
+            len(depends_edges) + bins_start,
+            bins_count,
+            sha256_string,
+            raw_sha256,
+        )
+        for (
+            pkg_type,
+            flags,
+            name,
+            text,
+            deps_start,
+            deps_count,
+            bins_start,
+            bins_count,
+            sha256_string,
+            raw_sha256,
+        ) in records
+    ]
+
+    encoded_strings = [string.encode() for string in strings]
+    string_offsets = [0]
+    for encoded_string in encoded_strings:
+        string_offsets.append(string_offsets[-1] + len(encoded_string))
+
+    metadata = json.dumps(
+        snapshot_data.model_dump(mode="json", by_alias=True, exclude={"pkgs", "bootstrap_pkgs"})
+    ).encode()
+
+    tmp_path = path.with_name(f"{path.name}.tmp")
+    with tmp_path.open("wb") as f:
+        f.write(
+            _HEADER.pack(
+                _MAGIC,
+                _FORMAT_VERSION,
+                json_stat.st_size,
+                json_stat.st_mtime_ns,
+                len(encoded_strings),
+                len(packed_records),
+                len(edges),
+                len(metadata),
+            )
+        )
+        f.write(struct.pack(f"<{len(string_offsets)}I", *string_offsets))
+        f.write(b"".join(encoded_strings))
+        f.write(b"".join(packed_records))
+        f.write(struct.pack(f"<{len(edges)}I", *edges))
+        f.write(metadata)
+    tmp_path.replace(path)
+
+
+class BinarySnapshot:
+    """
+    A memory-mapped binary snapshot, see write_binary_snapshot.
+
+    Packages are decoded on lookup, so opening a snapshot does not depend on its size.
+    """
+
+    def __init__(self, path: pathlib.Path) -> None:
+        with path.open("rb") as f:
+            try:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, OSError) as e:
+                raise RuntimeError(f"Unable to map binary snapshot {path}.") from e
+
+        try:
+            (
+                magic,
+                format_version,
+                json_size,
+                json_mtime_ns,
+                string_count,
+                self._record_count,
+                edge_count,
+                metadata_length,
+            ) = _HEADER.unpack_from(self._mmap, 0)
+        except struct.error as e:
+            self._mmap.close()
+            raise RuntimeError(f"{path} is not a binary snapshot.") from e
+
+        if magic != _MAGIC or format_version != _FORMAT_VERSION:
+            self._mmap.close()
+            raise RuntimeError(f"{path} is not a binary snapshot of a supported version.")
+
+        self.json_size: int = json_size
+        self.json_mtime_ns: int = json_mtime_ns
+        self._string_offsets = _HEADER.size
+        self._string_data = self._string_offsets + (string_count + 1) * _U32.size
+        self._records = (
+            self._string_data
+            + _U32.unpack_from(self._mmap, self._string_offsets + string_count * _U32.size)[0]
+        )
+        self._edges = self._records + self._record_count * _RECORD.size
+        self._metadata = self._edges + edge_count * _U32.size
+        self._metadata_length = metadata_length
+
+    def close(self) -> None:
+        self._mmap.close()
+
+    def __enter__(self) -> typing.Self:
+        return self
+
+    def __exit__(self, *args: object) -> None:
+        self.close()
+
+    def _string(self, index: int) -> str:
+        start, end = struct.unpack_from("<II", self._mmap, self._string_offsets + index * 4)
+        return self._mmap[self._string_data + start : self._string_data + end].decode()
+
+    def _record(self, index: int) -> tuple[typing.Any, ...]:
+        return _RECORD.unpack_from(self._mmap, self._records + index * _RECORD.size)
+
+    def _edges_of(self, start: int, count: int) -> list[str]:
+        indices = struct.unpack_from(f"<{count}I", self._mmap, self._edges + start * _U32.size)
+        return [self._string(index) for index in indices]
+
+    def _find(self, pkg_id: pkg_models.PkgId) -> tuple[typing.Any, ...] | None:
+        """
+        Binary search for the record of a package.
+        """
+        key = (_TYPE_SRC if pkg_id.type == "src" else _TYPE_BIN, pkg_id.name.encode())
+
+        def record_key(index: int) -> tuple[int, bytes]:
+            record = self._record(index)
+            return (record[0], self._string(record[3]).encode())
+
+        index = bisect.bisect_left(range(self._record_count), key, key=record_key)
+        if index == self._record_count or record_key(index) != key:
+            return None
+        return self._record(index)
+
+    @property
+    def metadata(self) -> dict[str, typing.Any]:
+        """
+        Snapshot fields other than packages, in their JSON form.
+        """
+        return json.loads(self._mmap[self._metadata : self._metadata + self._metadata_length])
+
+    def get_src_pkg(self, pkg_id: pkg_models.SrcPkgId) -> snapshot_models.SnapshotSrcPkg | None:
+        record = self._find(pkg_id)
+        if record is None:
+            return None
+
+        _, _, _, name, version, deps_start, deps_count, bins_start, bins_count, _, _ = record
+        return snapshot_models.SnapshotSrcPkg.model_construct(
+            name=self._string(name),
+            version=self._string(version),
+            build_depends=pkg_models.bin_pkg_id_list_validator(
+                self._edges_of(deps_start, deps_count)
+            ),
+            binary_packages=pkg_models.bin_pkg_id_list_validator(
+                self._edges_of(bins_start, bins_count)
+            ),
+            pkg_type="src",
+        )
+
+    def get_bin_pkg(self, pkg_id: pkg_models.BinPkgId) -> snapshot_models.SnapshotBinPkg | None:
+        record = self._find(pkg_id)
+        if record is None:
+            return None
+
+        _, flags, _, name, compression, deps_start, deps_count, _, _, sha256_string, sha256 = record
+        return snapshot_models.SnapshotBinPkg.model_construct(
+            name=self._string(name),
+            sha256=(self._string(sha256_string) if flags & _FLAG_SHA256_STRING else sha256.hex()),
+            compression_method=self._string(compression),
+            depends=pkg_models.bin_pkg_id_list_validator(self._edges_of(deps_start, deps_count)),
+            pkg_type="bin",
+        )
+
+    def is_bootstrap(self, pkg_id: pkg_models.PkgId) -> bool:
+        record = self._find(pkg_id)
+        if record is None:
+            raise RuntimeError(f"Package {pkg_id} does not exist in snapshot.")
+        return bool(record[1] & _FLAG_BOOTSTRAP)
+
+    def depends_of(self, pkg_id: pkg_models.PkgId) -> list[pkg_models.BinPkgId]:
+        """
+        Get the direct build dependencies of a source package, or the direct runtime dependencies
+        of a binary package.
+        """
+        record = self._find(pkg_id)
+        if record is None:
+            raise RuntimeError(f"Package {pkg_id} does not exist in snapshot.")
+        return pkg_models.bin_pkg_id_list_validator(self._edges_of(record[5], record[6]))
+
+
+def open_binary_snapshot(snapshot_path: pathlib.Path) -> BinarySnapshot | None:
+    """
+    Open the binary encoding of a JSON snapshot, if it exists and matches the JSON snapshot.
+
+    The binary encoding matches if the JSON snapshot has the same size and modification time as
+    when the binary encoding was written, so that a JSON snapshot that was rewritten or replaced
+    since is never shadowed by a stale binary encoding.
+    """
+    path = binary_snapshot_path(snapshot_path)
+    try:
+        json_stat = snapshot_path.stat()
+    except FileNotFoundError:
+        return None
+    if not path.exists():
+        return None
+
+    try:
+        binary_snapshot = BinarySnapshot(path)
+    except RuntimeError:
+        return None
+
+    if (binary_snapshot.json_size, binary_snapshot.json_mtime_ns) != (
+        json_stat.st_size,
+        json_stat.st_mtime_ns,
+    ):
+        binary_snapshot.close()
+        return None
+    return binary_snapshot
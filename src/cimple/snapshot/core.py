@@ -1,5 +1,10 @@
+import collections
+import collections.abc
+import concurrent.futures
 import datetime
 import itertools
+import json
+import threading
 import typing
 
 import cimple.constants
@@ -10,6 +15,9 @@ import cimple.models.pkg_config
 import cimple.models.snapshot
 import cimple.pkg.core
 import cimple.pkg.ops
+import cimple.snapshot.binary
+import cimple.snapshot.merkle
+import cimple.trace
 import cimple.util
 from cimple.models import pkg as pkg_models
 from cimple.models import snapshot as snapshot_models
@@ -33,27 +41,26 @@ class CimpleSnapshot:
         2. Binary package depends on other binary packages (depends)
         3. Binary package depends on the source package that built it (build)
         """
-        # Build package map for quick access
-        self.src_pkg_map = {
-            pkg.root.id: pkg.root for pkg in snapshot_data.pkgs if pkg.root.pkg_type == "src"
-        }
-        self.bin_pkg_map = {
-            pkg.root.id: pkg.root for pkg in snapshot_data.pkgs if pkg.root.pkg_type == "bin"
-        }
-        self.bootstrap_src_pkg_map = {
-            pkg.root.id: pkg.root
-            for pkg in snapshot_data.bootstrap_pkgs
-            if pkg.root.pkg_type == "src"
-        }
-        self.bootstrap_bin_pkg_map = {
-            pkg.root.id: pkg.root
-            for pkg in snapshot_data.bootstrap_pkgs
-            if pkg.root.pkg_type == "bin"
-        }
+        # Package maps for quick access, filled in along with the graph below
+        self.src_pkg_map: dict[pkg_models.SrcPkgId, snapshot_models.SnapshotSrcPkg] = {}
+        self.bin_pkg_map: dict[pkg_models.BinPkgId, snapshot_models.SnapshotBinPkg] = {}
+        self.bootstrap_src_pkg_map: dict[pkg_models.SrcPkgId, snapshot_models.SnapshotSrcPkg] = {}
+        self.bootstrap_bin_pkg_map: dict[pkg_models.BinPkgId, snapshot_models.SnapshotBinPkg] = {}
 
         # Build dependency graph
         self.graph = cimple.graph.Graph[pkg_models.PkgId]()
 
+        # Memoized runtime closures of binary packages, see _runtime_closure
+        # Source packages are not part of any runtime closure, so only changes to binary packages
+        # invalidate them.
+        self._runtime_closures: dict[pkg_models.BinPkgId, tuple[pkg_models.BinPkgId, ...]] = {}
+
+        # Reachability index of the whole graph, built on demand, see reachability_index
+        self._reachability_index: cimple.graph.ReachabilityIndex[pkg_models.PkgId] | None = None
+
+        # Merkle tree of the packages, built on demand, see merkle_tree
+        self._merkle_tree: cimple.snapshot.merkle.PkgMerkleTree | None = None
+
         # Add bootstrap nodes
         # All bootstrap packages (source or binary) are translated to three nodes:
         # - pkg-name: the actual package node
@@ -61,45 +68,15 @@ class CimpleSnapshot:
         # Bootstrap packages are built by pulling their deps from the previous snapshot, those
         # packages are denoted with the "prev:" prefix. Because they are always available, we
         # do not need to add them to the graph.
-        def add_edge(from_pkg: pkg_models.PkgId, to_pkg: pkg_models.PkgId):
-            """
-            Helper to add edge to graph with validation.
-            """
-            if not self.graph.has_node(from_pkg):
-                raise RuntimeError(
-                    f"Corrupted snapshot! Package {from_pkg} not found in snapshot. "
-                    f"Required by {to_pkg}."
-                )
-            if not self.graph.has_node(to_pkg):
-                raise RuntimeError(
-                    f"Corrupted snapshot! Package {to_pkg} not found in snapshot. "
-                    f"Required by {from_pkg}."
-                )
-            self.graph.add_edge(from_pkg, to_pkg)
-
-        # Add all other packages
-        for package in itertools.chain(snapshot_data.pkgs, snapshot_data.bootstrap_pkgs):
-            self.graph.add_node(package.root.id)
+        #
+        # Packages and edges are added in a single pass. Adding an edge adds its nodes, so edges to
+        # packages that are missing from the snapshot are detected afterwards.
+        for package in snapshot_data.pkgs:
+            self._load_pkg(package.root, bootstrap=False)
+        for package in snapshot_data.bootstrap_pkgs:
+            self._load_pkg(package.root, bootstrap=True)
 
-        # Add dependency edges for normal packages
-        for package in itertools.chain(snapshot_data.pkgs, snapshot_data.bootstrap_pkgs):
-            if snapshot_models.snapshot_pkg_is_src(package.root):
-                # Binary packages depends on source package that built them
-                for bin_pkg in package.root.binary_packages:
-                    add_edge(bin_pkg, package.root.id)
-
-                # Source package build-depends on other source packages
-                for dep in package.root.build_depends:
-                    # Do not add edges for `prev:` packages, as they are always available
-                    if cimple.models.pkg.is_prev_pkg(dep):
-                        continue
-
-                    add_edge(package.root.id, dep)
-
-            elif snapshot_models.snapshot_pkg_is_bin(package.root):
-                # Binary package depends on other binary packages
-                for dep in package.root.depends:
-                    add_edge(package.root.id, dep)
+        self._check_graph_nodes_are_pkgs()
 
         # Store snapshot metadata
         self.version: typing.Literal[0] = snapshot_data.version
@@ -108,33 +85,155 @@ class CimpleSnapshot:
         self.changes = snapshot_data.changes
         self.bootstrap_changes = snapshot_data.bootstrap_changes
 
+    def _load_pkg(
+        self,
+        package: snapshot_models.SnapshotSrcPkg | snapshot_models.SnapshotBinPkg,
+        *,
+        bootstrap: bool,
+    ) -> None:
+        """
+        Add a package record and its dependency edges while loading a snapshot.
+
+        Unlike add_src_pkg and add_bin_pkg, this takes the record as is, and edges may point to
+        packages that are loaded later.
+        """
+        if snapshot_models.snapshot_pkg_is_src(package):
+            pkg_id = package.id
+            self.graph.add_node(pkg_id)
+            src_pkg_map = self.bootstrap_src_pkg_map if bootstrap else self.src_pkg_map
+            src_pkg_map[pkg_id] = package
+
+            # Binary packages depends on source package that built them
+            for bin_pkg in package.binary_packages:
+                self.graph.add_edge(bin_pkg, pkg_id)
+
+            # Source package build-depends on other source packages
+            # Do not add edges for `prev:` packages, as they are always available
+            self.graph.add_edges_from(
+                pkg_id,
+                (dep for dep in package.build_depends if not cimple.models.pkg.is_prev_pkg(dep)),
+            )
+
+        elif snapshot_models.snapshot_pkg_is_bin(package):
+            pkg_id = package.id
+            self.graph.add_node(pkg_id)
+            bin_pkg_map = self.bootstrap_bin_pkg_map if bootstrap else self.bin_pkg_map
+            bin_pkg_map[pkg_id] = package
+
+            # Binary package depends on other binary packages
+            self.graph.add_edges_from(pkg_id, package.depends)
+
+    def _check_graph_nodes_are_pkgs(self) -> None:
+        """
+        Check that every node in the graph is a package in the snapshot.
+        """
+        for pkg_id in self.graph.nodes():
+            if (
+                pkg_id in self.src_pkg_map
+                or pkg_id in self.bin_pkg_map
+                or pkg_id in self.bootstrap_src_pkg_map
+                or pkg_id in self.bootstrap_bin_pkg_map
+            ):
+                continue
+
+            related_pkg = next(
+                itertools.chain(
+                    self.graph.reverse(copy=False).neighbors(pkg_id), self.graph.neighbors(pkg_id)
+                )
+            )
+            raise RuntimeError(
+                f"Corrupted snapshot! Package {pkg_id} not found in snapshot. "
+                f"Required by {related_pkg}."
+            )
+
     def build_depends_of(self, src_pkg: pkg_models.SrcPkgId) -> list[pkg_models.BinPkgId]:
         """
         Get all binary packages that are required during the build a source package.
+
+        This is composed from the memoized runtime closures of the direct build dependencies.
         """
-        edges = self.graph.generic_bfs_edges(
-            src_pkg,
-            neighbors=lambda node: cimple.graph.binary_neighbors(self.graph, node),
-        )
-        descendants: list[pkg_models.BinPkgId] = []
-        for _, node in edges:
-            assert node.type == "bin"
-            descendants.append(node)
-        return descendants
+        assert not self.graph.is_broken(), "Cannot traverse a graph with broken edges"
+        closure: dict[pkg_models.BinPkgId, None] = {}
+        for dep in cimple.graph.binary_neighbors(self.graph, src_pkg):
+            assert dep.type == "bin"
+            closure[dep] = None
+            closure.update(dict.fromkeys(self._runtime_closure(dep)))
+        return list(closure)
 
     def runtime_depends_of(self, bin_pkg: pkg_models.BinPkgId) -> list[pkg_models.BinPkgId]:
         """
         Get all binary packages that are required at runtime by a binary package.
         """
-        edges = self.graph.generic_bfs_edges(
-            bin_pkg,
-            neighbors=lambda node: cimple.graph.binary_neighbors(self.graph, node),
-        )
-        descendants: list[pkg_models.BinPkgId] = []
-        for _, node in edges:
-            assert node.type == "bin"
-            descendants.append(node)
-        return descendants
+        assert not self.graph.is_broken(), "Cannot traverse a graph with broken edges"
+        return list(self._runtime_closure(bin_pkg))
+
+    def _runtime_closure(self, bin_pkg: pkg_models.BinPkgId) -> tuple[pkg_models.BinPkgId, ...]:
+        """
+        Get the memoized runtime closure of a binary package, excluding the package itself.
+
+        The traversal stops at packages whose closure is already memoized, and merges their closure
+        instead of walking it again.
+        """
+        closure = self._runtime_closures.get(bin_pkg)
+        if closure is not None:
+            return closure
+
+        visited: dict[pkg_models.BinPkgId, None] = {}
+        queue = collections.deque([bin_pkg])
+        while queue:
+            node = queue.popleft()
+            for dep in cimple.graph.binary_neighbors(self.graph, node):
+                assert dep.type == "bin"
+                if dep is bin_pkg or dep in visited:
+                    continue
+                visited[dep] = None
+
+                dep_closure = self._runtime_closures.get(dep)
+                if dep_closure is None:
+                    queue.append(dep)
+                    continue
+                for transitive_dep in dep_closure:
+                    if transitive_dep is not bin_pkg:
+                        visited.setdefault(transitive_dep)
+
+        closure = tuple(visited)
+        self._runtime_closures[bin_pkg] = closure
+        return closure
+
+    def _invalidate_runtime_closures(self, bin_pkg: pkg_models.BinPkgId) -> None:
+        """
+        Drop the memoized runtime closures that can change when a binary package is added or
+        removed: its own, and those of all packages that depend on it.
+        """
+        self._runtime_closures.pop(bin_pkg, None)
+        stale = [pkg_id for pkg_id, closure in self._runtime_closures.items() if bin_pkg in closure]
+        for pkg_id in stale:
+            del self._runtime_closures[pkg_id]
+
+    def reachability_index(self) -> cimple.graph.ReachabilityIndex[pkg_models.PkgId]:
+        """
+        Get a reachability index of the dependency graph, for whole-snapshot dependency queries
+        such as "which packages transitively depend on this package".
+
+        The index is built on first use, and dropped whenever packages are added or removed.
+        """
+        if self._reachability_index is None:
+            self._reachability_index = cimple.graph.ReachabilityIndex(self.graph)
+        return self._reachability_index
+
+    def merkle_tree(self) -> cimple.snapshot.merkle.PkgMerkleTree:
+        """
+        Get a Merkle tree of the (non-bootstrap) source and binary packages, for comparing
+        snapshots.
+
+        The tree is built on first use, and dropped whenever packages are added, removed or changed
+        through the methods of this class.
+        """
+        if self._merkle_tree is None:
+            self._merkle_tree = cimple.snapshot.merkle.PkgMerkleTree(
+                (*self.src_pkg_map.values(), *self.bin_pkg_map.values())
+            )
+        return self._merkle_tree
 
     def binary_pkgs_are_complete(self) -> bool:
         """
@@ -142,9 +241,13 @@ class CimpleSnapshot:
         """
         return all(bin_pkg.sha256 != "placeholder" for bin_pkg in self.bin_pkg_map.values())
 
-    def dump_snapshot(self):
+    def dump_snapshot(self, *, delta: bool = False):
         """
         Dump the snapshot to a JSON file.
+
+        With delta, the snapshot is stored as its difference from its ancestor snapshot instead,
+        except every SNAPSHOT_CHECKPOINT_INTERVAL snapshots along the ancestor chain, which are
+        stored in full so that loading a snapshot never replays a long chain of deltas.
         """
         # Check that binary packages have their SHA256 filled in
         if not self.binary_pkgs_are_complete():
@@ -177,11 +280,31 @@ class CimpleSnapshot:
 
         cimple.util.ensure_path(cimple.constants.cimple_snapshot_dir)
         snapshot_manifest = cimple.constants.cimple_snapshot_dir / f"{snapshot_name}.json"
-        if snapshot_manifest.exists():
+        if snapshot_exists(snapshot_name):
             raise RuntimeError(f"Snapshot {snapshot_name} already exists!")
 
-        with snapshot_manifest.open("w") as f:
-            f.write(snapshot_data.model_dump_json(by_alias=True))
+        snapshot_json = snapshot_data.model_dump_json(by_alias=True).encode()
+
+        if delta and self.ancestor is not None and snapshot_exists(self.ancestor):
+            ancestor_state = _load_snapshot_state(self.ancestor)
+            if ancestor_state.depth + 1 < SNAPSHOT_CHECKPOINT_INTERVAL:
+                _dump_snapshot_delta(
+                    _snapshot_delta_path(snapshot_name),
+                    _snapshot_state_from_full(json.loads(snapshot_json)),
+                    ancestor_state,
+                )
+                return
+
+        with snapshot_manifest.open("wb") as f:
+            f.write(snapshot_json)
+
+        # Write the binary encoding for quick lookups of individual packages. It records the stat of
+        # the complete JSON snapshot, so it stops matching once the JSON snapshot is changed.
+        cimple.snapshot.binary.write_binary_snapshot(
+            cimple.snapshot.binary.binary_snapshot_path(snapshot_manifest),
+            snapshot_data,
+            snapshot_manifest.stat(),
+        )
 
     def add_src_pkg(
         self,
@@ -207,6 +330,8 @@ class CimpleSnapshot:
             pkg_type="src",
         )
         src_pkg_map[pkg_id] = new_src_pkg
+        self._reachability_index = None
+        self._merkle_tree = None
 
         # Add package to graph
         self.graph.add_node(pkg_id)
@@ -238,6 +363,9 @@ class CimpleSnapshot:
             pkg_type="bin",
         )
         bin_pkg_map[pkg_id] = new_bin_pkg
+        self._invalidate_runtime_closures(pkg_id)
+        self._reachability_index = None
+        self._merkle_tree = None
 
         # Add binary package to its source package
         assert src_pkg in src_pkg_map, f"Source package {src_pkg} not found in snapshot."
@@ -307,6 +435,8 @@ class CimpleSnapshot:
         Remove a source package and its binary packages from the snapshot.
         """
         assert pkg_id in self.src_pkg_map, f"Package {pkg_id} does not exist in snapshot."
+        self._reachability_index = None
+        self._merkle_tree = None
 
         # Remove binary packages first
         src_snapshot_pkg = self.src_pkg_map[pkg_id]
@@ -325,6 +455,7 @@ class CimpleSnapshot:
 
             del self.bin_pkg_map[bin_pkg_id]
             self.graph.remove_node(bin_pkg_id)
+            self._invalidate_runtime_closures(bin_pkg_id)
 
         # Remove all build dependency edges for this source package
         for dep in src_snapshot_pkg.build_depends:
@@ -377,27 +508,20 @@ class CimpleSnapshot:
     def _update_with_adds(
         self,
         pkg_adds: list[cimple.models.snapshot.SnapshotChangeAdd],
-        pkg_processor: cimple.pkg.ops.PkgOps,
-        pkg_index_path: pathlib.Path,
+        resolved_pkgs: dict[_ResolveKey, _ResolvedPkg],
         bootstrap: bool = False,
     ):
         """
         Helper to process package additions.
         """
         for pkg_add in pkg_adds:
-            dependency_data = pkg_processor.resolve_dependencies(
-                pkg_add.id, pkg_add.version, pi_path=pkg_index_path, is_bootstrap=bootstrap
-            )
-            config = cimple.models.pkg_config.load_pkg_config(
-                pkg_index_path, pkg_add.id, pkg_add.version
-            )
+            config, dependency_data = resolved_pkgs[(pkg_add.id, pkg_add.version, bootstrap)]
             self.add_pkg(config, dependency_data, bootstrap=bootstrap)
 
     def _update_with_updates(
         self,
         pkg_updates: list[cimple.models.snapshot.SnapshotChangeUpdate],
-        pkg_processor: cimple.pkg.ops.PkgOps,
-        pkg_index_path: pathlib.Path,
+        resolved_pkgs: dict[_ResolveKey, _ResolvedPkg],
         bootstrap: bool = False,
     ):
         """
@@ -412,15 +536,9 @@ class CimpleSnapshot:
                 self.remove_pkg(bootstrap_src_id)
 
             # Add new package
-            config = cimple.models.pkg_config.load_pkg_config(
-                pkg_index_path, pkg_update.id, pkg_update.to_version
-            )
-            dependency_data = pkg_processor.resolve_dependencies(
-                pkg_update.id,
-                pkg_update.to_version,
-                pi_path=pkg_index_path,
-                is_bootstrap=bootstrap,
-            )
+            config, dependency_data = resolved_pkgs[
+                (pkg_update.id, pkg_update.to_version, bootstrap)
+            ]
             self.add_pkg(config, dependency_data, bootstrap=bootstrap)
 
     def update_with_changes(
@@ -451,6 +569,19 @@ class CimpleSnapshot:
         # 5. Normal updates (normal updates can depend on bootstrap additions and normal additions)
         # 6. Validate that all dependencies are satisfied
 
+        # Loading and resolving added and updated packages only reads the package index, so it is
+        # done for all of them up front, and the graph is then changed in the order above.
+        resolved_pkgs = _resolve_pkgs(
+            [
+                *((pkg.id, pkg.version, True) for pkg in bootstrap_changes.add),
+                *((pkg.id, pkg.to_version, True) for pkg in bootstrap_changes.update),
+                *((pkg.id, pkg.version, False) for pkg in pkg_changes.add),
+                *((pkg.id, pkg.to_version, False) for pkg in pkg_changes.update),
+            ],
+            pkg_processor=pkg_processor,
+            pkg_index_path=pkg_index_path,
+        )
+
         # Bootstrap removals
         for pkg_remove in bootstrap_changes.remove:
             self.remove_pkg(pkg_remove)
@@ -461,20 +592,16 @@ class CimpleSnapshot:
             self.remove_pkg(pkg_remove)
 
         # Bootstrap additions
-        self._update_with_adds(bootstrap_changes.add, pkg_processor, pkg_index_path, bootstrap=True)
+        self._update_with_adds(bootstrap_changes.add, resolved_pkgs, bootstrap=True)
 
         # Bootstrap updates
-        self._update_with_updates(
-            bootstrap_changes.update, pkg_processor, pkg_index_path, bootstrap=True
-        )
+        self._update_with_updates(bootstrap_changes.update, resolved_pkgs, bootstrap=True)
 
         # Normal additions
-        self._update_with_adds(pkg_changes.add, pkg_processor, pkg_index_path, bootstrap=False)
+        self._update_with_adds(pkg_changes.add, resolved_pkgs, bootstrap=False)
 
         # Normal updates
-        self._update_with_updates(
-            pkg_changes.update, pkg_processor, pkg_index_path, bootstrap=False
-        )
+        self._update_with_updates(pkg_changes.update, resolved_pkgs, bootstrap=False)
 
         # Resolve all build and runtime dependencies and make sure they are satisfied
         for pkg in (*pkg_changes.add, *pkg_changes.update):
@@ -489,10 +616,6 @@ class CimpleSnapshot:
             )
 
         # Step 2: Compute the build graph
-        requirement_graph: cimple.graph.Graph[pkg_models.PkgId] = self.graph.reverse(copy=True)
-
-        pkgs_to_build: set[cimple.models.pkg.PkgId] = set()
-
         # Because additions and removals are split between changes and bootstrap_changes,
         # "newly added" packages can have dependents in the unchanged build graph. For example,
         # package A can be removed as a normal package, but its bootstrap version can be newly
@@ -508,27 +631,37 @@ class CimpleSnapshot:
         ]
 
         # All updated packages and their dependents need to be built
-        for affected_pkg in all_affected_pkgs:
-            pkgs_to_build.add(affected_pkg)
-            pkgs_to_build.update(requirement_graph.descendants(affected_pkg))
+        # Dependents are the ancestors in the dependency graph, so they are found by walking
+        # predecessors from all affected packages at once, without reversing the whole graph.
+        pkgs_to_build: set[cimple.models.pkg.PkgId] = self.graph.ancestors_of_all(all_affected_pkgs)
+        pkgs_to_build.update(all_affected_pkgs)
 
         # Set the sha256 fields of the packages to be built to "placeholder"
         for pkg_id in pkgs_to_build:
             if pkg_id.type != "bin":
                 continue
 
-            if pkg_id in self.bootstrap_bin_pkg_map:
-                self.bootstrap_bin_pkg_map[pkg_id].sha256 = "placeholder"
-            else:
-                self.bin_pkg_map[pkg_id].sha256 = "placeholder"
+            assert isinstance(pkg_id, pkg_models.BinPkgId)
+            self.set_bin_pkg_sha256(pkg_id, "placeholder")
 
         # Point ancenstor to the current snapshot
         # Set name to "unfinalized" as the new snapshot is not finalized yet
         self.ancestor = self.name
         self.name = "unfinalized"
 
-        # Get subgraph of packages to build
-        return cimple.graph.BuildGraph(requirement_graph.subgraph(pkgs_to_build))
+        # Get the requirement graph of packages to build, which is the reverse of their dependency
+        # graph
+        return cimple.graph.BuildGraph(self.graph.subgraph(pkgs_to_build, reverse=True))
+
+    def set_bin_pkg_sha256(self, pkg_id: pkg_models.BinPkgId, sha256: str) -> None:
+        """
+        Set the SHA256 of the tarball of a binary package.
+        """
+        if pkg_id in self.bootstrap_bin_pkg_map:
+            self.bootstrap_bin_pkg_map[pkg_id].sha256 = sha256
+        else:
+            self.bin_pkg_map[pkg_id].sha256 = sha256
+        self._merkle_tree = None
 
     def is_in_bootstrap(self, pkg_id: pkg_models.SrcPkgId) -> bool:
         """
@@ -542,19 +675,15 @@ class CimpleSnapshot:
         When they are identical, return None.
         When they are different, return the package ID where things are different.
         """
-        # Compare source packages
-        for pkg_id, pkg in self.src_pkg_map.items():
-            rhs_pkg = rhs.src_pkg_map.get(pkg_id)
-            if rhs_pkg is None or rhs_pkg != pkg:
-                return pkg_id
+        if self.merkle_tree().root_hash == rhs.merkle_tree().root_hash:
+            return None
+        return self.diff_pkgs_with(rhs)[0]
 
-        # Compare binary packages
-        for pkg_id, pkg in self.bin_pkg_map.items():
-            rhs_pkg = rhs.bin_pkg_map.get(pkg_id)
-            if rhs_pkg is None or rhs_pkg != pkg:
-                return pkg_id
-
-        return None
+    def diff_pkgs_with(self, rhs: CimpleSnapshot) -> list[pkg_models.PkgId]:
+        """
+        Get all packages that are only in one of the snapshots, or that differ between them.
+        """
+        return self.merkle_tree().diff(rhs.merkle_tree())
 
     def __eq__(self, rhs: typing.Any) -> bool:
         if not isinstance(rhs, CimpleSnapshot):
@@ -568,6 +697,331 @@ class CimpleSnapshot:
         )
 
 
+# Upper bound on the threads used to load and resolve package configs
+_RESOLVE_MAX_WORKERS = 16
+
+# Package ID, version, whether it is a bootstrap package
+type _ResolveKey = tuple[pkg_models.SrcPkgId, str, bool]
+type _ResolvedPkg = tuple[cimple.models.pkg_config.PkgConfig, cimple.pkg.core.PackageDependencies]
+
+
+def _resolve_pkgs(
+    pkgs: list[_ResolveKey],
+    *,
+    pkg_processor: cimple.pkg.ops.PkgOps,
+    pkg_index_path: pathlib.Path,
+) -> dict[_ResolveKey, _ResolvedPkg]:
+    """
+    Load the configs of the given packages and resolve their dependencies.
+
+    Each package is independent file I/O and validation, so they are processed on a thread pool.
+    """
+
+    def resolve(key: _ResolveKey) -> _ResolvedPkg:
+        pkg_id, pkg_version, bootstrap = key
+        with cimple.trace.span(
+            "resolve package", lambda: {"pkg": pkg_id.name, "version": pkg_version}
+        ):
+            config = cimple.models.pkg_config.load_pkg_config(pkg_index_path, pkg_id, pkg_version)
+            dependency_data = pkg_processor.resolve_dependencies(
+                pkg_id, pkg_version, pi_path=pkg_index_path, is_bootstrap=bootstrap
+            )
+        return config, dependency_data
+
+    max_workers = min(len(pkgs), _RESOLVE_MAX_WORKERS)
+    if max_workers <= 1:
+        return {key: resolve(key) for key in pkgs}
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # map yields in submission order and re-raises the first error in that order, so failures
+        # are reported the same way as when resolving sequentially
+        return dict(zip(pkgs, executor.map(resolve, pkgs), strict=True))
+
+
+# Every this many snapshots along an ancestor chain, a delta-encoded snapshot is stored in full
+SNAPSHOT_CHECKPOINT_INTERVAL = 16
+
+# Number of snapshots kept in memory by get_snapshot
+_SNAPSHOT_CACHE_SIZE = 4
+
+# Number of reconstructed snapshot states kept in memory, see _load_snapshot_state
+_SNAPSHOT_STATE_CACHE_SIZE = 32
+
+type _PkgKey = tuple[str, str]
+
+
+class _SnapshotState(typing.NamedTuple):
+    """
+    The content of a snapshot in its JSON form, with packages keyed by (pkg_type, name).
+
+    States are shared through the state cache, and must not be modified.
+    """
+
+    # Snapshot fields other than packages
+    metadata: dict[str, typing.Any]
+    pkgs: dict[_PkgKey, dict[str, typing.Any]]
+    bootstrap_pkgs: dict[_PkgKey, dict[str, typing.Any]]
+    # Number of deltas between this snapshot and the nearest full snapshot
+    depth: int
+
+
+_snapshot_states: collections.OrderedDict[tuple[str, int, int], _SnapshotState] = (
+    collections.OrderedDict()
+)
+# Only guards accesses to the state cache, states are loaded outside of it, as loading a delta
+# loads its ancestors
+_snapshot_states_lock = threading.Lock()
+
+
+_snapshot_cache: collections.OrderedDict[tuple[str, int, int], CimpleSnapshot] = (
+    collections.OrderedDict()
+)
+_snapshot_cache_lock = threading.Lock()
+
+
+def _snapshot_delta_path(name: str) -> pathlib.Path:
+    return cimple.constants.cimple_snapshot_dir / f"{name}.delta.json"
+
+
+def _stored_snapshot_path(name: str) -> pathlib.Path:
+    """
+    Get the path of the file storing a snapshot, which is its delta if it is not stored in full.
+    """
+    snapshot_path = cimple.constants.cimple_snapshot_dir / f"{name}.json"
+    if snapshot_path.exists():
+        return snapshot_path
+    return _snapshot_delta_path(name)
+
+
+def snapshot_exists(name: str) -> bool:
+    """
+    Check if a snapshot is stored, either in full or as a delta.
+    """
+    return _stored_snapshot_path(name).exists()
+
+
+def _pkgs_by_key(
+    pkgs: typing.Iterable[dict[str, typing.Any]],
+) -> dict[_PkgKey, dict[str, typing.Any]]:
+    return {(pkg["pkg_type"], pkg["name"]): pkg for pkg in pkgs}
+
+
+def _snapshot_state_from_full(data: dict[str, typing.Any]) -> _SnapshotState:
+    return _SnapshotState(
+        metadata={
+            key: value for key, value in data.items() if key not in ("pkgs", "bootstrap_pkgs")
+        },
+        pkgs=_pkgs_by_key(data["pkgs"]),
+        bootstrap_pkgs=_pkgs_by_key(data["bootstrap_pkgs"]),
+        depth=0,
+    )
+
+
+def _diff_pkgs(
+    pkgs: dict[_PkgKey, dict[str, typing.Any]], ancestor_pkgs: dict[_PkgKey, dict[str, typing.Any]]
+) -> tuple[list[dict[str, str]], list[dict[str, typing.Any]]]:
+    """
+    Get the packages removed from, and the packages added to or changed from the ancestor packages.
+    """
+    removed = [
+        {"name": name, "pkg_type": pkg_type}
+        for pkg_type, name in ancestor_pkgs.keys() - pkgs.keys()
+    ]
+    upserted = [pkg for key, pkg in pkgs.items() if ancestor_pkgs.get(key) != pkg]
+    return removed, upserted
+
+
+def _apply_pkgs_delta(
+    ancestor_pkgs: dict[_PkgKey, dict[str, typing.Any]],
+    removed: list[dict[str, str]],
+    upserted: list[dict[str, typing.Any]],
+) -> dict[_PkgKey, dict[str, typing.Any]]:
+    pkgs = dict(ancestor_pkgs)
+    for pkg_ref in removed:
+        del pkgs[(pkg_ref["pkg_type"], pkg_ref["name"])]
+    pkgs.update(_pkgs_by_key(upserted))
+    return pkgs
+
+
+def _dump_snapshot_delta(
+    path: pathlib.Path, state: _SnapshotState, ancestor_state: _SnapshotState
+) -> None:
+    removed_pkgs, upserted_pkgs = _diff_pkgs(state.pkgs, ancestor_state.pkgs)
+    removed_bootstrap_pkgs, upserted_bootstrap_pkgs = _diff_pkgs(
+        state.bootstrap_pkgs, ancestor_state.bootstrap_pkgs
+    )
+    delta_json = json.dumps(
+        {
+            "version": state.metadata["version"],
+            "name": state.metadata["name"],
+            "ancestor": state.metadata["ancestor"],
+            "depth": ancestor_state.depth + 1,
+            "changes": state.metadata["changes"],
+            "bootstrap_changes": state.metadata["bootstrap_changes"],
+            "removed_pkgs": removed_pkgs,
+            "removed_bootstrap_pkgs": removed_bootstrap_pkgs,
+            "upserted_pkgs": upserted_pkgs,
+            "upserted_bootstrap_pkgs": upserted_bootstrap_pkgs,
+        },
+        separators=(",", ":"),
+    ).encode()
+    with path.open("wb") as f:
+        f.write(delta_json)
+
+
+def _load_snapshot_state(name: str) -> _SnapshotState:
+    """
+    Load the content of a stored snapshot, replaying deltas from the nearest full snapshot if it is
+    delta-encoded.
+
+    Reconstructed states are cached by file name, modification time and size, so that snapshots
+    sharing an ancestor chain do not replay it again.
+
+    Package records are kept as decoded from the stored snapshot, without validating them, which
+    would take most of the time on big snapshots. They are validated when a snapshot is built from
+    them, see load_snapshot.
+    """
+    if name == "root":
+        no_changes = {"add": [], "remove": [], "update": []}
+        return _SnapshotState(
+            metadata={
+                "version": 0,
+                "name": "root",
+                "ancestor": None,
+                "changes": no_changes,
+                "bootstrap_changes": no_changes,
+            },
+            pkgs={},
+            bootstrap_pkgs={},
+            depth=0,
+        )
+
+    snapshot_path = _stored_snapshot_path(name)
+    if not snapshot_path.exists():
+        raise RuntimeError(f"Snapshot {name} does not exist!")
+    is_delta = snapshot_path == _snapshot_delta_path(name)
+
+    stat = snapshot_path.stat()
+    cache_key = (name, stat.st_mtime_ns, stat.st_size)
+    with _snapshot_states_lock:
+        state = _snapshot_states.get(cache_key)
+        if state is not None:
+            _snapshot_states.move_to_end(cache_key)
+            return state
+
+    try:
+        data = json.loads(snapshot_path.read_bytes())
+    except json.JSONDecodeError as e:
+        raise RuntimeError(f"Snapshot {name} is not valid JSON.") from e
+    if not isinstance(data, dict) or data.get("version") != 0:
+        raise RuntimeError(f"Snapshot {name} is not a snapshot of a supported version.")
+
+    if not is_delta:
+        state = _snapshot_state_from_full(data)
+    else:
+        delta = data
+        ancestor_state = _load_snapshot_state(delta["ancestor"])
+        state = _SnapshotState(
+            metadata={
+                "version": delta["version"],
+                "name": delta["name"],
+                "ancestor": delta["ancestor"],
+                "changes": delta["changes"],
+                "bootstrap_changes": delta["bootstrap_changes"],
+            },
+            pkgs=_apply_pkgs_delta(
+                ancestor_state.pkgs, delta["removed_pkgs"], delta["upserted_pkgs"]
+            ),
+            bootstrap_pkgs=_apply_pkgs_delta(
+                ancestor_state.bootstrap_pkgs,
+                delta["removed_bootstrap_pkgs"],
+                delta["upserted_bootstrap_pkgs"],
+            ),
+            depth=ancestor_state.depth + 1,
+        )
+
+    with _snapshot_states_lock:
+        _snapshot_states[cache_key] = state
+        if len(_snapshot_states) > _SNAPSHOT_STATE_CACHE_SIZE:
+            _snapshot_states.popitem(last=False)
+    return state
+
+
+def _diff_pkg_records(
+    from_pkgs: dict[_PkgKey, dict[str, typing.Any]],
+    to_pkgs: dict[_PkgKey, dict[str, typing.Any]],
+    *,
+    bootstrap: bool,
+) -> list[snapshot_models.SnapshotPkgDiff]:
+    """
+    Diff two sets of package records.
+
+    Source packages come first, then binary packages, each sorted by name.
+    """
+
+    def make_diff(
+        key: _PkgKey,
+        change: str,
+        from_pkg: dict[str, typing.Any] | None,
+        to_pkg: dict[str, typing.Any] | None,
+    ) -> snapshot_models.SnapshotPkgDiff:
+        value_field = "version" if key[0] == "src" else "sha256"
+        return snapshot_models.SnapshotPkgDiff.model_construct(
+            name=key[1],
+            pkg_type=key[0],
+            bootstrap=bootstrap,
+            change=change,
+            from_value=None if from_pkg is None else from_pkg[value_field],
+            to_value=None if to_pkg is None else to_pkg[value_field],
+        )
+
+    # Only the few differing packages are sorted, sorting all keys takes longer than diffing them
+    diffs: list[tuple[_PkgKey, snapshot_models.SnapshotPkgDiff]] = []
+    for key, from_pkg in from_pkgs.items():
+        to_pkg = to_pkgs.get(key)
+        if to_pkg is None:
+            diffs.append((key, make_diff(key, "removed", from_pkg, None)))
+        elif to_pkg != from_pkg:
+            if key[0] == "src" and from_pkg["version"] != to_pkg["version"]:
+                change = "version_changed"
+            elif key[0] == "bin" and from_pkg["sha256"] != to_pkg["sha256"]:
+                change = "sha256_changed"
+            else:
+                change = "depends_changed"
+            diffs.append((key, make_diff(key, change, from_pkg, to_pkg)))
+    for key in to_pkgs.keys() - from_pkgs.keys():
+        diffs.append((key, make_diff(key, "added", None, to_pkgs[key])))
+
+    diffs.sort(key=lambda item: (item[0][0] != "src", item[0][1]))
+    return [diff for _, diff in diffs]
+
+
+def diff_snapshots(from_name: str, to_name: str) -> list[snapshot_models.SnapshotPkgDiff]:
+    """
+    Get the packages added, removed or changed from one snapshot to another.
+
+    This works on the stored form of the snapshots, without building their dependency graphs.
+    """
+    with cimple.util.gc_paused():
+        from_state = _load_snapshot_state(from_name)
+        to_state = _load_snapshot_state(to_name)
+        return [
+            *_diff_pkg_records(from_state.pkgs, to_state.pkgs, bootstrap=False),
+            *_diff_pkg_records(from_state.bootstrap_pkgs, to_state.bootstrap_pkgs, bootstrap=True),
+        ]
+
+
+def load_binary_snapshot(name: str) -> cimple.snapshot.binary.BinarySnapshot | None:
+    """
+    Open the binary encoding of a snapshot, for lookups of individual packages without loading the
+    whole snapshot.
+
+    Returns None if the snapshot has no binary encoding, or if it does not match the snapshot.
+    """
+    snapshot_path = cimple.constants.cimple_snapshot_dir / f"{name}.json"
+    return cimple.snapshot.binary.open_binary_snapshot(snapshot_path)
+
+
 def load_snapshot(name: str) -> CimpleSnapshot:
     if name == "root":
         snapshot_data = snapshot_models.SnapshotModel(
@@ -581,7 +1035,57 @@ def load_snapshot(name: str) -> CimpleSnapshot:
         )
     else:
         snapshot_path = cimple.constants.cimple_snapshot_dir / f"{name}.json"
-        with snapshot_path.open("r") as f:
-            snapshot_data = snapshot_models.SnapshotModel.model_validate_json(f.read())
+        if not snapshot_path.exists() and _snapshot_delta_path(name).exists():
+            with cimple.util.gc_paused():
+                state = _load_snapshot_state(name)
+                # Package records are modified by snapshot operations, so each load constructs
+                # its own records from the shared state
+                snapshot_data = snapshot_models.SnapshotModel.model_validate(
+                    {
+                        **state.metadata,
+                        "pkgs": list(state.pkgs.values()),
+                        "bootstrap_pkgs": list(state.bootstrap_pkgs.values()),
+                    }
+                )
+                return CimpleSnapshot(snapshot_data)
+
+        snapshot_json = snapshot_path.read_bytes()
+
+        with cimple.util.gc_paused():
+            snapshot_data = snapshot_models.SnapshotModel.model_validate_json(snapshot_json)
+            return CimpleSnapshot(snapshot_data)
 
     return CimpleSnapshot(snapshot_data)
+
+
+def get_snapshot(name: str) -> CimpleSnapshot:
+    """
+    Get a snapshot shared by the whole process, loading it on first use.
+
+    The returned snapshot must not be modified, use load_snapshot to get a snapshot to modify.
+    Snapshots are cached by name, modification time and size of the stored snapshot, so a snapshot
+    that changed on disk is loaded again.
+    """
+    if name == "root":
+        cache_key = (name, 0, 0)
+    else:
+        stat = _stored_snapshot_path(name).stat()
+        cache_key = (name, stat.st_mtime_ns, stat.st_size)
+
+    # Loading under the lock makes concurrent callers wait for a single load of the snapshot
+    with _snapshot_cache_lock:
+        snapshot = _snapshot_cache.get(cache_key)
+        if snapshot is not None:
+            _snapshot_cache.move_to_end(cache_key)
+            return snapshot
+
+        snapshot = load_snapshot(name)
+
+        # Drop outdated versions of the snapshot
+        for stale_key in [key for key in _snapshot_cache if key[0] == name]:
+            del _snapshot_cache[stale_key]
+        _snapshot_cache[cache_key] = snapshot
+        if len(_snapshot_cache) > _SNAPSHOT_CACHE_SIZE:
+            _snapshot_cache.popitem(last=False)
+
+    return snapshot
@@ -0,0 +1,128 @@
+"""
+Merkle trees over snapshot packages.
+
+Packages are keyed by the SHA256 digest of their ID, and the tree is a trie over the hex digits of
+that digest: each inner node covers the packages whose key digest starts with a given prefix, and
+subtrees with few packages are stored as a single bucket. Keying by digest instead of by name keeps
+the tree balanced whatever the package names are, and makes its shape depend only on its content, so
+two trees can be compared node by node.
+"""
+
+import hashlib
+import itertools
+import typing
+
+from cimple.models import pkg as pkg_models
+
+if typing.TYPE_CHECKING:
+    from cimple.models import snapshot as snapshot_models
+
+# Subtrees with at most this many packages are stored as a single bucket
+_BUCKET_SIZE = 16
+
+# Hex key digest, package ID, hash of the package record
+type _Entry = tuple[str, pkg_models.PkgId, bytes]
+
+
+class _Node(typing.NamedTuple):
+    hash: bytes
+    # Child nodes by the next hex digit of the key digest, for inner nodes
+    children: dict[str, _Node] | None
+    # Record hashes by package ID, for buckets
+    leaves: dict[pkg_models.PkgId, bytes] | None
+
+
+def _key_digest(pkg_id: pkg_models.PkgId) -> str:
+    return hashlib.sha256(f"{pkg_id.type}:{pkg_id.name}".encode()).hexdigest()
+
+
+def _record_hash(pkg: snapshot_models.SnapshotSrcPkg | snapshot_models.SnapshotBinPkg) -> bytes:
+    return hashlib.sha256(pkg.model_dump_json().encode()).digest()
+
+
+def _build(entries: list[_Entry], depth: int) -> _Node:
+    """
+    Build the node covering the given entries, which are sorted by key digest and share its first
+    depth hex digits.
+    """
+    if len(entries) <= _BUCKET_SIZE or depth == 2 * hashlib.sha256().digest_size:
+        bucket_hash = hashlib.sha256(b"bucket")
+        for key_digest, _, record_hash in entries:
+            bucket_hash.update(key_digest.encode())
+            bucket_hash.update(record_hash)
+        return _Node(
+            bucket_hash.digest(), None, {pkg_id: record_hash for _, pkg_id, record_hash in entries}
+        )
+
+    children = {
+        digit: _build(list(group), depth + 1)
+        for digit, group in itertools.groupby(entries, key=lambda entry: entry[0][depth])
+    }
+    node_hash = hashlib.sha256(b"node")
+    for digit, child in children.items():
+        node_hash.update(digit.encode())
+        node_hash.update(child.hash)
+    return _Node(node_hash.digest(), children, None)
+
+
+def _leaves(node: _Node | None) -> dict[pkg_models.PkgId, bytes]:
+    if node is None:
+        return {}
+    if node.leaves is not None:
+        return node.leaves
+
+    assert node.children is not None
+    leaves: dict[pkg_models.PkgId, bytes] = {}
+    for child in node.children.values():
+        leaves.update(_leaves(child))
+    return leaves
+
+
+def _diff(lhs: _Node | None, rhs: _Node | None, different: set[pkg_models.PkgId]) -> None:
+    if lhs is not None and rhs is not None:
+        if lhs.hash == rhs.hash:
+            return
+
+        if lhs.children is not None and rhs.children is not None:
+            for digit in lhs.children.keys() | rhs.children.keys():
+                _diff(lhs.children.get(digit), rhs.children.get(digit), different)
+            return
+
+    # One side is a bucket or missing, compare the records under this node directly
+    lhs_leaves = _leaves(lhs)
+    rhs_leaves = _leaves(rhs)
+    different.update(
+        pkg_id
+        for pkg_id in lhs_leaves.keys() | rhs_leaves.keys()
+        if lhs_leaves.get(pkg_id) != rhs_leaves.get(pkg_id)
+    )
+
+
+class PkgMerkleTree:
+    """
+    A Merkle tree over package records.
+
+    Two trees are equal if and only if their root hashes are, and the packages that differ between
+    two trees are found by only descending into the subtrees whose hashes differ.
+    """
+
+    def __init__(
+        self, pkgs: typing.Iterable[snapshot_models.SnapshotSrcPkg | snapshot_models.SnapshotBinPkg]
+    ) -> None:
+        entries = [(_key_digest(pkg.id), pkg.id, _record_hash(pkg)) for pkg in pkgs]
+        entries.sort(key=lambda entry: entry[0])
+        self._root = _build(entries, 0)
+
+    @property
+    def root_hash(self) -> str:
+        return self._root.hash.hex()
+
+    def diff(self, other: PkgMerkleTree) -> list[pkg_models.PkgId]:
+        """
+        Get the packages that are only in one of the trees, or whose records differ.
+
+        Source packages come first, then binary packages, each sorted by name.
+        """
+        different: set[pkg_models.PkgId] = set()
+        _diff(self._root, other._root, different)
+        return sorted(different, key=lambda pkg_id: (pkg_id.type != "src", pkg_id.name))
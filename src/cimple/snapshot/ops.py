@@ -1,6 +1,7 @@
 import pathlib
 import tarfile
 import tempfile
+import time
 
 import pydantic
 
@@ -9,6 +10,9 @@ import cimple.models.pkg
 import cimple.models.snapshot
 import cimple.pkg.ops
 import cimple.snapshot.core
+import cimple.snapshot.plan
+import cimple.trace
+import cimple.workspace
 from cimple import constants, logging
 from cimple import hash as cimple_hash
 from cimple import tarfile as cimple_tarfile
@@ -28,6 +32,7 @@ def execute_build_graph(
     pkg_index_path: pathlib.Path,
     parallel: int,
     extra_paths: list[pathlib.Path] | None = None,
+    live_output: bool = False,
 ):
     """
     Execute the build graph.
@@ -38,37 +43,54 @@ def execute_build_graph(
 
         # Build package
         is_bootstrap = snapshot.is_in_bootstrap(next_pkg)
-        output_paths = pkg_processor.build_pkg(
-            next_pkg,
-            pi_path=pkg_index_path,
-            cimple_snapshot=snapshot,
-            build_options=cimple.pkg.ops.PackageBuildOptions(
-                parallel=parallel, extra_paths=extra_paths or []
+        package_version = snapshot.get_src_pkg(next_pkg).version
+        build_start = time.monotonic()
+        with (
+            cimple.trace.span(
+                "build package", lambda: {"pkg": next_pkg.name, "version": package_version}
             ),
-            bootstrap=is_bootstrap,
-        )
-
-        # Tar it up and add to pkg store
-        # Initially tar it up in a generic name because the sha cannot yet be determined
-        for binary_name, output_path in output_paths.items():
-            with tempfile.TemporaryDirectory() as tmp_dir:
-                tar_path = pathlib.Path(tmp_dir) / "pkg.tar.xz"
-                with tarfile.open(tar_path, "w:xz") as out_tar:
-                    # TODO: is TarFile.add deterministic?
-                    out_tar.add(output_path, ".", filter=cimple_tarfile.reproducible_add_filter)
-
-                # Move tarball to pkg store
-                tar_hash = cimple_hash.hash_file(tar_path, "sha256")
-                new_file_name = f"{binary_name}-{tar_hash}.tar.xz"
-                new_file_path = constants.cimple_pkg_dir / new_file_name
-                if new_file_path.exists():
-                    logging.info("Reusing %s", new_file_name)
-                else:
-                    _ = tar_path.rename(new_file_path)
-
-            # Commit SHA into snapshot
-            bin_pkg_id = cimple.models.pkg.BinPkgId(binary_name)
-            snapshot.bin_pkg_map[bin_pkg_id].sha256 = tar_hash
+            cimple.workspace.build_workspace(f"{next_pkg.name}-{package_version}") as workspace,
+        ):
+            output_paths = pkg_processor.build_pkg(
+                next_pkg,
+                pi_path=pkg_index_path,
+                cimple_snapshot=snapshot,
+                build_options=cimple.pkg.ops.PackageBuildOptions(
+                    parallel=parallel, extra_paths=extra_paths or [], live_output=live_output
+                ),
+                workspace=workspace,
+                bootstrap=is_bootstrap,
+            )
+
+            # Tar it up and add to pkg store
+            # Initially tar it up in a generic name because the sha cannot yet be determined
+            for binary_name, output_path in output_paths.items():
+                with tempfile.TemporaryDirectory() as tmp_dir:
+                    tar_path = pathlib.Path(tmp_dir) / "pkg.tar.xz"
+                    with (
+                        cimple.trace.span("compress", lambda: {"binary": binary_name}),
+                        tarfile.open(tar_path, "w:xz") as out_tar,
+                    ):
+                        # TODO: is TarFile.add deterministic?
+                        out_tar.add(output_path, ".", filter=cimple_tarfile.reproducible_add_filter)
+
+                    # Move tarball to pkg store
+                    with cimple.trace.span("hash", lambda: {"binary": binary_name}):
+                        tar_hash = cimple_hash.hash_file(tar_path, "sha256")
+                    new_file_name = f"{binary_name}-{tar_hash}.tar.xz"
+                    new_file_path = constants.cimple_pkg_dir / new_file_name
+                    with cimple.trace.span("commit to store", lambda: {"binary": binary_name}):
+                        if new_file_path.exists():
+                            logging.info("Reusing %s", new_file_name)
+                        else:
+                            _ = tar_path.rename(new_file_path)
+
+                # Commit SHA into snapshot
+                bin_pkg_id = cimple.models.pkg.BinPkgId(binary_name)
+                snapshot.set_bin_pkg_sha256(bin_pkg_id, tar_hash)
+
+        # Record how long the build took, to estimate future builds
+        cimple.snapshot.plan.record_build_duration(next_pkg, time.monotonic() - build_start)
 
         # Mark package as built in the build graph
         build_graph.mark_pkgs_built(next_pkg)
@@ -82,6 +104,7 @@ def process_changes(
     pkg_index_path: pathlib.Path,
     parallel: int,
     extra_paths: list[pathlib.Path] | None = None,
+    live_output: bool = False,
 ) -> None:
     """
     Process snapshot changes (add, remove, update).
@@ -104,6 +127,7 @@ def process_changes(
         pkg_index_path=pkg_index_path,
         parallel=parallel,
         extra_paths=extra_paths,
+        live_output=live_output,
     )
 
     # Make sure all binary packages are built, if not, there's a bug
@@ -0,0 +1,177 @@
+"""
+Build plans: what a build graph would build, in which order, and how long it would take.
+"""
+
+import heapq
+import os
+import statistics
+import typing
+
+import cimple.constants
+import cimple.graph
+import cimple.logging
+import cimple.util
+from cimple.models import build as build_models
+from cimple.models import pkg as pkg_models
+from cimple.models import snapshot as snapshot_models
+
+
+class BuildPlan(typing.NamedTuple):
+    # Source packages to build, grouped by the wave they can be built in. Every package in a wave
+    # only depends on packages of earlier waves.
+    waves: list[list[pkg_models.SrcPkgId]]
+    # Estimated wall time of building all packages one after the other, in seconds
+    serial_seconds: float
+    # Estimated wall time of building every package as soon as it can be built, in seconds
+    parallel_seconds: float
+    # Longest chain of packages that have to be built one after the other, with their estimated
+    # build times
+    critical_path: list[tuple[pkg_models.SrcPkgId, float]]
+    # Packages without a recorded build duration, estimated at the average of the others
+    unknown_duration_pkgs: list[pkg_models.SrcPkgId]
+
+    @property
+    def pkg_count(self) -> int:
+        return sum(len(wave) for wave in self.waves)
+
+
+def load_build_durations() -> dict[str, float]:
+    """
+    Load the recorded build durations of source packages on this machine.
+    """
+    durations_path = cimple.constants.cimple_build_durations_path
+    if not durations_path.exists():
+        return {}
+
+    try:
+        return snapshot_models.BuildDurationsModel.model_validate_json(
+            durations_path.read_bytes()
+        ).durations
+    except ValueError:
+        cimple.logging.warning("Ignoring invalid build durations %s", durations_path)
+        return {}
+
+
+def record_build_duration(pkg_id: pkg_models.SrcPkgId, seconds: float) -> None:
+    """
+    Record the duration of the latest build of a source package.
+
+    Concurrent builds record their durations one after the other, so that none of them is lost.
+    """
+    durations_path = cimple.constants.cimple_build_durations_path
+    with cimple.util.file_lock(durations_path.with_name(f"{durations_path.name}.lock")):
+        durations = load_build_durations()
+        durations[pkg_id.name] = seconds
+
+        tmp_path = durations_path.with_name(f"{durations_path.name}.{os.getpid()}.tmp")
+        tmp_path.write_text(
+            snapshot_models.BuildDurationsModel(version=0, durations=durations).model_dump_json()
+        )
+        tmp_path.replace(durations_path)
+
+
+def load_build_usage(pkg_id: pkg_models.SrcPkgId) -> build_models.PkgBuildUsage | None:
+    """
+    Load the resources used by the latest build of a source package on this machine, if recorded.
+    """
+    usage_path = cimple.constants.cimple_build_usage_dir / f"{pkg_id.name}.json"
+    if not usage_path.exists():
+        return None
+
+    try:
+        return build_models.PkgBuildUsage.model_validate_json(usage_path.read_bytes())
+    except ValueError:
+        cimple.logging.warning("Ignoring invalid build usage %s", usage_path)
+        return None
+
+
+def record_build_usage(pkg_id: pkg_models.SrcPkgId, usage: build_models.PkgBuildUsage) -> None:
+    """
+    Record the resources used by the latest build of a source package.
+    """
+    usage_path = cimple.constants.cimple_build_usage_dir / f"{pkg_id.name}.json"
+    usage_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = usage_path.with_name(f"{usage_path.name}.{os.getpid()}.tmp")
+    tmp_path.write_text(usage.model_dump_json())
+    tmp_path.replace(usage_path)
+
+
+def _simulate(
+    build_graph: cimple.graph.BuildGraph, durations: dict[pkg_models.SrcPkgId, float]
+) -> tuple[dict[pkg_models.SrcPkgId, float], dict[pkg_models.SrcPkgId, pkg_models.SrcPkgId]]:
+    """
+    Build every package of a copy of the build graph as soon as it is ready, with unlimited
+    builders.
+
+    Returns the time each package finishes building, and for each package the package whose build
+    made it ready, if any.
+    """
+    graph = cimple.graph.BuildGraph(build_graph.graph.subgraph(build_graph.graph.nodes()))
+    finish_times: dict[pkg_models.SrcPkgId, float] = {}
+    enabled_by: dict[pkg_models.SrcPkgId, pkg_models.SrcPkgId] = {}
+
+    # Packages being built, by the time they finish and then by name for a deterministic order
+    building: list[tuple[float, str, pkg_models.SrcPkgId]] = []
+
+    def start_ready_pkgs(now: float, enabling_pkg: pkg_models.SrcPkgId | None) -> None:
+        for pkg_id in graph.get_pkgs_to_build(max_count=len(graph.pkgs_ready_to_build)):
+            if enabling_pkg is not None:
+                enabled_by[pkg_id] = enabling_pkg
+            heapq.heappush(building, (now + durations[pkg_id], pkg_id.name, pkg_id))
+
+    start_ready_pkgs(0.0, None)
+    while building:
+        now, _, pkg_id = heapq.heappop(building)
+        finish_times[pkg_id] = now
+        graph.mark_pkgs_built(pkg_id)
+        start_ready_pkgs(now, pkg_id)
+
+    if not graph.is_empty():
+        raise RuntimeError("Build graph has packages that can never be built, it has a cycle.")
+    return finish_times, enabled_by
+
+
+def compute_build_plan(
+    build_graph: cimple.graph.BuildGraph, build_durations: dict[str, float]
+) -> BuildPlan:
+    """
+    Compute the build plan of a build graph, without building anything.
+
+    Build times are estimated from the recorded durations of previous builds of the same packages.
+    The parallel estimate assumes enough builders to build every package as soon as its
+    dependencies are built, and is the length of the critical path.
+    """
+    src_pkgs = sorted(
+        (pkg_id for pkg_id in build_graph.graph.nodes() if isinstance(pkg_id, pkg_models.SrcPkgId)),
+        key=lambda pkg_id: pkg_id.name,
+    )
+    unknown_duration_pkgs = [pkg_id for pkg_id in src_pkgs if pkg_id.name not in build_durations]
+    default_duration = statistics.fmean(build_durations.values()) if build_durations else 0.0
+    durations = {pkg_id: build_durations.get(pkg_id.name, default_duration) for pkg_id in src_pkgs}
+
+    # With every build taking one unit of time, packages finish building in their wave
+    unit_finish_times, _ = _simulate(build_graph, dict.fromkeys(durations, 1.0))
+    waves: list[list[pkg_models.SrcPkgId]] = [
+        [] for _ in range(int(max(unit_finish_times.values(), default=0)))
+    ]
+    for pkg_id in durations:
+        waves[int(unit_finish_times[pkg_id]) - 1].append(pkg_id)
+
+    finish_times, enabled_by = _simulate(build_graph, durations)
+    critical_path: list[tuple[pkg_models.SrcPkgId, float]] = []
+    if finish_times:
+        path_pkg: pkg_models.SrcPkgId | None = max(
+            finish_times, key=lambda pkg_id: (finish_times[pkg_id], pkg_id.name)
+        )
+        while path_pkg is not None:
+            critical_path.append((path_pkg, durations[path_pkg]))
+            path_pkg = enabled_by.get(path_pkg)
+        critical_path.reverse()
+
+    return BuildPlan(
+        waves=waves,
+        serial_seconds=sum(durations.values()),
+        parallel_seconds=max(finish_times.values(), default=0.0),
+        critical_path=critical_path,
+        unknown_duration_pkgs=unknown_duration_pkgs,
+    )
@@ -0,0 +1,137 @@
+import json
+import os
+import pathlib
+import shutil
+import time
+import typing
+
+import cimple.constants
+import cimple.hash
+import cimple.logging
+import cimple.system
+import cimple.util
+
+# ioctl request number of FICLONE on Linux, see ioctl_ficlone(2)
+_FICLONE = 0x40049409
+
+# Cached source trees not used for this long are removed when another source tree is cached
+SOURCE_CACHE_MAX_AGE_SECONDS = 30 * 24 * 60 * 60
+
+
+def source_tree_key(
+    orig_sha256: str, patch_sha256s: list[str], tarball_root_dir: str | None
+) -> str:
+    """
+    Returns the cache key of an extracted and patched source tree.
+
+    Patches are applied in order, so the order of patch hashes is part of the key.
+    """
+    key_data = json.dumps([orig_sha256, patch_sha256s, tarball_root_dir])
+    return cimple.hash.hash_bytes(key_data.encode(), "sha256")
+
+
+def _source_tree_lock_path(cache_path: pathlib.Path) -> pathlib.Path:
+    # Same lock as cimple.util.populate_directory_atomically takes to create the source tree
+    return cache_path.with_name(f".{cache_path.name}.lock")
+
+
+def get_source_tree(key: str, populate: typing.Callable[[pathlib.Path], None]) -> pathlib.Path:
+    """
+    Returns the cached source tree for the given key, creating it with `populate` if needed.
+
+    The returned tree is shared and read-only. Use `clone_source_tree` to get a writable copy to
+    build in.
+
+    The modification time of a cached source tree records when it was last used, so that source
+    trees that are not used anymore are removed, see SOURCE_CACHE_MAX_AGE_SECONDS.
+    """
+
+    def populate_read_only(source_dir: pathlib.Path) -> None:
+        populate(source_dir)
+        cimple.util.make_read_only(source_dir)
+
+    cache_path = cimple.constants.cimple_source_cache_dir / key
+    # Marking the source tree as used under its lock keeps it from being pruned concurrently
+    with cimple.util.file_lock(_source_tree_lock_path(cache_path)):
+        cached = cache_path.is_dir()
+        if cached:
+            os.utime(cache_path)
+    if cached:
+        cimple.logging.info("Using cached source tree %s", key)
+        return cache_path
+
+    if cimple.util.populate_directory_atomically(cache_path, populate_read_only):
+        cimple.logging.info("Cached source tree %s", key)
+        prune_source_cache()
+    else:
+        cimple.logging.info("Using cached source tree %s", key)
+    return cache_path
+
+
+def prune_source_cache() -> None:
+    """
+    Remove cached source trees that were not used for SOURCE_CACHE_MAX_AGE_SECONDS.
+
+    Source trees being created or used by other processes are skipped.
+    """
+    source_cache_dir = cimple.constants.cimple_source_cache_dir
+    if not source_cache_dir.is_dir():
+        return
+
+    oldest_mtime = time.time() - SOURCE_CACHE_MAX_AGE_SECONDS
+    for cache_path in source_cache_dir.iterdir():
+        # Skip locks and temporary directories of source trees being created
+        if cache_path.name.startswith(".") or not cache_path.is_dir():
+            continue
+
+        with cimple.util.file_lock(_source_tree_lock_path(cache_path), blocking=False) as locked:
+            if not locked or not cache_path.is_dir():
+                continue
+            if cache_path.stat().st_mtime < oldest_mtime:
+                cimple.logging.info("Removing unused source tree %s", cache_path.name)
+                cimple.util.remove_tree(cache_path)
+
+
+def clean_source_cache() -> None:
+    """
+    Remove all cached source trees.
+    """
+    if cimple.constants.cimple_source_cache_dir.is_dir():
+        # Cached source trees are read-only
+        cimple.util.remove_tree(cimple.constants.cimple_source_cache_dir)
+
+
+def _clone_file(src: str, dst: str) -> None:
+    """
+    Copy a file, sharing the underlying data blocks when the filesystem supports it.
+    """
+    if cimple.system.platform_name().startswith("linux-"):
+        import fcntl
+
+        try:
+            with pathlib.Path(src).open("rb") as src_file, pathlib.Path(dst).open("wb") as dst_file:
+                # pyrefly: ignore[missing-attribute]
+                fcntl.ioctl(dst_file.fileno(), _FICLONE, src_file.fileno())
+                cloned = os.fstat(dst_file.fileno()).st_size == os.fstat(src_file.fileno()).st_size
+            if cloned:
+                shutil.copystat(src, dst)
+                return
+        except OSError:
+            # Reflinks are not supported across filesystems or on e.g. ext4, fall back to a copy
+            pass
+
+    shutil.copy2(src, dst)
+
+
+def clone_source_tree(cache_path: pathlib.Path, build_dir: pathlib.Path) -> None:
+    """
+    Clone a cached source tree into an existing build directory.
+
+    Files are cloned with reflinks where supported, and copied otherwise. Hard links are
+    deliberately not used, as builds are free to modify their source tree in place.
+    """
+    shutil.copytree(
+        cache_path, build_dir, symlinks=True, copy_function=_clone_file, dirs_exist_ok=True
+    )
+    # The cached tree is read-only, and so are the copied permissions
+    cimple.util.fix_permissions(build_dir)
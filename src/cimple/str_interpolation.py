@@ -1,84 +1,103 @@
-def _find_index_first_of(input_str: str, chars: str, start_index: int = 0) -> int:
-    """
-    Find the index of the first occurrence of any one of the characters in chars.
-
-    Return < 0 if the chars are not found.
-    """
+import functools
+import re
 
-    for index in range(start_index, len(input_str)):
-        if input_str[index] in chars:
-            return index
+_SPECIAL_CHARS = re.compile(r"[\\$]")
 
-    return -1
+# Number of compiled templates kept around, templates are typically reused across all rules of a
+# package and across packages
+_TEMPLATE_CACHE_SIZE = 4096
 
 
-def interpolate(input_str: str, context: dict[str, str]) -> str:
+class Template:
     """
-    Interpolate a string against a context.
+    A string compiled for interpolation.
 
     Variables are referred to as ${variable}.
 
     Literal $ and \\ are escaped with leading \\.
     """
 
-    result_str = ""
+    __slots__ = ("_parts", "variables")
+
+    def __init__(self, template_str: str) -> None:
+        # Literal text and variable names, alternating, starting and ending with literal text
+        self._parts: tuple[str, ...] = tuple(_parse(template_str))
+        # Names of the variables used by the template
+        self.variables: frozenset[str] = frozenset(self._parts[1::2])
+
+    def render(self, context: dict[str, str]) -> str:
+        """
+        Render the template against a context.
+        """
+        if len(self._parts) == 1:
+            return self._parts[0]
 
-    def escape_char(char: str) -> str:
-        match char:
-            case "\\":
-                return "\\"
-            case "$":
-                return "$"
-            case _:
+        parts = list(self._parts)
+        for index in range(1, len(parts), 2):
+            variable_name = parts[index]
+            if variable_name not in context:
+                raise RuntimeError(f"Undefined variable {variable_name}.")
+            parts[index] = context[variable_name]
+        return "".join(parts)
+
+
+def _parse(template_str: str) -> list[str]:
+    parts: list[str] = []
+    literal_parts: list[str] = []
+    index = 0
+    while (match := _SPECIAL_CHARS.search(template_str, index)) is not None:
+        special_index = match.start()
+        literal_parts.append(template_str[index:special_index])
+
+        if template_str[special_index] == "\\":
+            if special_index + 1 >= len(template_str):
+                raise RuntimeError("Malformed escape sequence. Do you mean to escape \\ with \\\\?")
+            escaped_char = template_str[special_index + 1]
+            if escaped_char not in "\\$":
                 raise RuntimeError(
-                    f'Invalid escape sequence "\\{char}". Do you mean to escape \\ with \\\\?'
+                    f'Invalid escape sequence "\\{escaped_char}". '
+                    "Do you mean to escape \\ with \\\\?"
                 )
+            literal_parts.append(escaped_char)
+            index = special_index + 2
+            continue
 
-    def substitute_variable(start_index: int) -> tuple[str, int]:
-        malformed_use_of_variable_error = (
-            "Malformed use of variable. "
-            "Variables are used as ${variable}. Do you mean to escape $ with \\$?"
-        )
-        if start_index >= len(input_str) or input_str[start_index] != "{":
-            raise RuntimeError(malformed_use_of_variable_error)
         # Use variable
-        variable_end_index = _find_index_first_of(input_str, "}", start_index=start_index)
-        if variable_end_index <= start_index:
+        variable_start_index = special_index + 1
+        if not template_str.startswith("{", variable_start_index):
+            raise RuntimeError(
+                "Malformed use of variable. "
+                "Variables are used as ${variable}. Do you mean to escape $ with \\$?"
+            )
+        variable_end_index = template_str.find("}", variable_start_index)
+        if variable_end_index < 0:
             raise RuntimeError(
                 "Malformed use of variable. Cannot find matching } denoting the end of variable."
             )
-        variable_name = input_str[start_index + 1 : variable_end_index]
-        if variable_name not in context:
-            raise RuntimeError(f"Undefined variable {variable_name}.")
-        return context[variable_name], variable_end_index + 1
-
-    def consume_plain_text(start_index: int) -> tuple[str, int]:
-        special_char_index = _find_index_first_of(input_str, "\\$", start_index=start_index)
-        plain_text_value = (
-            input_str[start_index:]
-            if special_char_index < 0
-            else input_str[start_index:special_char_index]
-        )
-        return plain_text_value, special_char_index
-
-    plain_text, next_index = consume_plain_text(0)
-    result_str += plain_text
-
-    while next_index >= 0:
-        match input_str[next_index]:
-            case "\\":
-                if next_index + 1 < len(input_str):
-                    result_str += escape_char(input_str[next_index + 1])
-                    next_index += 2
-                else:
-                    raise RuntimeError(
-                        "Malformed escape sequence. Do you mean to escape \\ with \\\\?"
-                    )
-            case "$":
-                variable_value, next_index = substitute_variable(next_index + 1)
-                result_str += variable_value
-
-        plain_text, next_index = consume_plain_text(next_index)
-        result_str += plain_text
-
-    return result_str
+        parts.append("".join(literal_parts))
+        parts.append(template_str[variable_start_index + 1 : variable_end_index])
+        literal_parts = []
+        index = variable_end_index + 1
+
+    literal_parts.append(template_str[index:])
+    parts.append("".join(literal_parts))
+    return parts
+
+
+@functools.lru_cache(maxsize=_TEMPLATE_CACHE_SIZE)
+def compile_template(template_str: str) -> Template:
+    """
+    Compile a string for interpolation, reusing previously compiled templates.
+    """
+    return Template(template_str)
+
+
+def interpolate(input_str: str, context: dict[str, str]) -> str:
+    """
+    Interpolate a string against a context.
+
+    Variables are referred to as ${variable}.
+
+    Literal $ and \\ are escaped with leading \\.
+    """
+    return compile_template(input_str).render(context)
@@ -0,0 +1,130 @@
+"""
+Tracing of builds, written as Chrome trace events that can be loaded in Perfetto or
+chrome://tracing.
+"""
+
+import contextlib
+import json
+import os
+import threading
+import time
+import typing
+
+if typing.TYPE_CHECKING:
+    import pathlib
+    from collections.abc import Callable, Iterator
+
+
+class Tracer:
+    """
+    Collects spans of all threads, each thread being its own track.
+    """
+
+    def __init__(self) -> None:
+        self._start_ns = time.perf_counter_ns()
+        self._pid = os.getpid()
+        self._events: list[dict[str, typing.Any]] = []
+        # Track of each thread, by thread identifier
+        self._tracks: dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def _track(self) -> int:
+        """
+        Get the track of the current thread, naming it after the thread the first time.
+
+        Must be called with the lock held.
+        """
+        thread = threading.current_thread()
+        track = self._tracks.get(thread.ident or 0)
+        if track is None:
+            track = len(self._tracks)
+            self._tracks[thread.ident or 0] = track
+            self._events.append(
+                {
+                    "name": "thread_name",
+                    "ph": "M",
+                    "pid": self._pid,
+                    "tid": track,
+                    "args": {"name": thread.name},
+                }
+            )
+        return track
+
+    @contextlib.contextmanager
+    def span(self, name: str, args: dict[str, typing.Any]) -> Iterator[None]:
+        """
+        Record a span on the track of the current thread, for the duration of the context.
+        """
+        start_ns = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            end_ns = time.perf_counter_ns()
+            with self._lock:
+                self._events.append(
+                    {
+                        "name": name,
+                        "ph": "X",
+                        # Timestamps and durations of trace events are in microseconds
+                        "ts": (start_ns - self._start_ns) / 1000,
+                        "dur": (end_ns - start_ns) / 1000,
+                        "pid": self._pid,
+                        "tid": self._track(),
+                        "args": args,
+                    }
+                )
+
+    def dump(self, trace_path: pathlib.Path) -> None:
+        """
+        Write all spans recorded so far as a Chrome trace file.
+        """
+        with self._lock:
+            events = list(self._events)
+        trace_path.parent.mkdir(parents=True, exist_ok=True)
+        trace_path.write_text(json.dumps({"traceEvents": events, "displayTimeUnit": "ms"}))
+
+
+# Tracer of the current build, if tracing is enabled
+_tracer: Tracer | None = None
+
+# Spans are no-ops when tracing is disabled, and share a single reusable context
+_null_span = contextlib.nullcontext()
+
+
+def span(
+    name: str, args: Callable[[], dict[str, typing.Any]] | None = None
+) -> contextlib.AbstractContextManager[None]:
+    """
+    Trace the duration of a context as a span named name, with the args returned by args shown
+    alongside it.
+
+    This is a no-op when tracing is disabled, and args is then not called, so building the args
+    costs nothing unless tracing.
+    """
+    tracer = _tracer
+    if tracer is None:
+        return _null_span
+    return tracer.span(name, {} if args is None else args())
+
+
+@contextlib.contextmanager
+def tracing(trace_path: pathlib.Path | None) -> Iterator[None]:
+    """
+    Trace spans within the context, and write them to trace_path on exit, also when it fails.
+
+    Tracing is disabled if trace_path is None.
+    """
+    global _tracer
+
+    if trace_path is None:
+        yield
+        return
+
+    assert _tracer is None, "Tracing is already enabled"
+    tracer = Tracer()
+    _tracer = tracer
+    try:
+        yield
+    finally:
+        _tracer = None
+        tracer.dump(trace_path)
@@ -0,0 +1,149 @@
+import atexit
+import contextlib
+import os
+import pathlib
+import queue
+import secrets
+import tempfile
+import threading
+
+import cimple.constants
+import cimple.logging
+import cimple.util
+
+
+def _owner_lock_path(owner_path: pathlib.Path) -> pathlib.Path:
+    return owner_path.with_name(f"{owner_path.name}.lock")
+
+
+class _TrashCollector:
+    """
+    Deletes trashed directories on a background thread.
+
+    Every process trashes directories into its own owner directory in the trash, and holds the lock
+    of that directory for as long as it runs. Owner directories whose lock is free belong to
+    processes that exited before finishing deletion, and are reclaimed by the next process to use
+    the trash.
+    """
+
+    def __init__(self) -> None:
+        self.queue: queue.Queue[pathlib.Path] = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread: threading.Thread | None = None
+        self.owner_path: pathlib.Path | None = None
+        # Locks of the owner directories of this process, held until exit
+        self._owner_locks = contextlib.ExitStack()
+
+    def _run(self) -> None:
+        while True:
+            path = self.queue.get()
+            try:
+                cimple.util.remove_tree(path)
+            except OSError as e:
+                cimple.logging.warning("Failed to delete %s: %s", path, e)
+            finally:
+                self.queue.task_done()
+
+    def _reclaim(self, owner_path: pathlib.Path) -> None:
+        """
+        Take over the trash of processes that exited before finishing deletion.
+        """
+        for path in owner_path.parent.iterdir():
+            if path == owner_path or not path.is_dir():
+                continue
+
+            lock_path = _owner_lock_path(path)
+            with cimple.util.file_lock(lock_path, blocking=False) as abandoned:
+                if not abandoned:
+                    continue
+                reclaimed_path = owner_path / path.name
+                try:
+                    path.rename(reclaimed_path)
+                except FileNotFoundError:
+                    # Reclaimed by another process first
+                    continue
+            self.queue.put(reclaimed_path)
+            # Lock files cannot be removed while they are open on Windows, so only remove it once
+            # the lock is released. Whoever takes the lock in the meantime finds nothing to reclaim.
+            with contextlib.suppress(OSError):
+                lock_path.unlink(missing_ok=True)
+
+    def get_owner_path(self) -> pathlib.Path:
+        """
+        Get the owner directory of this process, setting it up on first use.
+        """
+        trash_dir = cimple.constants.cimple_trash_dir
+        with self.lock:
+            # Set up again if the trash directory changed or was removed since
+            if (
+                self.owner_path is not None
+                and self.owner_path.parent == trash_dir
+                and self.owner_path.is_dir()
+            ):
+                return self.owner_path
+
+            cimple.util.ensure_path(trash_dir)
+            owner_path = trash_dir / f"{os.getpid()}-{secrets.token_hex(8)}"
+            # The lock is taken before the directory exists, so that other processes never see
+            # the directory of a running process without its lock held
+            self._owner_locks.enter_context(cimple.util.file_lock(_owner_lock_path(owner_path)))
+            owner_path.mkdir()
+            self.owner_path = owner_path
+
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="cimple-trash", daemon=True)
+                self.thread.start()
+                # Make sure deletion finishes before the process exits
+                atexit.register(self.close)
+
+            self._reclaim(owner_path)
+            return owner_path
+
+    def schedule(self, path: pathlib.Path) -> None:
+        self.queue.put(path)
+
+    def wait(self) -> None:
+        self.queue.join()
+
+    def close(self) -> None:
+        """
+        Finish deletion, and remove the owner directory of this process.
+        """
+        self.wait()
+        with self.lock:
+            if self.owner_path is not None:
+                with contextlib.suppress(OSError):
+                    self.owner_path.rmdir()
+            self._owner_locks.close()
+            if self.owner_path is not None:
+                with contextlib.suppress(OSError):
+                    _owner_lock_path(self.owner_path).unlink(missing_ok=True)
+            self.owner_path = None
+
+
+_collector = _TrashCollector()
+
+
+def move_to_trash(path: pathlib.Path) -> None:
+    """
+    Move a directory into the trash, and delete it on a background thread.
+
+    The directory is gone from its original location as soon as this returns.
+    """
+    # Each trashed directory gets a unique container, so names never collide
+    trash_path = pathlib.Path(
+        tempfile.mkdtemp(prefix=f"{path.name}-", dir=_collector.get_owner_path())
+    )
+    try:
+        path.rename(trash_path / path.name)
+    except OSError:
+        trash_path.rmdir()
+        raise
+    _collector.schedule(trash_path)
+
+
+def wait_for_trash() -> None:
+    """
+    Block until all trashed directories of this process are deleted.
+    """
+    _collector.wait()
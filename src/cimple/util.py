@@ -1,9 +1,17 @@
-import shutil
+import contextlib
+import errno
+import gc
+import pathlib
 import stat
+import sys
+import tempfile
+import time
 import typing
 
+import cimple.trash
+
 if typing.TYPE_CHECKING:
-    import pathlib
+    import collections.abc
 
 
 def ensure_path(path: pathlib.Path):
@@ -16,23 +24,68 @@ def ensure_path(path: pathlib.Path):
         raise RuntimeError(f"Unexpected: {path} is not a directory")
 
 
-def clear_path(path: pathlib.Path):
+def clear_path(path: pathlib.Path, *, background: bool = False):
     """
     Clears the given path.
+
+    With `background`, the old content is atomically moved into the trash and deleted on a
+    background thread, so that the path is empty as soon as this returns.
     """
 
     if path.exists():
-        try:
-            shutil.rmtree(path)
-        except PermissionError:
-            fix_permissions(path)
-            shutil.rmtree(path)
+        if background:
+            try:
+                cimple.trash.move_to_trash(path)
+            except OSError:
+                # The trash is probably on a different filesystem
+                remove_tree(path)
+        else:
+            remove_tree(path)
 
     path.mkdir(parents=True)
 
 
+def remove_tree(path: pathlib.Path):
+    """
+    Removes a directory tree, fixing permissions along the way.
+
+    Files and directories are made writable as they are visited, so the tree is only walked once.
+    Entries that disappear concurrently are ignored.
+    """
+    if path.is_symlink() or not path.is_dir():
+        path.unlink(missing_ok=True)
+        return
+
+    visited_dirs: list[pathlib.Path] = []
+    # Symlinks to directories are listed as files, and are never followed
+    for dir_path, _, file_names in path.walk():
+        # Entries of a read-only directory cannot be removed
+        with contextlib.suppress(FileNotFoundError):
+            _add_write_permission(dir_path)
+        visited_dirs.append(dir_path)
+
+        for file_name in file_names:
+            file_path = dir_path / file_name
+            try:
+                file_path.unlink(missing_ok=True)
+            except PermissionError:
+                # Read-only files cannot be removed on Windows
+                _add_write_permission(file_path)
+                file_path.unlink(missing_ok=True)
+
+    for dir_path in reversed(visited_dirs):
+        with contextlib.suppress(FileNotFoundError):
+            dir_path.rmdir()
+
+
+def _add_write_permission(path: pathlib.Path):
+    mode = path.lstat().st_mode
+    if not mode & stat.S_IWUSR:
+        path.chmod(mode | stat.S_IWUSR)
+
+
 def fix_permissions(path: pathlib.Path):
-    for item in path.rglob("*"):
+    for item in (path, *path.rglob("*")):
         if item.is_file() or item.is_dir():
             # Get current permissions
             mode = item.stat().st_mode
@@ -40,3 +93,122 @@ def fix_permissions(path: pathlib.Path):
             # Add user/group/other execute bits
             writable_mode = mode | stat.S_IWUSR
             item.chmod(writable_mode)
+
+
+def make_read_only(path: pathlib.Path):
+    """
+    Remove write permissions from everything under the given path, including the path itself.
+
+    This is the inverse of `fix_permissions`.
+    """
+    write_bits = stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH
+    for item in (*path.rglob("*"), path):
+        if (item.is_file() or item.is_dir()) and not item.is_symlink():
+            item.chmod(item.stat().st_mode & ~write_bits)
+
+
+@contextlib.contextmanager
+def gc_paused() -> collections.abc.Generator[None]:
+    """
+    Pause the cyclic garbage collector.
+
+    Building large object graphs, such as a loaded snapshot, otherwise triggers many collections
+    that have nothing to collect.
+    """
+    was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if was_enabled:
+            gc.enable()
+
+
+@contextlib.contextmanager
+def file_lock(lock_path: pathlib.Path, *, blocking: bool = True) -> collections.abc.Generator[bool]:
+    """
+    Hold an exclusive inter-process lock on the given lock file.
+
+    The lock is released by the OS if the process dies, so a crashed process never leaves a stale
+    lock behind.
+
+    Without `blocking`, the lock is only taken if it is free, and the context gets whether it was
+    taken.
+    """
+    ensure_path(lock_path.parent)
+    with lock_path.open("a+b") as f:
+        # Type checkers only know the locking functions of the platform they check for, so branch
+        # on sys.platform for them to narrow
+        if sys.platform == "win32":
+            import msvcrt
+
+            # LK_NBLCK fails immediately if the lock is held, so poll until it is released
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError as e:
+                    if e.errno not in (errno.EACCES, errno.EDEADLK):
+                        raise
+                    if not blocking:
+                        yield False
+                        return
+                    time.sleep(0.1)
+            try:
+                yield True
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+
+            try:
+                fcntl.flock(
+                    f.fileno(), fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+                )
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def populate_directory_atomically(
+    target_path: pathlib.Path, populate: typing.Callable[[pathlib.Path], None]
+) -> bool:
+    """
+    Create a directory exactly once, even with concurrent callers across processes.
+
+    `populate` fills a temporary directory next to `target_path`, which is then renamed into place.
+    All of this happens under a lock, so callers either see a complete directory or wait for one.
+    Leftovers of interrupted attempts are removed first.
+
+    Returns True if this call created the directory, False if it already existed.
+    """
+    if target_path.is_dir():
+        return False
+
+    parent_path = target_path.parent
+    ensure_path(parent_path)
+    with file_lock(parent_path / f".{target_path.name}.lock"):
+        # Another process might have created the directory while we were waiting for the lock
+        if target_path.is_dir():
+            return False
+
+        for stale_path in parent_path.glob(f".{target_path.name}-*.tmp"):
+            remove_tree(stale_path)
+
+        tmp_path = pathlib.Path(
+            tempfile.mkdtemp(prefix=f".{target_path.name}-", suffix=".tmp", dir=parent_path)
+        )
+        try:
+            populate(tmp_path)
+        except BaseException:
+            remove_tree(tmp_path)
+            raise
+        tmp_path.rename(target_path)
+
+    return True
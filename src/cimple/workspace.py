@@ -0,0 +1,88 @@
+import contextlib
+import dataclasses
+import pathlib
+import tempfile
+import typing
+
+import cimple.constants
+import cimple.logging
+import cimple.trash
+import cimple.util
+
+if typing.TYPE_CHECKING:
+    import collections.abc
+
+
+@dataclasses.dataclass(frozen=True)
+class Workspace:
+    """
+    Directories used by a single package build. Every build gets a unique workspace.
+    """
+
+    path: pathlib.Path
+
+    @property
+    def build_dir(self) -> pathlib.Path:
+        return self.path / "build"
+
+    @property
+    def output_dir(self) -> pathlib.Path:
+        return self.path / "output"
+
+    @property
+    def deps_dir(self) -> pathlib.Path:
+        return self.path / "deps"
+
+
+def allocate_workspace(name: str) -> Workspace:
+    """
+    Allocate a new, empty workspace.
+    """
+    cimple.util.ensure_path(cimple.constants.cimple_workspace_dir)
+
+    # Colon is not a valid character in a path on Windows
+    prefix = name.replace(":", "-")
+    workspace = Workspace(
+        pathlib.Path(
+            tempfile.mkdtemp(prefix=f"{prefix}-", dir=cimple.constants.cimple_workspace_dir)
+        )
+    )
+    workspace.build_dir.mkdir()
+    workspace.output_dir.mkdir()
+    workspace.deps_dir.mkdir()
+    return workspace
+
+
+def recycle_workspace(workspace: Workspace) -> None:
+    """
+    Recycle a workspace that is no longer needed. Deletion happens in the background.
+
+    A workspace that cannot be recycled is left in place, as it does not affect the build it was
+    used for.
+    """
+    try:
+        cimple.trash.move_to_trash(workspace.path)
+    except OSError as e:
+        cimple.logging.warning("Failed to recycle workspace %s: %s", workspace.path, e)
+
+
+@contextlib.contextmanager
+def build_workspace(name: str) -> collections.abc.Generator[Workspace]:
+    """
+    Allocate a workspace for the duration of a build.
+
+    The workspace is recycled once the build succeeds. Workspaces of failed builds are kept for
+    inspection until `cimple clean workspaces` is run.
+    """
+    workspace = allocate_workspace(name)
+    try:
+        yield workspace
+    except BaseException:
+        cimple.logging.error("Build workspace is kept at %s", workspace.path)
+        raise
+    recycle_workspace(workspace)
+
+
+def clean_workspaces():
+    if cimple.constants.cimple_workspace_dir.is_dir():
+        cimple.util.remove_tree(cimple.constants.cimple_workspace_dir)
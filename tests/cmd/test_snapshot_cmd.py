@@ -1,8 +1,10 @@
+import json
 import pathlib
 
 import pytest
 
 import cimple
+import cimple.models.pkg
 import cimple.models.snapshot
 from cimple.cmd import snapshot as snapshot_cmd
 from cimple.models import snapshot as snapshot_models
@@ -92,6 +94,7 @@ def test_snapshot_change(mocker):
         pkg_index_path=pkg_index_path,
         parallel=2,
         extra_paths=[],
+        live_output=False,
     )
 
 
@@ -103,6 +106,10 @@ def test_snapshot_reproduce(mocker):
         "cimple.cmd.snapshot.snapshot_core.load_snapshot",
         side_effect=load_snapshot_side_effect,
     )
+    get_snapshot_mock = mocker.patch(
+        "cimple.cmd.snapshot.snapshot_core.get_snapshot",
+        side_effect=load_snapshot_side_effect,
+    )
 
     # GIVEN: mocked out process_changes to track its invocation
     process_changes_mock = mocker.patch("cimple.cmd.snapshot.cimple.snapshot.ops.process_changes")
@@ -120,9 +127,9 @@ def test_snapshot_reproduce(mocker):
         parallel=1,
     )
 
-    # THEN: load is called on both target snapshot and root
-    load_snapshot_mock.assert_any_call(snapshot_name)
-    load_snapshot_mock.assert_any_call("root")
+    # THEN: root is loaded to be modified, and the target snapshot is only read
+    load_snapshot_mock.assert_called_once_with("root")
+    get_snapshot_mock.assert_called_once_with(snapshot_name)
 
     # THEN: process_changes is called to reproduce the target snapshot
     process_changes_mock.assert_called_once_with(
@@ -141,6 +148,7 @@ def test_snapshot_reproduce(mocker):
         ),
         pkg_index_path=pkg_index_path,
         parallel=1,
+        live_output=False,
     )
 
     # THEN: compare_pkgs_with is called on the root snapshot with the dummy snapshot
@@ -152,3 +160,46 @@ def test_snapshot_reproduce(mocker):
     first_call = compare_spy.call_args_list[0]
     assert first_call[0][0] == root_snapshot_value
     assert first_call[0][1] == dummy_snapshot_value
+
+
+@pytest.mark.usefixtures("basic_cimple_store")
+def test_snapshot_diff(mocker, capsys: pytest.CaptureFixture[str]):
+    # GIVEN: a snapshot derived from another one with a few changes
+    snapshot = snapshot_core.load_snapshot("test-snapshot")
+    snapshot.remove_pkg(cimple.models.pkg.SrcPkgId("pkg1"))
+    snapshot.src_pkg_map[cimple.models.pkg.SrcPkgId("pkg3")].version = "2.0-1"
+    snapshot.set_bin_pkg_sha256(cimple.models.pkg.BinPkgId("pkg4-bin"), "0" * 64)
+    snapshot.add_src_pkg(cimple.models.pkg.SrcPkgId("pkg5"), "1.0-1", [])
+    datetime_mock = mocker.patch("cimple.snapshot.core.datetime")
+    datetime_mock.datetime.now.return_value.strftime.return_value = "changed"
+    snapshot.dump_snapshot()
+
+    # WHEN: diffing the snapshots
+    snapshot_cmd.diff("test-snapshot", "changed", json_output=True)
+
+    # THEN: all changes are reported, source packages first
+    pkg_diffs = json.loads(capsys.readouterr().out)
+    assert [(pkg_diff["name"], pkg_diff["change"]) for pkg_diff in pkg_diffs] == [
+        ("pkg1", "removed"),
+        ("pkg3", "version_changed"),
+        ("pkg5", "added"),
+        ("pkg1-bin", "removed"),
+        ("pkg4-bin", "sha256_changed"),
+    ]
+    assert pkg_diffs[1]["from_value"] == "1.0-1"
+    assert pkg_diffs[1]["to_value"] == "2.0-1"
+
+    # WHEN: diffing the snapshots for humans
+    snapshot_cmd.diff("test-snapshot", "changed")
+
+    # THEN: each change is on its own line
+    assert capsys.readouterr().out.splitlines() == [
+        "- src pkg1 1.0-1",
+        "~ src pkg3 1.0-1 -> 2.0-1",
+        "+ src pkg5 1.0-1",
+        "- bin pkg1-bin a4defb8341593d4deea245993aeb3ce54de060affb10cb9ae60ec3789dd3f241",
+        (
+            "~ bin pkg4-bin 6f4817737b3650965c73f0264d10673527bfde1fb4cbcb3f4a0fa357ff5a1a56"
+            f" -> {'0' * 64}"
+        ),
+    ]
@@ -5,11 +5,18 @@ import typing
 import pytest
 
 import cimple.constants
+import cimple.env
+import cimple.graph
+import cimple.models.pkg_config
 import cimple.models.stream
+import cimple.trash
 from cimple.models import pkg as pkg_models
+from cimple.models import snapshot as snapshot_models
 from cimple.snapshot import core as snapshot_core
 
 if typing.TYPE_CHECKING:
+    import collections.abc
+
     import pyfakefs.fake_filesystem
 
 
@@ -38,6 +45,36 @@ def basic_cimple_store_fixture(fs: pyfakefs.fake_filesystem.FakeFilesystem) -> N
         )
 
 
+@pytest.fixture(name="wait_for_trash", autouse=True)
+def wait_for_trash_fixture(request: pytest.FixtureRequest) -> collections.abc.Generator[None]:
+    # Make sure pyfakefs outlives background deletion of trashed directories
+    if "fs" in request.fixturenames:
+        request.getfixturevalue("fs")
+    yield
+    # Also give up the trash directory, as the next test may use a different one
+    cimple.trash._collector.close()
+
+
+@pytest.fixture(name="serial_pkg_resolution", autouse=True)
+def serial_pkg_resolution_fixture(
+    request: pytest.FixtureRequest, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    # pyfakefs is not thread-safe, so resolve packages on the calling thread on a fake filesystem
+    if "fs" in request.fixturenames:
+        monkeypatch.setattr(snapshot_core, "_RESOLVE_MAX_WORKERS", 1)
+
+
+@pytest.fixture(name="reset_caches", autouse=True)
+def reset_caches_fixture() -> None:
+    # Caches live as long as the process, and would otherwise carry state from one test to another
+    cimple.models.pkg_config._pkg_configs.clear()
+    cimple.models.pkg_config._pkg_catalogs.clear()
+    snapshot_core._snapshot_cache.clear()
+    snapshot_core._snapshot_states.clear()
+    cimple.env._toolchain_envs.clear()
+    cimple.env.toolchain_fingerprint.cache_clear()
+
+
 @pytest.fixture(name="cimple_pi")
 def cimple_pi_fixture(fs: pyfakefs.fake_filesystem.FakeFilesystem) -> pathlib.Path:
     pi_target_path = pathlib.Path("/pi")
@@ -79,6 +116,33 @@ class Helpers:
             snapshot.add_bin_pkg(bin_pkg, src_pkg_id, "0", [])
         return snapshot
 
+    @staticmethod
+    def make_snapshot_src_pkg(name: str, version: str = "1.0-1") -> snapshot_models.SnapshotSrcPkg:
+        return snapshot_models.SnapshotSrcPkg(
+            name=name, version=version, build_depends=[], binary_packages=[], pkg_type="src"
+        )
+
+    @staticmethod
+    def make_snapshot_bin_pkg(name: str, sha256: str = "0" * 64) -> snapshot_models.SnapshotBinPkg:
+        return snapshot_models.SnapshotBinPkg(
+            name=name, sha256=sha256, compression_method="xz", depends=[], pkg_type="bin"
+        )
+
+    @staticmethod
+    def make_build_graph(build_depends: dict[str, list[str]]) -> cimple.graph.BuildGraph:
+        """
+        Build graph of source packages named after the keys of build_depends, each building a
+        single "<name>-bin" binary package, and build depending on the binary packages of the
+        source packages listed.
+        """
+        graph = cimple.graph.Graph[pkg_models.PkgId]()
+        for src_name, depends in build_depends.items():
+            src_pkg = pkg_models.SrcPkgId(src_name)
+            graph.add_edge(src_pkg, pkg_models.BinPkgId(f"{src_name}-bin"))
+            for dep_name in depends:
+                graph.add_edge(pkg_models.BinPkgId(f"{dep_name}-bin"), src_pkg)
+        return cimple.graph.BuildGraph(graph)
+
 
 @pytest.fixture(name="helpers")
 def helpers_fixture() -> Helpers:
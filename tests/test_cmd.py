@@ -3,7 +3,9 @@ import pathlib
 import pytest
 
 import cimple
+import cimple.models.pkg
 import cimple.models.snapshot
+import cimple.snapshot.plan
 import cimple.stream
 from cimple.cmd import snapshot as snapshot_cmd
 from cimple.cmd import stream as stream_cmd
@@ -98,6 +100,7 @@ class TestSnapshotCmd:
             pkg_index_path=pkg_index_path,
             parallel=2,
             extra_paths=[],
+            live_output=False,
         )
 
     def test_snapshot_reproduce(self, mocker):
@@ -108,6 +111,10 @@ class TestSnapshotCmd:
             "cimple.cmd.snapshot.snapshot_core.load_snapshot",
             side_effect=load_snapshot_side_effect,
         )
+        get_snapshot_mock = mocker.patch(
+            "cimple.cmd.snapshot.snapshot_core.get_snapshot",
+            side_effect=load_snapshot_side_effect,
+        )
 
         # GIVEN: mocked out process_changes to track its invocation
         process_changes_mock = mocker.patch(
@@ -127,9 +134,9 @@ class TestSnapshotCmd:
             parallel=1,
         )
 
-        # THEN: load is called on both target snapshot and root
-        load_snapshot_mock.assert_any_call(snapshot_name)
-        load_snapshot_mock.assert_any_call("root")
+        # THEN: root is loaded to be modified, and the target snapshot is only read
+        load_snapshot_mock.assert_called_once_with("root")
+        get_snapshot_mock.assert_called_once_with(snapshot_name)
 
         # THEN: process_changes is called to reproduce the target snapshot
         process_changes_mock.assert_called_once_with(
@@ -146,6 +153,7 @@ class TestSnapshotCmd:
             bootstrap_changes=cimple.models.snapshot.SnapshotChanges(add=[], remove=[], update=[]),
             pkg_index_path=pkg_index_path,
             parallel=1,
+            live_output=False,
         )
 
         # THEN: compare_pkgs_with is called on the root snapshot with the dummy snapshot
@@ -223,7 +231,60 @@ class TestStreamCmd:
             bootstrap_changes=expected_bootstrap_changes,
             pkg_index_path=cimple_pi,
             parallel=2,
+            live_output=False,
         )
 
         # THEN: snapshot is dumped
         dump_snapshot_mock.assert_called_once()
+
+    @pytest.mark.usefixtures("basic_cimple_store")
+    def test_stream_update_dry_run(
+        self, mocker, cimple_pi: pathlib.Path, capsys: pytest.CaptureFixture[str]
+    ):
+        # GIVEN: changes that rebuild pkg2 and the packages that build depend on it
+        pkg_changes = cimple.models.snapshot.SnapshotChanges.model_construct(
+            add=[cimple.models.snapshot.SnapshotChangeAdd(name="pkg5", version="1.0-1")],
+            update=[
+                cimple.models.snapshot.SnapshotChangeUpdate.model_construct(
+                    name="pkg1", from_version="1.0-1", to_version="3.0-1"
+                ),
+                cimple.models.snapshot.SnapshotChangeUpdate.model_construct(
+                    name="pkg2", from_version="1.0-1", to_version="2.0-1"
+                ),
+            ],
+            remove=[cimple.models.pkg.SrcPkgId("pkg4")],
+        )
+        mocker.patch(
+            "cimple.cmd.stream.cimple.stream.resolve_snapshot_changes",
+            return_value=cimple.stream.ResolvedSnapshotChanges(
+                pkg_changes=pkg_changes,
+                bootstrap_changes=cimple.models.snapshot.SnapshotChanges(
+                    add=[], update=[], remove=[]
+                ),
+            ),
+        )
+        process_changes_mock = mocker.patch("cimple.cmd.stream.cimple.snapshot.ops.process_changes")
+
+        # GIVEN: recorded build durations of all packages but pkg5
+        cimple.snapshot.plan.record_build_duration(cimple.models.pkg.SrcPkgId("pkg1"), 60.0)
+        cimple.snapshot.plan.record_build_duration(cimple.models.pkg.SrcPkgId("pkg2"), 120.0)
+
+        # WHEN: stream update command is invoked as a dry run
+        stream_cmd.update(stream="test-stream", pkg_index=cimple_pi, dry_run=True)
+
+        # THEN: nothing is built
+        process_changes_mock.assert_not_called()
+
+        # THEN: the build plan is printed
+        output = capsys.readouterr().out.splitlines()
+        assert output[2:] == [
+            "3 packages would be built in 2 waves:",
+            "  Wave 1: pkg2",
+            "  Wave 2: pkg1, pkg5",
+            "Estimated build time: 4m30s serially, 3m30s with enough parallel builders",
+            (
+                "  1 packages have no recorded build duration and are estimated at the average of "
+                "the others"
+            ),
+            "Critical path: pkg2 (2m00s) -> pkg5 (1m30s)",
+        ]
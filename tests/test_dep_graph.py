@@ -99,3 +99,53 @@ def test_build_graph():
 
     # Then: the build graph is now empty
     assert build_graph.is_empty()
+
+
+@pytest.mark.usefixtures("basic_cimple_store")
+def test_depends_of_is_invalidated_by_pkg_changes():
+    # Given: a basic snapshot with memoized dependency closures
+    cimple_snapshot = snapshot_core.load_snapshot("test-snapshot")
+    assert cimple_snapshot.runtime_depends_of(pkg_models.BinPkgId("pkg2-bin")) == [
+        pkg_models.BinPkgId("pkg3-bin")
+    ]
+
+    # When: replacing pkg3 with a version whose binary package depends on pkg4-bin
+    cimple_snapshot.remove_pkg(pkg_models.SrcPkgId("pkg3"))
+    cimple_snapshot.add_src_pkg(pkg_models.SrcPkgId("pkg3"), "2.0-1", [])
+    cimple_snapshot.add_bin_pkg(
+        pkg_models.BinPkgId("pkg3-bin"),
+        pkg_models.SrcPkgId("pkg3"),
+        "placeholder",
+        [pkg_models.BinPkgId("pkg4-bin")],
+    )
+    cimple_snapshot.graph.add_edge(pkg_models.BinPkgId("pkg3-bin"), pkg_models.SrcPkgId("pkg3"))
+
+    # Then: runtime and build closures reflect the new dependency
+    assert not cimple_snapshot.is_broken()
+    runtime_deps = cimple_snapshot.runtime_depends_of(pkg_models.BinPkgId("pkg2-bin"))
+    assert sorted(d.name for d in runtime_deps) == ["pkg3-bin", "pkg4-bin"]
+    build_deps = cimple_snapshot.build_depends_of(pkg_models.SrcPkgId("pkg1"))
+    assert sorted(d.name for d in build_deps) == ["pkg2-bin", "pkg3-bin", "pkg4-bin"]
+
+
+@pytest.mark.usefixtures("basic_cimple_store")
+def test_reachability_index():
+    # Given: a basic snapshot
+    cimple_snapshot = snapshot_core.load_snapshot("test-snapshot")
+
+    # When: querying which packages transitively depend on pkg3-bin
+    index = cimple_snapshot.reachability_index()
+    dependents = index.ancestors(pkg_models.BinPkgId("pkg3-bin"))
+
+    # Then: returns the packages that need pkg3-bin at build or run time
+    assert dependents == {
+        pkg_models.BinPkgId("pkg2-bin"),
+        pkg_models.SrcPkgId("pkg1"),
+        pkg_models.BinPkgId("pkg1-bin"),
+    }
+
+    # When: removing a package
+    cimple_snapshot.remove_pkg(pkg_models.SrcPkgId("pkg1"))
+
+    # Then: the index is rebuilt on next use
+    assert cimple_snapshot.reachability_index() is not index
@@ -1,10 +1,15 @@
 import os
+import typing
 
 import pytest
 
+import cimple.constants
 import cimple.env
 import cimple.system
 
+if typing.TYPE_CHECKING:
+    from pytest_mock import MockerFixture
+
 
 @pytest.mark.skipif(
     not cimple.system.is_windows(),
@@ -43,6 +48,7 @@ def test_window_baseline_env():
     cimple.system.is_windows(),
     reason="This test is only relevant for Unix-like systems",
 )
+@pytest.mark.usefixtures("fs")
 def test_unix_baseline_env():
     # WHEN: getting the baseline environment variables
     env = cimple.env.baseline_env()
@@ -84,3 +90,45 @@ def test_filter_msvc_path():
     # THEN: the resulting PATH string only contains non-MSVC paths
     assert non_msvc_path not in filtered_path
     assert msvc_path in filtered_path
+
+
+@pytest.mark.usefixtures("fs")
+@pytest.mark.skipif(
+    cimple.system.is_windows(),
+    reason="This test is only relevant for Unix-like systems",
+)
+def test_toolchain_env(mocker: MockerFixture):
+    # GIVEN: a toolchain whose environment takes a while to probe
+    probe_mock = mocker.patch(
+        "cimple.env.probe_toolchain_env", return_value={"CC": "/opt/toolchain/bin/cc"}
+    )
+
+    # WHEN: getting the baseline environment several times
+    env = cimple.env.baseline_env()
+    _ = cimple.env.baseline_env()
+
+    # THEN: the toolchain is fingerprinted and its environment probed once, and the environment is
+    # part of the baseline environment
+    assert cimple.env.toolchain_fingerprint.cache_info().misses == 1
+    probe_mock.assert_called_once()
+    assert env["CC"] == "/opt/toolchain/bin/cc"
+
+    # WHEN: getting the toolchain environment in a new process
+    cimple.env._toolchain_envs.clear()
+    cimple.env.toolchain_fingerprint.cache_clear()
+    env = cimple.env.toolchain_env()
+
+    # THEN: the stored environment of the same toolchain is reused
+    probe_mock.assert_called_once()
+    assert env == {"CC": "/opt/toolchain/bin/cc"}
+
+    # WHEN: the toolchain changes
+    cimple.env._toolchain_envs.clear()
+    mocker.patch("cimple.env.toolchain_fingerprint", return_value="new-toolchain")
+    probe_mock.return_value = {"CC": "/opt/new-toolchain/bin/cc"}
+    env = cimple.env.toolchain_env()
+
+    # THEN: the environment is probed again
+    assert probe_mock.call_count == 2
+    assert env == {"CC": "/opt/new-toolchain/bin/cc"}
+    assert (cimple.constants.cimple_toolchain_env_dir / "new-toolchain.json").exists()
@@ -0,0 +1,172 @@
+import pytest
+
+import cimple.graph
+
+
+def test_remove_node_keeps_broken_edges():
+    # Given: a graph a -> b -> c
+    graph = cimple.graph.Graph[str]()
+    graph.add_edge("a", "b")
+    graph.add_edge("b", "c")
+
+    # When: removing b
+    graph.remove_node("b")
+
+    # Then: the edges to and from b are tracked as broken edges
+    assert graph.is_broken()
+    assert graph.broken_edges == {"b": {"a"}, "c": {"b"}}
+    assert set(graph.nodes()) == {"a", "c"}
+    assert set(graph.edges()) == set()
+
+    # When: adding b back
+    graph.add_node("b")
+
+    # Then: the edges to b are restored, and the edge from b is still broken
+    assert graph.has_edge("a", "b")
+    assert graph.broken_edges == {"c": {"b"}}
+
+    # When: adding the edge from b again
+    graph.add_edge("b", "c")
+
+    # Then: the graph is no longer broken
+    assert not graph.is_broken()
+    assert set(graph.edges()) == {("a", "b"), ("b", "c")}
+
+
+def test_remove_edge():
+    # Given: a graph with a broken edge
+    graph = cimple.graph.Graph[str]()
+    graph.add_edge("a", "b")
+    graph.add_edge("c", "b")
+    graph.remove_node("a")
+
+    # When: removing the broken edge and a real edge
+    graph.remove_edge("a", "b")
+    graph.remove_edge("c", "b")
+
+    # Then: both edges are gone
+    assert not graph.is_broken()
+    assert set(graph.edges()) == set()
+    assert graph.in_degree("b") == 0
+
+    # Then: removing an edge that does not exist raises
+    with pytest.raises(KeyError):
+        graph.remove_edge("c", "b")
+
+
+def test_node_ids_are_reused():
+    # Given: a graph where a node has been removed
+    graph = cimple.graph.Graph[str]()
+    graph.add_edge("a", "b")
+    graph.remove_edge("a", "b")
+    graph.remove_node("a")
+
+    # When: adding a new node
+    graph.add_edge("c", "b")
+
+    # Then: the new node does not inherit any edges of the removed node
+    assert set(graph.nodes()) == {"b", "c"}
+    assert set(graph.edges()) == {("c", "b")}
+    assert dict(graph.in_degrees()) == {"b": 1, "c": 0}
+
+
+def test_reverse():
+    # Given: a graph a -> b -> c
+    graph = cimple.graph.Graph[str]()
+    graph.add_edge("a", "b")
+    graph.add_edge("b", "c")
+
+    # When: reversing the graph without copying
+    view = graph.reverse(copy=False)
+
+    # Then: the view has all edges reversed, and cannot be modified
+    assert set(view.edges()) == {("b", "a"), ("c", "b")}
+    assert view.descendants("c") == {"a", "b"}
+    with pytest.raises(AssertionError):
+        view.add_edge("c", "a")
+
+    # When: reversing the graph with copying, and modifying the copy
+    reversed_graph = graph.reverse(copy=True)
+    reversed_graph.remove_edge("c", "b")
+
+    # Then: the original graph is unchanged
+    assert set(graph.edges()) == {("a", "b"), ("b", "c")}
+    assert set(reversed_graph.edges()) == {("b", "a")}
+
+
+def test_subgraph():
+    # Given: a graph a -> b -> c, a -> c
+    graph = cimple.graph.Graph[str]()
+    graph.add_edge("a", "b")
+    graph.add_edge("b", "c")
+    graph.add_edge("a", "c")
+
+    # When: getting the subgraph of a and c
+    subgraph = graph.subgraph(["a", "c"])
+
+    # Then: only the edges between a and c are kept
+    assert set(subgraph.nodes()) == {"a", "c"}
+    assert set(subgraph.edges()) == {("a", "c")}
+    assert subgraph.in_degree("c") == 1
+
+    # Then: modifying the subgraph does not modify the original graph
+    subgraph.remove_node("c")
+    assert graph.has_edge("a", "c")
+
+    # When: getting the reversed subgraph of a and c
+    reversed_subgraph = graph.subgraph(["a", "c"], reverse=True)
+
+    # Then: the edges between a and c are reversed
+    assert set(reversed_subgraph.edges()) == {("c", "a")}
+    assert reversed_subgraph.in_degree("a") == 1
+
+
+def test_ancestors_of_all():
+    # Given: a graph a -> b -> c, d -> c, e -> f
+    graph = cimple.graph.Graph[str]()
+    for from_node, to_node in [("a", "b"), ("b", "c"), ("d", "c"), ("e", "f")]:
+        graph.add_edge(from_node, to_node)
+
+    # When: getting the ancestors of b and c
+    ancestors = graph.ancestors_of_all(["b", "c"])
+
+    # Then: all nodes with a path to either of them are found, including b as an ancestor of c
+    assert ancestors == {"a", "b", "d"}
+
+    # Then: a node that is not an ancestor of any given node is not included
+    assert graph.ancestors_of_all(["a", "f"]) == {"e"}
+
+
+def test_generic_bfs_edges():
+    # Given: a graph with a diamond a -> b, a -> c, b -> d, c -> d
+    graph = cimple.graph.Graph[str]()
+    for from_node, to_node in [("a", "b"), ("a", "c"), ("b", "d"), ("c", "d")]:
+        graph.add_edge(from_node, to_node)
+
+    # When: traversing from a
+    edges = list(graph.generic_bfs_edges("a", graph.neighbors))
+
+    # Then: each reachable node is visited once, in breadth-first order
+    assert edges == [("a", "b"), ("a", "c"), ("b", "d")]
+
+
+def test_reachability_index():
+    # Given: a graph a -> b -> c -> b, c -> d, with e unconnected
+    graph = cimple.graph.Graph[str]()
+    for from_node, to_node in [("a", "b"), ("b", "c"), ("c", "b"), ("c", "d")]:
+        graph.add_edge(from_node, to_node)
+    graph.add_node("e")
+
+    # When: building a reachability index
+    index = cimple.graph.ReachabilityIndex(graph)
+
+    # Then: closures match a graph traversal, in both directions
+    for node in graph.nodes():
+        assert index.descendants(node) == graph.descendants(node)
+        assert index.ancestors(node) == graph.reverse(copy=False).descendants(node)
+
+    # Then: set queries return the union of the closures
+    assert index.descendants_of_all(["c", "e"]) == {"b", "d"}
+    assert index.ancestors_of_all(["a", "d"]) == {"a", "b", "c"}
+    assert index.reaches("a", "d")
+    assert not index.reaches("d", "a")
@@ -0,0 +1,68 @@
+import importlib.resources
+import shutil
+import stat
+import typing
+
+import pytest
+
+import cimple.images
+
+if typing.TYPE_CHECKING:
+    import pathlib
+
+    from pytest_mock import MockerFixture
+
+
+@pytest.fixture(name="image_store")
+def image_store_fixture(tmp_path: pathlib.Path, mocker: MockerFixture) -> pathlib.Path:
+    # File locks need real file descriptors, so use a real temporary directory instead of pyfakefs
+    image_dir = tmp_path / "image"
+    extracted_image_dir = tmp_path / "extracted_image"
+    image_dir.mkdir()
+    with importlib.resources.path("tests", "data/store/image") as store_image_path:
+        shutil.copy(store_image_path / "windows-default-x86_64.tar.gz", image_dir)
+    mocker.patch("cimple.constants.cimple_image_dir", image_dir)
+    mocker.patch("cimple.constants.cimple_extracted_image_dir", extracted_image_dir)
+    return extracted_image_dir
+
+
+def test_prepare_image(image_store: pathlib.Path):
+    # WHEN: preparing an image
+    image_path = cimple.images.prepare_image("windows", "x86_64", "default")
+
+    # THEN: the image is extracted to its final location
+    assert image_path == image_store / "windows-default-x86_64"
+    assert (image_path / "a.txt").is_file()
+
+    # THEN: the extracted image is read-only
+    assert not (image_path / "a.txt").stat().st_mode & stat.S_IWUSR
+
+    # THEN: no temporary extraction is left behind
+    assert list(image_store.glob("*.tmp")) == []
+
+
+def test_prepare_image_reuses_existing(image_store: pathlib.Path, mocker: MockerFixture):
+    # GIVEN: an image that is already extracted
+    image_path = cimple.images.prepare_image("windows", "x86_64", "default")
+    tarfile_open_mock = mocker.patch("cimple.images.tarfile.open")
+
+    # WHEN: preparing the same image again
+    second_image_path = cimple.images.prepare_image("windows", "x86_64", "default")
+
+    # THEN: the existing extraction is reused
+    assert second_image_path == image_path
+    tarfile_open_mock.assert_not_called()
+
+
+def test_prepare_image_removes_incomplete_extraction(image_store: pathlib.Path):
+    # GIVEN: a leftover extraction from a crashed process
+    stale_path = image_store / ".windows-default-x86_64-crashed.tmp"
+    stale_path.mkdir(parents=True)
+    (stale_path / "partial.txt").write_text("partial")
+
+    # WHEN: preparing the image
+    image_path = cimple.images.prepare_image("windows", "x86_64", "default")
+
+    # THEN: the leftover is removed and the image is complete
+    assert not stale_path.exists()
+    assert (image_path / "a.txt").is_file()
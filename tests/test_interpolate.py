@@ -1,6 +1,6 @@
 import pytest
 
-from cimple.str_interpolation import interpolate
+from cimple.str_interpolation import compile_template, interpolate
 
 
 @pytest.mark.parametrize(
@@ -35,3 +35,21 @@ def test_interpolate(input_str: str, context: dict[str, str], result: str):
 def test_interpolate_error(input_str: str, context: dict[str, str], exception_regex: str):
     with pytest.raises(RuntimeError, match=exception_regex):
         _ = interpolate(input_str, context)
+
+
+def test_compile_template():
+    # GIVEN: a template using variables and escapes
+    template_str = "\\${v} ${v}-${w}\\\\"
+
+    # WHEN: compiling it
+    template = compile_template(template_str)
+
+    # THEN: the template is only compiled once
+    assert compile_template(template_str) is template
+
+    # THEN: its variables are known without rendering it
+    assert template.variables == {"v", "w"}
+
+    # THEN: it renders against different contexts
+    assert template.render({"v": "a", "w": "b"}) == "${v} a-b\\"
+    assert template.render({"v": "c", "w": "d"}) == "${v} c-d\\"
@@ -1,5 +1,9 @@
+import copy
+import pickle
+
 import pytest
 
+import cimple.models.pkg
 import cimple.models.pkg_config
 import cimple.models.snapshot
 import cimple.models.stream
@@ -121,3 +125,38 @@ def test_stream_model_round_trip(stream):
 
     # THEN: the result matches the original stream data
     assert result == stream
+
+
+def test_pkg_ids_are_interned():
+    # WHEN: creating package IDs with the same type and name
+    bin_id = cimple.models.pkg.BinPkgId("pkg1")
+
+    # THEN: they are the same object, also after copying and pickling
+    assert bin_id is cimple.models.pkg.BinPkgId("pkg1")
+    assert copy.deepcopy(bin_id) is bin_id
+    assert pickle.loads(pickle.dumps(bin_id)) is bin_id
+
+    # THEN: IDs with a different type are not equal
+    assert bin_id != cimple.models.pkg.SrcPkgId("pkg1")
+    assert hash(bin_id) != hash(cimple.models.pkg.SrcPkgId("pkg1"))
+
+    # THEN: IDs cannot be modified
+    with pytest.raises(AttributeError):
+        bin_id.name = "pkg2"
+
+
+def test_pkg_id_validation_returns_interned_ids():
+    # WHEN: validating a snapshot package model
+    model = cimple.models.snapshot.SnapshotSrcPkg.model_validate(
+        {
+            "name": "pkg1",
+            "version": "1.0-1",
+            "build_depends": ["dep1-bin"],
+            "binary_packages": ["pkg1-bin"],
+            "pkg_type": "src",
+        }
+    )
+
+    # THEN: the package IDs are the canonical objects
+    assert model.build_depends[0] is cimple.models.pkg.BinPkgId("dep1-bin")
+    assert model.binary_packages[0] is cimple.models.pkg.BinPkgId("pkg1-bin")
@@ -1,4 +1,5 @@
 import pathlib
+import shutil
 import typing
 import unittest.mock
 
@@ -6,6 +7,10 @@ import pytest
 
 import cimple.models
 import cimple.models.pkg
+import cimple.models.pkg_config
+import cimple.pkg.rules
+import cimple.process
+import cimple.snapshot.plan
 import cimple.system
 from cimple.models import pkg as pkg_models
 from cimple.pkg import ops as pkg_ops
@@ -116,7 +121,9 @@ class TestPkgOps:
         return_process = unittest.mock.Mock()
         return_process.returncode = 0
         run_command_mock = mocker.patch(
-            "cimple.pkg.ops.cimple.process.run_command", return_value=return_process
+            "cimple.pkg.ops.cimple.process.ExecutionContext.run_command",
+            autospec=True,
+            return_value=return_process,
         )
         uut = pkg_ops.PkgOps()
 
@@ -132,12 +139,51 @@ class TestPkgOps:
 
         # THEN: the expected build commands are called
         run_command_mock.assert_called_once()
-        assert run_command_mock.call_args[0][0] == ["abc", "abc"]
-        assert run_command_mock.call_args[1]["extra_paths"] == [pathlib.Path("/extra/path")]
+        assert run_command_mock.call_args[0][1] == ["abc", "abc"]
+        assert run_command_mock.call_args[0][0].extra_paths == [pathlib.Path("/extra/path")]
         assert len(result) == 1
         assert "custom" in result
         assert result["custom"].is_dir()
 
+        # THEN: the resources used by the build are recorded
+        build_usage = cimple.snapshot.plan.load_build_usage(package_id)
+        assert build_usage is not None
+        assert (build_usage.name, build_usage.pkg_version) == ("custom", "0.0.1-1")
+
+    @pytest.mark.usefixtures("basic_cimple_store")
+    def test_build_pkg_failure_keeps_error(self, cimple_pi: pathlib.Path, mocker: MockerFixture):
+        # GIVEN: a source package whose build fails, in a workspace where the resources used by the
+        # build cannot be written either
+        package_id = pkg_models.SrcPkgId("custom")
+        cimple_snapshot = snapshot_core.load_snapshot("test-snapshot")
+        cimple_snapshot.add_src_pkg(package_id, "0.0.1-1", [])
+
+        def failing_rule(
+            context: cimple.process.ExecutionContext, *args: typing.Any, **kwargs: typing.Any
+        ) -> None:
+            assert context.log is not None
+            (context.log.path.parent / "usage.json").mkdir()
+            raise RuntimeError("rule crashed")
+
+        mocker.patch(
+            "cimple.pkg.ops.cimple.process.ExecutionContext.run_command",
+            autospec=True,
+            side_effect=failing_rule,
+        )
+        warning_mock = mocker.patch("cimple.pkg.ops.cimple.logging.warning")
+
+        # WHEN: building the package
+        # THEN: the build error is raised, and the failure to write the resources used is logged
+        with pytest.raises(RuntimeError, match="rule crashed"):
+            pkg_ops.PkgOps().build_pkg(
+                package_id,
+                pi_path=cimple_pi,
+                cimple_snapshot=cimple_snapshot,
+                build_options=pkg_ops.PackageBuildOptions(parallel=2),
+            )
+        warning_mock.assert_called_once()
+        assert warning_mock.call_args[0][0] == "Failed to write build usage of %s: %s"
+
     @pytest.mark.usefixtures("basic_cimple_store")
     def test_build_pkg_custom_with_multiple_binaries(
         self, cimple_pi: pathlib.Path, mocker: MockerFixture
@@ -149,7 +195,9 @@ class TestPkgOps:
         return_process = unittest.mock.Mock()
         return_process.returncode = 0
         run_command_mock = mocker.patch(
-            "cimple.pkg.ops.cimple.process.run_command", return_value=return_process
+            "cimple.pkg.ops.cimple.process.ExecutionContext.run_command",
+            autospec=True,
+            return_value=return_process,
         )
         uut = pkg_ops.PkgOps()
 
@@ -165,8 +213,8 @@ class TestPkgOps:
 
         # THEN: the expected build commands are called
         run_command_mock.assert_called_once()
-        assert run_command_mock.call_args[0][0] == ["abc", "abc"]
-        assert run_command_mock.call_args[1]["extra_paths"] == [pathlib.Path("/extra/path")]
+        assert run_command_mock.call_args[0][1] == ["abc", "abc"]
+        assert run_command_mock.call_args[0][0].extra_paths == [pathlib.Path("/extra/path")]
         assert len(result) == 2
         assert "multiple1" in result
         assert result["multiple1"].is_dir()
@@ -180,11 +228,13 @@ class TestPkgOps:
         cimple_snapshot = snapshot_core.load_snapshot("test-snapshot")
         uut = pkg_ops.PkgOps()
 
-        # Mock the run_command function during bootstrap build
+        # Mock running commands during bootstrap build
         return_process = unittest.mock.Mock()
         return_process.returncode = 0
         run_command_mock = mocker.patch(
-            "cimple.pkg.ops.cimple.process.run_command", return_value=return_process
+            "cimple.pkg.ops.cimple.process.ExecutionContext.run_command",
+            autospec=True,
+            return_value=return_process,
         )
 
         # WHEN: building a bootstrap package
@@ -201,9 +251,99 @@ class TestPkgOps:
         assert "bootstrap1-bin" in result
         assert result["bootstrap1-bin"].is_dir()
 
-        # THEN: the run_command function is called
+        # THEN: the build command is run
         run_command_mock.assert_called_once()
-        assert run_command_mock.call_args[0][0] == ["abc", "abc"]
+        assert run_command_mock.call_args[0][1] == ["abc", "abc"]
+
+
+class TestRulesPlan:
+    def test_compute_rules_plan(self, tmp_path: pathlib.Path):
+        # GIVEN: rules using builtin variables
+        rules = cimple.models.pkg_config.PkgConfigRulesSection(
+            default=[
+                "make -j${cimple_parallelism}",
+                cimple.models.pkg_config.PkgConfigRule(
+                    rule=["make", "install"], cwd="sub", env={"DESTDIR": "${cimple_output_dir}"}
+                ),
+            ]
+        )
+
+        # WHEN: computing the rules plan
+        rules_plan = cimple.pkg.rules.compute_rules_plan(
+            rules,
+            default_cwd=pathlib.Path("/build"),
+            builtin_variables={"cimple_parallelism": "4", "cimple_output_dir": "/output"},
+            bin_paths=[],
+        )
+
+        # THEN: rules are interpolated, and their executables are left to resolve when they run
+        assert rules_plan.rules.root == [
+            cimple.models.pkg_config.PkgConfigNormalizedRule(
+                cwd=pathlib.Path("/build"), env={}, rule=["make", "-j4"]
+            ),
+            cimple.models.pkg_config.PkgConfigNormalizedRule(
+                cwd=pathlib.Path("/build/sub"),
+                env={"DESTDIR": "/output"},
+                rule=["make", "install"],
+            ),
+        ]
+
+        # WHEN: dumping the plan
+        rules_path = tmp_path / "rules.json"
+        rules_plan.dump(rules_path)
+
+        # THEN: it is a valid rules file
+        assert (
+            cimple.models.pkg_config.PkgConfigNormalizedRulesList.model_validate_json(
+                rules_path.read_text()
+            )
+            == rules_plan.rules
+        )
+
+    @pytest.mark.skipif(
+        cimple.system.is_windows(),
+        reason="This test is only relevant for Unix-like systems",
+    )
+    def test_rules_plan_tool_from_earlier_rule(self, tmp_path: pathlib.Path, mocker: MockerFixture):
+        # GIVEN: rules running a tool that an earlier rule installs into the dependency tree
+        mocker.patch("cimple.env.toolchain_env", return_value={})
+        deps_dir = tmp_path / "deps"
+        build_dir = tmp_path / "build"
+        build_dir.mkdir()
+        tool_path = deps_dir / "bin" / "mytool"
+        rules = cimple.models.pkg_config.PkgConfigRulesSection(
+            default=[
+                cimple.models.pkg_config.PkgConfigRule(
+                    rule=[
+                        "sh",
+                        "-c",
+                        (
+                            f"mkdir -p {tool_path.parent} && echo '#!/bin/sh' > {tool_path} && "
+                            f"echo 'touch built' >> {tool_path} && chmod +x {tool_path}"
+                        ),
+                    ]
+                ),
+                "mytool",
+            ]
+        )
+        sh_path = shutil.which("sh")
+        assert sh_path is not None
+
+        # WHEN: running the rules plan
+        rules_plan = cimple.pkg.rules.compute_rules_plan(
+            rules, default_cwd=build_dir, builtin_variables={}, bin_paths=[]
+        )
+        execution_context = cimple.process.ExecutionContext(
+            None, deps_dir, [pathlib.Path(sh_path).parent]
+        )
+        return_codes = [
+            execution_context.run_command(rule.rule, cwd=rule.cwd, env=rule.env).returncode
+            for rule in rules_plan.rules.root
+        ]
+
+        # THEN: the tool is found once it exists, and runs
+        assert return_codes == [0, 0]
+        assert (build_dir / "built").exists()
 
 
 class TestResolveDeps:
@@ -1,10 +1,17 @@
+import importlib.resources
 import os
 import pathlib
+import typing
 
 import pytest
 
 import cimple.models.pkg
 import cimple.models.pkg_config
+import cimple.pkg.catalog
+
+if typing.TYPE_CHECKING:
+    import pyfakefs.fake_filesystem
+    from pytest_mock import MockerFixture
 
 
 def test_load_pkg_config(cimple_pi: pathlib.Path):
@@ -31,6 +38,105 @@ def test_load_pkg_config_bootstrap(cimple_pi: pathlib.Path):
     assert pkg_config.version == "1.0.0-1"
 
 
+def test_load_pkg_config_cached(
+    fs: pyfakefs.fake_filesystem.FakeFilesystem, cimple_pi: pathlib.Path
+):
+    # GIVEN: a package config that has already been loaded
+    pkg_id = cimple.models.pkg.SrcPkgId("pkg1")
+    pkg_config = cimple.models.pkg_config.load_pkg_config(cimple_pi, pkg_id, "2.0-1")
+
+    # WHEN: loading it again
+    # THEN: the same config is returned without parsing it again
+    assert cimple.models.pkg_config.load_pkg_config(cimple_pi, pkg_id, "2.0-1") is pkg_config
+
+    # WHEN: the config changes on disk
+    config_path = cimple_pi / "pkg" / "pkg1" / "2.0-1" / "pkg.toml"
+    config_text = config_path.read_text()
+    fs.chmod(str(config_path), 0o644, force_unix_mode=True)
+    config_path.write_text(config_text.replace('version = "2.0-1"', 'version = "2.0-2"'))
+    changed_pkg_config = cimple.models.pkg_config.load_pkg_config(cimple_pi, pkg_id, "2.0-1")
+
+    # THEN: the config is loaded again
+    assert changed_pkg_config is not pkg_config
+    assert changed_pkg_config.version == "2.0-2"
+
+
+def test_pkg_catalog(fs: pyfakefs.fake_filesystem.FakeFilesystem, mocker: MockerFixture):
+    # GIVEN: a writable package index
+    pi_path = pathlib.Path("/pi")
+    with importlib.resources.path("tests", "data/pi") as real_pi_path:
+        fs.add_real_directory(real_pi_path, target_path=pi_path, read_only=False)
+    config_count = len(list((pi_path / "pkg").glob("*/*/pkg.toml")))
+
+    # WHEN: compiling its catalog
+    result = cimple.pkg.catalog.compile_pkg_catalog(pi_path)
+
+    # THEN: all package configs are compiled
+    assert result == cimple.pkg.catalog.PkgCatalogCompileResult(
+        compiled=config_count, reused=0, removed=0
+    )
+
+    # WHEN: loading a package config
+    toml_load_spy = mocker.spy(cimple.models.pkg_config.tomllib, "load")
+    pkg_config = cimple.models.pkg_config.load_pkg_config(
+        pi_path, cimple.models.pkg.SrcPkgId("pkg1"), "2.0-1"
+    )
+
+    # THEN: it is taken from the catalog
+    toml_load_spy.assert_not_called()
+    assert pkg_config.version == "2.0-1"
+    assert pkg_config.build_depends == [cimple.models.pkg.BinPkgId("pkg3-bin")]
+
+    # WHEN: a package config changes without compiling the catalog again
+    config_path = pi_path / "pkg" / "pkg1" / "2.0-1" / "pkg.toml"
+    config_path.write_text(config_path.read_text().replace('"pkg3-bin"', '"pkg2-bin"'))
+
+    # THEN: the change is picked up from pkg.toml
+    changed_pkg_config = cimple.models.pkg_config.load_pkg_config(
+        pi_path, cimple.models.pkg.SrcPkgId("pkg1"), "2.0-1"
+    )
+    toml_load_spy.assert_called_once()
+    assert changed_pkg_config.build_depends == [cimple.models.pkg.BinPkgId("pkg2-bin")]
+    toml_load_spy.reset_mock()
+
+    # WHEN: another package config is touched, and the catalog is compiled again
+    touched_path = pi_path / "pkg" / "pkg1" / "1.0-1" / "pkg.toml"
+    touched_path.write_text(touched_path.read_text())
+    result = cimple.pkg.catalog.compile_pkg_catalog(pi_path)
+
+    # THEN: only the changed package config is compiled again
+    assert result == cimple.pkg.catalog.PkgCatalogCompileResult(
+        compiled=1, reused=config_count - 1, removed=0
+    )
+
+    # THEN: the changed package config is loaded from the updated catalog
+    pkg_config = cimple.models.pkg_config.load_pkg_config(
+        pi_path, cimple.models.pkg.SrcPkgId("pkg1"), "2.0-1"
+    )
+    toml_load_spy.assert_not_called()
+    assert pkg_config.build_depends == [cimple.models.pkg.BinPkgId("pkg2-bin")]
+
+
+def test_invalid_pkg_catalog(fs: pyfakefs.fake_filesystem.FakeFilesystem, mocker: MockerFixture):
+    # GIVEN: a package index with a truncated catalog
+    pi_path = pathlib.Path("/pi")
+    with importlib.resources.path("tests", "data/pi") as real_pi_path:
+        fs.add_real_directory(real_pi_path, target_path=pi_path, read_only=False)
+    cimple.pkg.catalog.compile_pkg_catalog(pi_path)
+    catalog_path = cimple.models.pkg_config.pkg_catalog_path(pi_path)
+    catalog_path.write_bytes(catalog_path.read_bytes()[:100])
+    warning_mock = mocker.patch("cimple.models.pkg_config.cimple.logging.warning")
+
+    # WHEN: loading a package config
+    pkg_config = cimple.models.pkg_config.load_pkg_config(
+        pi_path, cimple.models.pkg.SrcPkgId("pkg1"), "2.0-1"
+    )
+
+    # THEN: the catalog is ignored with a warning, and the config is loaded from pkg.toml
+    warning_mock.assert_called_once_with("Ignoring invalid package catalog %s", catalog_path)
+    assert pkg_config.version == "2.0-1"
+
+
 @pytest.mark.parametrize(
     "rules,default_cwd,builtin_variables,bin_paths,expected_rules",
     [
@@ -0,0 +1,166 @@
+import os
+import pathlib
+import subprocess
+import sys
+import time
+import typing
+
+import pytest
+
+import cimple.process
+import cimple.system
+from cimple.models import build as build_models
+
+if typing.TYPE_CHECKING:
+    from pytest_mock import MockerFixture
+
+
+@pytest.mark.usefixtures("fs")
+@pytest.mark.skipif(
+    cimple.system.is_windows(),
+    reason="This test is only relevant for Unix-like systems",
+)
+def test_execution_context(mocker: MockerFixture):
+    # GIVEN: an execution context, with the toolchain environment probe mocked
+    probe_mock = mocker.patch("cimple.env.toolchain_env", return_value={"CC": "cc"})
+    which_mock = mocker.patch("cimple.process.shutil.which", return_value="/deps/bin/make")
+    run_mock = mocker.patch("cimple.process.subprocess.Popen")
+    mocker.patch(
+        "cimple.process.wait_with_usage",
+        return_value=build_models.ResourceUsage(wall_seconds=1.0),
+    )
+    context = cimple.process.ExecutionContext(None, pathlib.Path("/deps"), [pathlib.Path("/extra")])
+
+    # WHEN: running several commands with the same executable
+    context.run_command(["make"], cwd=pathlib.Path("/build"), env={"FOO": "foo"})
+    context.run_command(["make", "install"], cwd=pathlib.Path("/build"), env=None)
+
+    # THEN: the baseline environment is computed and the executable resolved only once
+    probe_mock.assert_called_once()
+    which_mock.assert_called_once_with("make", path=context.path)
+
+    # THEN: commands are run with the resolved executable and the full environment
+    assert [call.args[0] for call in run_mock.call_args_list] == [
+        ["/deps/bin/make"],
+        ["/deps/bin/make", "install"],
+    ]
+    first_env = run_mock.call_args_list[0].kwargs["env"]
+    assert first_env["FOO"] == "foo"
+    assert first_env["CC"] == "cc"
+    assert first_env["PATH"].startswith(context.path)
+    assert "FOO" not in run_mock.call_args_list[1].kwargs["env"]
+
+    # THEN: the resources used by each command are recorded
+    assert [rule_usage.rule for rule_usage in context.usage] == [
+        ["/deps/bin/make"],
+        ["/deps/bin/make", "install"],
+    ]
+    assert context.total_usage().wall_seconds == 2.0
+
+
+@pytest.mark.usefixtures("fs")
+def test_execution_context_not_found(mocker: MockerFixture):
+    # GIVEN: an execution context in which a command does not exist
+    mocker.patch("cimple.env.toolchain_env", return_value={})
+    mocker.patch("cimple.process.shutil.which", return_value=None)
+    context = cimple.process.ExecutionContext(None, pathlib.Path("/deps"))
+
+    # WHEN: running the command
+    # THEN: an error is raised
+    with pytest.raises(RuntimeError, match="abc is not found"):
+        context.run_command(["abc"], cwd=pathlib.Path("/build"), env=None)
+
+
+def test_build_log(tmp_path: pathlib.Path, capsys: pytest.CaptureFixture[str]):
+    # GIVEN: a build log with live output
+    build_log = cimple.process.BuildLog(
+        tmp_path / "build.log", name="pkg1", live_output=True, tail_lines=3
+    )
+
+    # WHEN: running a command writing more to stdout and stderr than a pipe can buffer
+    script = (
+        "import sys; "
+        "[print(f'line {i}', file=sys.stderr if i % 2 else sys.stdout, flush=True) "
+        "for i in range(10000)]; "
+        "sys.exit(3)"
+    )
+    with build_log.capture(
+        [sys.executable, "-c", script], cwd=tmp_path, env=dict(os.environ)
+    ) as process:
+        process.wait()
+
+    # THEN: the command runs to completion
+    assert process.returncode == 3
+
+    # THEN: all of its output is in the log file, and the last lines are kept in memory
+    log_lines = build_log.path.read_text().splitlines()
+    assert log_lines[0].startswith("$ ")
+    assert sorted(log_lines[1:]) == sorted(f"line {i}" for i in range(10000))
+    assert build_log.tail() == log_lines[-3:]
+
+    # THEN: the output is printed live, prefixed with the package name
+    live_lines = capsys.readouterr().out.splitlines()
+    assert len(live_lines) == 10000
+    assert all(line.startswith("[pkg1] line ") for line in live_lines)
+
+
+@pytest.mark.skipif(
+    not hasattr(os, "wait4"),
+    reason="Resource usage is only measured on platforms with os.wait4",
+)
+def test_wait_with_usage(tmp_path: pathlib.Path):
+    # GIVEN: a command using some CPU time and memory, and writing a file
+    script = "\n".join(
+        [
+            "import sys, time",
+            "data = bytearray(64 * 1024 * 1024)",
+            "end = time.process_time() + 0.2",
+            "while time.process_time() < end:",
+            "    pass",
+            "open('out', 'wb').write(data)",
+            "sys.exit(2)",
+        ]
+    )
+
+    # WHEN: running it and waiting for it with resource usage
+    start_time = time.monotonic()
+    with subprocess.Popen([sys.executable, "-c", script], cwd=tmp_path) as process:
+        usage = cimple.process.wait_with_usage(process, start_time)
+
+    # THEN: the return code is kept
+    assert process.returncode == 2
+
+    # THEN: the resources it used are measured
+    assert usage.wall_seconds >= 0.2
+    assert usage.user_seconds is not None
+    assert usage.system_seconds is not None
+    assert usage.user_seconds + usage.system_seconds >= 0.2
+    assert usage.max_rss_bytes is not None
+    assert usage.max_rss_bytes >= 64 * 1024 * 1024
+    assert usage.read_bytes is not None
+    assert usage.written_bytes is not None
+
+
+def test_sum_resource_usage():
+    # GIVEN: the resources used by two rules, one of which has no I/O measurement
+    usages = [
+        build_models.ResourceUsage(
+            wall_seconds=1.0,
+            user_seconds=0.5,
+            system_seconds=0.25,
+            max_rss_bytes=100,
+            read_bytes=10,
+            written_bytes=20,
+        ),
+        build_models.ResourceUsage(
+            wall_seconds=2.0, user_seconds=1.5, system_seconds=0.25, max_rss_bytes=50
+        ),
+    ]
+
+    # WHEN: adding them up
+    total = build_models.sum_resource_usage(usages)
+
+    # THEN: times are summed, the maximum RSS is the largest, and I/O is unknown
+    assert total == build_models.ResourceUsage(
+        wall_seconds=3.0, user_seconds=2.0, system_seconds=0.5, max_rss_bytes=100
+    )
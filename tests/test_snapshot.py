@@ -1,5 +1,6 @@
 import copy
 import importlib.resources
+import threading
 import typing
 
 import pytest
@@ -9,6 +10,7 @@ import cimple.graph
 import cimple.models.pkg
 import cimple.models.pkg_config
 import cimple.models.snapshot
+import cimple.pkg.catalog
 import cimple.pkg.ops
 import cimple.snapshot.core
 import cimple.snapshot.ops
@@ -88,13 +90,130 @@ class TestSnapshotCore:
         snapshot.dump_snapshot()
 
         # THEN: the snapshot file should exist
-        snapshot_files = list(cimple.constants.cimple_snapshot_dir.iterdir())
+        snapshot_files = list(cimple.constants.cimple_snapshot_dir.glob("*.json"))
         assert len(snapshot_files) == 1, f"Expected 1 snapshot file, found {len(snapshot_files)}"
 
         # THEN: snapshot file conforms to snapshot schema
         with snapshot_files[0].open("r") as f:
             cimple.models.snapshot.SnapshotModel.model_validate_json(f.read())
 
+    @pytest.mark.usefixtures("basic_cimple_store")
+    def test_dumped_snapshot_load(self, mocker: MockerFixture):
+        # GIVEN: a snapshot dumped by cimple
+        snapshot = cimple.snapshot.core.load_snapshot("test-snapshot")
+        datetime_mock = mocker.patch("cimple.snapshot.core.datetime")
+        datetime_mock.datetime.now.return_value.strftime.return_value = "dumped"
+        snapshot.dump_snapshot()
+
+        # WHEN: loading the dumped snapshot
+        loaded_snapshot = cimple.snapshot.core.load_snapshot("dumped")
+
+        # THEN: the snapshot is identical
+        assert loaded_snapshot.compare_pkgs_with(snapshot) is None
+        assert snapshot.compare_pkgs_with(loaded_snapshot) is None
+        assert set(loaded_snapshot.graph.edges()) == set(snapshot.graph.edges())
+
+        # WHEN: the snapshot is modified after it was dumped, and loaded again
+        snapshot_path = cimple.constants.cimple_snapshot_dir / "dumped.json"
+        snapshot_path.write_text(snapshot_path.read_text().replace("pkg1", "pkg5"))
+        modified_snapshot = cimple.snapshot.core.load_snapshot("dumped")
+
+        # THEN: the modification is loaded
+        assert cimple.models.pkg.SrcPkgId("pkg5") in modified_snapshot.src_pkg_map
+
+    @pytest.mark.usefixtures("basic_cimple_store")
+    def test_delta_snapshot(self, mocker: MockerFixture):
+        # GIVEN: snapshots dumped as deltas along an ancestor chain, with a full snapshot every 3
+        mocker.patch("cimple.snapshot.core.SNAPSHOT_CHECKPOINT_INTERVAL", 3)
+        datetime_mock = mocker.patch("cimple.snapshot.core.datetime")
+        datetime_mock.datetime.now.return_value.strftime.side_effect = ["delta1", "delta2", "full3"]
+
+        snapshot = cimple.snapshot.core.load_snapshot("test-snapshot")
+        snapshot.ancestor = "test-snapshot"
+        snapshot.remove_pkg(cimple.models.pkg.SrcPkgId("pkg1"))
+        snapshot.dump_snapshot(delta=True)
+
+        snapshot.ancestor = "delta1"
+        snapshot.add_src_pkg(cimple.models.pkg.SrcPkgId("pkg5"), "1.0-1", [])
+        snapshot.dump_snapshot(delta=True)
+
+        snapshot.ancestor = "delta2"
+        snapshot.dump_snapshot(delta=True)
+
+        # THEN: only the changed packages are stored in deltas, until the next full snapshot
+        snapshot_dir = cimple.constants.cimple_snapshot_dir
+        delta = cimple.models.snapshot.SnapshotDeltaModel.model_validate_json(
+            (snapshot_dir / "delta2.delta.json").read_text()
+        )
+        assert delta.depth == 2
+        assert delta.removed_pkgs == []
+        assert [pkg.root.name for pkg in delta.upserted_pkgs] == ["pkg5"]
+        assert not (snapshot_dir / "delta2.json").exists()
+        assert (snapshot_dir / "full3.json").exists()
+
+        # WHEN: loading a delta snapshot without any cached state
+        cimple.snapshot.core._snapshot_states.clear()
+        loaded_snapshot = cimple.snapshot.core.load_snapshot("delta2")
+
+        # THEN: the snapshot is reconstructed from its ancestors
+        assert loaded_snapshot.name == "delta2"
+        assert loaded_snapshot.ancestor == "delta1"
+        assert loaded_snapshot.compare_pkgs_with(snapshot) is None
+        assert snapshot.compare_pkgs_with(loaded_snapshot) is None
+        assert loaded_snapshot.bootstrap_src_pkg_map == snapshot.bootstrap_src_pkg_map
+        assert loaded_snapshot.bootstrap_bin_pkg_map == snapshot.bootstrap_bin_pkg_map
+        assert set(loaded_snapshot.graph.edges()) == set(snapshot.graph.edges())
+
+        # THEN: reconstructed snapshots do not share package records
+        other_snapshot = cimple.snapshot.core.load_snapshot("delta2")
+        pkg_id = cimple.models.pkg.BinPkgId("pkg2-bin")
+        assert other_snapshot.bin_pkg_map[pkg_id] is not loaded_snapshot.bin_pkg_map[pkg_id]
+
+    @pytest.mark.usefixtures("basic_cimple_store")
+    def test_diff_pkgs_with(self):
+        # GIVEN: two loads of the same snapshot
+        snapshot = cimple.snapshot.core.load_snapshot("test-snapshot")
+        other_snapshot = cimple.snapshot.core.load_snapshot("test-snapshot")
+
+        # THEN: they are identical
+        assert snapshot.compare_pkgs_with(other_snapshot) is None
+        assert snapshot.diff_pkgs_with(other_snapshot) == []
+
+        # WHEN: changing several packages in one of them
+        other_snapshot.set_bin_pkg_sha256(cimple.models.pkg.BinPkgId("pkg3-bin"), "0" * 64)
+        other_snapshot.remove_pkg(cimple.models.pkg.SrcPkgId("pkg1"))
+
+        # THEN: all differing packages are reported
+        assert snapshot.diff_pkgs_with(other_snapshot) == [
+            cimple.models.pkg.SrcPkgId("pkg1"),
+            cimple.models.pkg.BinPkgId("pkg1-bin"),
+            cimple.models.pkg.BinPkgId("pkg3-bin"),
+        ]
+        assert snapshot.compare_pkgs_with(other_snapshot) == cimple.models.pkg.SrcPkgId("pkg1")
+
+    @pytest.mark.usefixtures("basic_cimple_store")
+    def test_get_snapshot(self, mocker: MockerFixture):
+        # GIVEN: an empty snapshot cache
+        load_snapshot_spy = mocker.spy(cimple.snapshot.core, "load_snapshot")
+
+        # WHEN: getting the same snapshot twice
+        snapshot = cimple.snapshot.core.get_snapshot("test-snapshot")
+        same_snapshot = cimple.snapshot.core.get_snapshot("test-snapshot")
+
+        # THEN: the snapshot is only loaded once
+        assert same_snapshot is snapshot
+        load_snapshot_spy.assert_called_once_with("test-snapshot")
+
+        # WHEN: the stored snapshot changes
+        snapshot_path = cimple.constants.cimple_snapshot_dir / "test-snapshot.json"
+        snapshot_path.write_text(snapshot_path.read_text() + "\n")
+        changed_snapshot = cimple.snapshot.core.get_snapshot("test-snapshot")
+
+        # THEN: the snapshot is loaded again, and the outdated one is dropped
+        assert changed_snapshot is not snapshot
+        assert load_snapshot_spy.call_count == 2
+        assert len(cimple.snapshot.core._snapshot_cache) == 1
+
     def test_snapshot_graph(self):
         # GIVEN: a snapshot with some bootstrap packages and normal packages
         snapshot_data_raw = {
@@ -810,6 +929,154 @@ class TestComputeBuildGraph:
         ]:
             assert snapshot.bin_pkg_map[pkg_id].sha256 == "placeholder"
 
+    def test_compute_build_graph_parallel_resolution(
+        self, helpers: tests.conftest.Helpers, mocker: MockerFixture
+    ):
+        # GIVEN: the package index on the real filesystem, and several packages to add
+        changes = cimple.models.snapshot.SnapshotChanges.model_construct(
+            add=[
+                cimple.models.snapshot.SnapshotChangeAdd.model_construct(name=name, version=version)
+                for name, version in [("pkg1", "1.0-1"), ("pkg5", "1.0-1"), ("pkg2", "1.0-1")]
+            ],
+            remove=[],
+            update=[],
+        )
+        load_threads: set[str] = set()
+        load_pkg_config = cimple.models.pkg_config.load_pkg_config
+
+        def recording_load_pkg_config(*args: typing.Any, **kwargs: typing.Any):
+            load_threads.add(threading.current_thread().name)
+            return load_pkg_config(*args, **kwargs)
+
+        mocker.patch(
+            "cimple.models.pkg_config.load_pkg_config", side_effect=recording_load_pkg_config
+        )
+
+        # WHEN: computing the build graph
+        snapshot = helpers.mock_cimple_snapshot(
+            [cimple.models.pkg.BinPkgId("pkg3-bin"), cimple.models.pkg.BinPkgId("pkg4-bin")]
+        )
+        with importlib.resources.path("tests", "data/pi") as pi_path:
+            build_graph = snapshot.update_with_changes(
+                pkg_changes=changes,
+                bootstrap_changes=no_changes,
+                pkg_processor=cimple.pkg.ops.PkgOps(),
+                pkg_index_path=pi_path,
+            )
+
+        # THEN: the configs are loaded off the calling thread
+        assert threading.current_thread().name not in load_threads
+
+        # THEN: the packages are added in the order of the changes
+        assert list(snapshot.src_pkg_map) == [
+            cimple.models.pkg.SrcPkgId("pkg3-bin"),
+            cimple.models.pkg.SrcPkgId("pkg4-bin"),
+            cimple.models.pkg.SrcPkgId("pkg1"),
+            cimple.models.pkg.SrcPkgId("pkg5"),
+            cimple.models.pkg.SrcPkgId("pkg2"),
+        ]
+        assert build_graph.graph.number_of_nodes() == 6
+
+    def test_parallel_resolution_matches_serial(
+        self,
+        tmp_path: pathlib.Path,
+        helpers: tests.conftest.Helpers,
+        mocker: MockerFixture,
+        monkeypatch: pytest.MonkeyPatch,
+    ):
+        # GIVEN: a package index on the real filesystem, with many packages sharing dependencies,
+        # and a compiled catalog that is out of date for some of them
+        pi_path = tmp_path / "pi"
+        base_names = [f"base{i}" for i in range(4)]
+        app_names = [f"app{i}" for i in range(24)]
+
+        def write_pkg_config(name: str, build_depends: list[str], depends: list[str]) -> None:
+            config_path = cimple.models.pkg_config.pkg_config_path(pi_path, name, "1.0-1")
+            config_path.parent.mkdir(parents=True)
+            config_path.write_text(
+                "\n".join(
+                    [
+                        "schema_version = 0",
+                        f'name = "{name}"',
+                        'version = "1.0-1"',
+                        'pkg_type = "custom"',
+                        "[pkg]",
+                        'supported_platforms = ["windows-x86_64"]',
+                        f"build_depends = {build_depends!r}",
+                        f"[binaries.{name}-bin]",
+                        f"depends = {depends!r}",
+                        "[input]",
+                        'source_version = "1.0"',
+                        f'sha256 = "{"0" * 64}"',
+                        "patches = []",
+                        "[rules]",
+                        'default = ["abc abc"]',
+                    ]
+                )
+            )
+
+        for name in base_names:
+            write_pkg_config(name, [], [])
+        for index, name in enumerate(app_names):
+            write_pkg_config(
+                name,
+                [f"{base_names[index % 4]}-bin", f"{base_names[(index + 1) % 4]}-bin"],
+                [f"{base_names[index % 4]}-bin"],
+            )
+        cimple.pkg.catalog.compile_pkg_catalog(pi_path)
+        for name in app_names[::5]:
+            config_path = cimple.models.pkg_config.pkg_config_path(pi_path, name, "1.0-1")
+            config_path.write_text(config_path.read_text() + "\n")
+
+        changes = cimple.models.snapshot.SnapshotChanges.model_construct(
+            add=[
+                cimple.models.snapshot.SnapshotChangeAdd.model_construct(name=name, version="1.0-1")
+                for name in [*app_names, *base_names]
+            ],
+            remove=[],
+            update=[],
+        )
+
+        def update_snapshot() -> tuple[cimple.snapshot.core.CimpleSnapshot, set[tuple]]:
+            snapshot = helpers.mock_cimple_snapshot([])
+            build_graph = snapshot.update_with_changes(
+                pkg_changes=changes,
+                bootstrap_changes=no_changes,
+                pkg_processor=cimple.pkg.ops.PkgOps(),
+                pkg_index_path=pi_path,
+            )
+            return snapshot, set(build_graph.graph.edges())
+
+        # WHEN: resolving the packages on a thread pool, and again on the calling thread
+        load_threads: set[str] = set()
+        load_pkg_config = cimple.models.pkg_config.load_pkg_config
+
+        def recording_load_pkg_config(*args: typing.Any, **kwargs: typing.Any):
+            load_threads.add(threading.current_thread().name)
+            return load_pkg_config(*args, **kwargs)
+
+        mocker.patch(
+            "cimple.models.pkg_config.load_pkg_config", side_effect=recording_load_pkg_config
+        )
+        parallel_snapshot, parallel_build_edges = update_snapshot()
+        parallel_threads = set(load_threads)
+
+        cimple.models.pkg_config._pkg_configs.clear()
+        cimple.models.pkg_config._pkg_catalogs.clear()
+        monkeypatch.setattr(cimple.snapshot.core, "_RESOLVE_MAX_WORKERS", 1)
+        serial_snapshot, serial_build_edges = update_snapshot()
+
+        # THEN: the packages were resolved on several threads
+        assert len(parallel_threads - {threading.current_thread().name}) > 1
+
+        # THEN: both resolutions give the same snapshot and build graph
+        assert list(parallel_snapshot.src_pkg_map) == list(serial_snapshot.src_pkg_map)
+        assert parallel_snapshot.src_pkg_map == serial_snapshot.src_pkg_map
+        assert parallel_snapshot.bin_pkg_map == serial_snapshot.bin_pkg_map
+        assert set(parallel_snapshot.graph.edges()) == set(serial_snapshot.graph.edges())
+        assert parallel_build_edges == serial_build_edges
+        assert len(parallel_snapshot.src_pkg_map) == len(app_names) + len(base_names)
+
 
 class TestExecuteBuildGraph:
     def test_execute_build_graph(
@@ -0,0 +1,95 @@
+import importlib.resources
+import pathlib
+import shutil
+import typing
+
+import pytest
+
+import cimple.constants
+from cimple.models import pkg as pkg_models
+from cimple.pkg import ops as pkg_ops
+from cimple.snapshot import core as snapshot_core
+
+if typing.TYPE_CHECKING:
+    from pytest_mock import MockerFixture
+
+
+@pytest.fixture(name="dumped_snapshot")
+def dumped_snapshot_fixture(
+    tmp_path: pathlib.Path, mocker: MockerFixture
+) -> snapshot_core.CimpleSnapshot:
+    # Binary snapshots are memory-mapped, which needs real files instead of pyfakefs
+    snapshot_dir = tmp_path / "snapshot"
+    mocker.patch("cimple.constants.cimple_snapshot_dir", snapshot_dir)
+    with importlib.resources.path("tests", "data/store/snapshot") as store_snapshot_dir:
+        shutil.copytree(store_snapshot_dir, snapshot_dir)
+
+    snapshot = snapshot_core.load_snapshot("test-snapshot")
+    datetime_mock = mocker.patch("cimple.snapshot.core.datetime")
+    datetime_mock.datetime.now.return_value.strftime.return_value = "dumped"
+    snapshot.dump_snapshot()
+    return snapshot
+
+
+def test_binary_snapshot_lookup(dumped_snapshot: snapshot_core.CimpleSnapshot):
+    # WHEN: opening the binary encoding of a dumped snapshot
+    binary_snapshot = snapshot_core.load_binary_snapshot("dumped")
+    assert binary_snapshot is not None
+
+    with binary_snapshot:
+        # THEN: every package can be looked up, and is identical to the loaded snapshot
+        for src_pkg_map in (dumped_snapshot.src_pkg_map, dumped_snapshot.bootstrap_src_pkg_map):
+            for pkg_id, pkg in src_pkg_map.items():
+                assert binary_snapshot.get_src_pkg(pkg_id) == pkg
+                assert binary_snapshot.depends_of(pkg_id) == pkg.build_depends
+        for bin_pkg_map in (dumped_snapshot.bin_pkg_map, dumped_snapshot.bootstrap_bin_pkg_map):
+            for pkg_id, pkg in bin_pkg_map.items():
+                assert binary_snapshot.get_bin_pkg(pkg_id) == pkg
+                assert binary_snapshot.depends_of(pkg_id) == pkg.depends
+
+        # THEN: bootstrap packages are marked as such
+        assert binary_snapshot.is_bootstrap(pkg_models.SrcPkgId("bootstrap1"))
+        assert not binary_snapshot.is_bootstrap(pkg_models.SrcPkgId("pkg1"))
+
+        # THEN: unknown packages are not found
+        assert binary_snapshot.get_src_pkg(pkg_models.SrcPkgId("pkg1-bin")) is None
+        assert binary_snapshot.get_bin_pkg(pkg_models.BinPkgId("unknown")) is None
+
+        # THEN: snapshot metadata is kept
+        assert binary_snapshot.metadata["ancestor"] == "test-ancestor"
+
+
+@pytest.mark.usefixtures("dumped_snapshot")
+def test_binary_snapshot_mismatch():
+    # GIVEN: a dumped snapshot that was changed after its binary encoding was written
+    snapshot_path = cimple.constants.cimple_snapshot_dir / "dumped.json"
+    snapshot_path.write_text(snapshot_path.read_text() + "\n")
+
+    # WHEN: opening the binary encoding
+    binary_snapshot = snapshot_core.load_binary_snapshot("dumped")
+
+    # THEN: it is not used
+    assert binary_snapshot is None
+
+
+def test_install_prev_package_from_binary_snapshot(
+    dumped_snapshot: snapshot_core.CimpleSnapshot, mocker: MockerFixture
+):
+    # GIVEN: a snapshot whose ancestor has a binary encoding
+    dumped_snapshot.ancestor = "dumped"
+    mock_tarfile_open = mocker.patch("cimple.pkg.ops.tarfile.open")
+    load_snapshot_spy = mocker.spy(snapshot_core, "load_snapshot")
+
+    # WHEN: installing a prev package
+    pkg_ops.PkgOps().install_pkg(
+        pathlib.Path("/target/"), pkg_models.BinPkgId("prev:pkg1-bin"), dumped_snapshot
+    )
+
+    # THEN: the package is found without loading the whole ancestor snapshot
+    load_snapshot_spy.assert_not_called()
+    mock_tarfile_open.assert_called_once()
+    opened_path = mock_tarfile_open.call_args[0][0]
+    assert (
+        opened_path.name
+        == dumped_snapshot.bin_pkg_map[pkg_models.BinPkgId("pkg1-bin")].tarball_name
+    )
@@ -0,0 +1,48 @@
+import typing
+
+from cimple.models import pkg as pkg_models
+from cimple.snapshot import merkle
+
+if typing.TYPE_CHECKING:
+    import tests.conftest
+    from cimple.models import snapshot as snapshot_models
+
+
+def test_merkle_tree_equality(helpers: tests.conftest.Helpers):
+    # GIVEN: the same packages in different orders
+    pkgs = [helpers.make_snapshot_bin_pkg(f"pkg{i}") for i in range(100)]
+
+    # WHEN: building Merkle trees over them
+    tree = merkle.PkgMerkleTree(pkgs)
+    reversed_tree = merkle.PkgMerkleTree(reversed(pkgs))
+
+    # THEN: the trees are equal
+    assert tree.root_hash == reversed_tree.root_hash
+    assert tree.diff(reversed_tree) == []
+
+
+def test_merkle_tree_diff(helpers: tests.conftest.Helpers):
+    # GIVEN: a large set of packages, and a copy with some packages changed, removed and added
+    pkgs: dict[str, snapshot_models.SnapshotSrcPkg | snapshot_models.SnapshotBinPkg] = {
+        f"pkg{i}": helpers.make_snapshot_bin_pkg(f"pkg{i}") for i in range(1000)
+    }
+    pkgs["src"] = helpers.make_snapshot_src_pkg("src")
+    changed_pkgs = dict(pkgs)
+    changed_pkgs["pkg1"] = helpers.make_snapshot_bin_pkg("pkg1", sha256="1" * 64)
+    changed_pkgs["src"] = helpers.make_snapshot_src_pkg("src", version="2.0-1")
+    del changed_pkgs["pkg500"]
+    changed_pkgs["new"] = helpers.make_snapshot_bin_pkg("new")
+
+    # WHEN: diffing their Merkle trees
+    tree = merkle.PkgMerkleTree(pkgs.values())
+    changed_tree = merkle.PkgMerkleTree(changed_pkgs.values())
+
+    # THEN: every difference is found, source packages first
+    assert tree.root_hash != changed_tree.root_hash
+    assert tree.diff(changed_tree) == [
+        pkg_models.SrcPkgId("src"),
+        pkg_models.BinPkgId("new"),
+        pkg_models.BinPkgId("pkg1"),
+        pkg_models.BinPkgId("pkg500"),
+    ]
+    assert changed_tree.diff(tree) == tree.diff(changed_tree)
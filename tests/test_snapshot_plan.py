@@ -0,0 +1,92 @@
+import concurrent.futures
+import typing
+
+from cimple.models import pkg as pkg_models
+from cimple.snapshot import plan
+
+if typing.TYPE_CHECKING:
+    import pathlib
+
+    import pyfakefs.fake_filesystem
+    from pytest_mock import MockerFixture
+
+    import tests.conftest
+
+
+def test_compute_build_plan(helpers: tests.conftest.Helpers):
+    # GIVEN: a diamond of build dependencies, and the recorded build durations of all but one
+    build_graph = helpers.make_build_graph({"a": [], "b": ["a"], "c": ["a"], "d": ["b", "c"]})
+    build_durations = {"a": 10.0, "b": 30.0, "c": 5.0}
+
+    # WHEN: computing the build plan
+    build_plan = plan.compute_build_plan(build_graph, build_durations)
+
+    # THEN: packages are grouped in waves of packages that can be built together
+    assert build_plan.pkg_count == 4
+    assert build_plan.waves == [
+        [pkg_models.SrcPkgId("a")],
+        [pkg_models.SrcPkgId("b"), pkg_models.SrcPkgId("c")],
+        [pkg_models.SrcPkgId("d")],
+    ]
+
+    # THEN: the package without a recorded duration is estimated at the average of the others
+    assert build_plan.unknown_duration_pkgs == [pkg_models.SrcPkgId("d")]
+    assert build_plan.serial_seconds == 60.0
+
+    # THEN: the parallel estimate is the length of the critical path, through the slowest branch
+    assert build_plan.parallel_seconds == 55.0
+    assert build_plan.critical_path == [
+        (pkg_models.SrcPkgId("a"), 10.0),
+        (pkg_models.SrcPkgId("b"), 30.0),
+        (pkg_models.SrcPkgId("d"), 15.0),
+    ]
+
+    # THEN: the build graph itself is left untouched
+    assert build_graph.graph.number_of_nodes() == 8
+
+
+def test_compute_build_plan_empty(helpers: tests.conftest.Helpers):
+    # GIVEN: an empty build graph
+    build_graph = helpers.make_build_graph({})
+
+    # WHEN: computing the build plan
+    build_plan = plan.compute_build_plan(build_graph, {})
+
+    # THEN: nothing would be built
+    assert build_plan == plan.BuildPlan(
+        waves=[],
+        serial_seconds=0.0,
+        parallel_seconds=0.0,
+        critical_path=[],
+        unknown_duration_pkgs=[],
+    )
+
+
+def test_record_build_duration(fs: pyfakefs.fake_filesystem.FakeFilesystem):
+    # GIVEN: no recorded build durations
+    assert plan.load_build_durations() == {}
+
+    # WHEN: recording build durations, including a new build of the same package
+    plan.record_build_duration(pkg_models.SrcPkgId("a"), 10.0)
+    plan.record_build_duration(pkg_models.SrcPkgId("b"), 20.0)
+    plan.record_build_duration(pkg_models.SrcPkgId("a"), 12.0)
+
+    # THEN: the latest duration of each package is kept
+    assert plan.load_build_durations() == {"a": 12.0, "b": 20.0}
+
+
+def test_record_build_duration_concurrent(tmp_path: pathlib.Path, mocker: MockerFixture):
+    # GIVEN: build durations stored on a real filesystem, where file locks work
+    mocker.patch("cimple.constants.cimple_build_durations_path", tmp_path / "durations.json")
+
+    # WHEN: recording the durations of many builds concurrently
+    pkg_names = [f"pkg{i}" for i in range(16)]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+        list(
+            executor.map(
+                lambda name: plan.record_build_duration(pkg_models.SrcPkgId(name), 1.0), pkg_names
+            )
+        )
+
+    # THEN: no duration is lost
+    assert plan.load_build_durations() == dict.fromkeys(pkg_names, 1.0)
@@ -0,0 +1,126 @@
+import os
+import stat
+import time
+import typing
+import unittest.mock
+
+import pytest
+
+import cimple.source_cache
+import cimple.util
+
+if typing.TYPE_CHECKING:
+    import pathlib
+
+    from pytest_mock import MockerFixture
+
+
+@pytest.fixture(name="source_cache_dir")
+def source_cache_dir_fixture(tmp_path: pathlib.Path, mocker: MockerFixture) -> pathlib.Path:
+    # File locks need real file descriptors, so use a real temporary directory instead of pyfakefs
+    source_cache_dir = tmp_path / "source_cache"
+    mocker.patch("cimple.constants.cimple_source_cache_dir", source_cache_dir)
+    return source_cache_dir
+
+
+def test_source_tree_key():
+    # WHEN: computing keys for the same inputs
+    key = cimple.source_cache.source_tree_key("orig", ["patch1", "patch2"], "root")
+
+    # THEN: the key is stable
+    assert key == cimple.source_cache.source_tree_key("orig", ["patch1", "patch2"], "root")
+
+    # THEN: the key changes with patch order and tarball root directory
+    assert key != cimple.source_cache.source_tree_key("orig", ["patch2", "patch1"], "root")
+    assert key != cimple.source_cache.source_tree_key("orig", ["patch1", "patch2"], None)
+
+
+def test_get_source_tree(source_cache_dir: pathlib.Path):
+    # GIVEN: a function populating a source tree
+    def populate(source_dir: pathlib.Path) -> None:
+        (source_dir / "src").mkdir()
+        (source_dir / "src" / "main.c").write_text("int main() {}")
+
+    populate_mock = unittest.mock.Mock(side_effect=populate)
+
+    # WHEN: getting the same source tree twice
+    first_tree = cimple.source_cache.get_source_tree("key", populate_mock)
+    second_tree = cimple.source_cache.get_source_tree("key", populate_mock)
+
+    # THEN: the source tree is only populated once
+    populate_mock.assert_called_once()
+    assert first_tree == second_tree == source_cache_dir / "key"
+    assert (first_tree / "src" / "main.c").read_text() == "int main() {}"
+
+    # THEN: the cached source tree is read-only
+    for path in (first_tree, first_tree / "src", first_tree / "src" / "main.c"):
+        assert not path.stat().st_mode & (stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH)
+
+
+def test_get_source_tree_failure(source_cache_dir: pathlib.Path):
+    # GIVEN: a function that fails to populate a source tree
+    def populate(source_dir: pathlib.Path) -> None:
+        (source_dir / "partial.txt").write_text("partial")
+        raise RuntimeError("Failed to apply patch")
+
+    # WHEN: getting the source tree
+    # THEN: the error is propagated and nothing is cached
+    with pytest.raises(RuntimeError, match="Failed to apply patch"):
+        cimple.source_cache.get_source_tree("key", populate)
+    assert list(source_cache_dir.iterdir()) == [source_cache_dir / ".key.lock"]
+
+
+def test_prune_source_cache(source_cache_dir: pathlib.Path):
+    # GIVEN: two cached source trees that were not used for longer than the maximum age
+    def populate(source_dir: pathlib.Path) -> None:
+        (source_dir / "main.c").write_text("int main() {}")
+
+    stale_tree = cimple.source_cache.get_source_tree("stale", populate)
+    used_tree = cimple.source_cache.get_source_tree("used", populate)
+    old_time = time.time() - cimple.source_cache.SOURCE_CACHE_MAX_AGE_SECONDS - 60
+    for path in (stale_tree, used_tree):
+        os.utime(path, (old_time, old_time))
+
+    # WHEN: using one of them, then caching a new source tree
+    cimple.source_cache.get_source_tree("used", populate)
+    new_tree = cimple.source_cache.get_source_tree("new", populate)
+
+    # THEN: only the source tree that was not used is removed
+    assert not stale_tree.exists()
+    assert (used_tree / "main.c").is_file()
+    assert (new_tree / "main.c").is_file()
+
+
+def test_clean_source_cache(source_cache_dir: pathlib.Path):
+    # GIVEN: a cached read-only source tree
+    def populate(source_dir: pathlib.Path) -> None:
+        (source_dir / "main.c").write_text("int main() {}")
+
+    cimple.source_cache.get_source_tree("key", populate)
+
+    # WHEN: cleaning the source cache
+    cimple.source_cache.clean_source_cache()
+
+    # THEN: the source cache is removed
+    assert not source_cache_dir.exists()
+
+
+def test_clone_source_tree(tmp_path: pathlib.Path):
+    # GIVEN: a read-only cached source tree and an empty build directory
+    cache_path = tmp_path / "cache"
+    (cache_path / "src").mkdir(parents=True)
+    (cache_path / "src" / "main.c").write_text("int main() {}")
+    cimple.util.make_read_only(cache_path)
+    build_dir = tmp_path / "build"
+    build_dir.mkdir()
+
+    # WHEN: cloning the source tree and modifying the clone
+    cimple.source_cache.clone_source_tree(cache_path, build_dir)
+    (build_dir / "src" / "main.c").write_text("int main() { return 1; }")
+
+    # THEN: the cached source tree is unaffected
+    assert (cache_path / "src" / "main.c").read_text() == "int main() {}"
+
+    # THEN: the clone is writable
+    for path in (build_dir / "src", build_dir / "src" / "main.c"):
+        assert path.stat().st_mode & stat.S_IWUSR
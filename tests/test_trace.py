@@ -0,0 +1,77 @@
+import json
+import threading
+import typing
+
+import pytest
+
+import cimple.trace
+
+if typing.TYPE_CHECKING:
+    import pathlib
+
+    from pytest_mock import MockerFixture
+
+
+def test_span_disabled(mocker: MockerFixture):
+    # GIVEN: tracing is disabled
+    args_mock = mocker.Mock(return_value={"arg": 1})
+
+    # WHEN: entering spans
+    # THEN: they are all the same no-op context, and their args are never built
+    assert cimple.trace.span("a") is cimple.trace.span("b", args_mock)
+    with cimple.trace.span("a"):
+        pass
+    args_mock.assert_not_called()
+
+
+def test_tracing(tmp_path: pathlib.Path):
+    # GIVEN: a trace file
+    trace_path = tmp_path / "trace.json"
+
+    # WHEN: tracing nested spans on the main thread and spans on a worker thread
+    def work() -> None:
+        with cimple.trace.span("worker span"):
+            pass
+
+    with cimple.trace.tracing(trace_path):
+        with cimple.trace.span("outer", lambda: {"pkg": "pkg1"}), cimple.trace.span("inner"):
+            pass
+        worker = threading.Thread(target=work, name="worker")
+        worker.start()
+        worker.join()
+
+    # THEN: tracing is disabled again
+    assert cimple.trace._tracer is None
+
+    # THEN: the spans are written as complete events, with their args
+    events = json.loads(trace_path.read_text())["traceEvents"]
+    spans = {event["name"]: event for event in events if event["ph"] == "X"}
+    assert spans.keys() == {"outer", "inner", "worker span"}
+    assert spans["outer"]["args"] == {"pkg": "pkg1"}
+    assert spans["outer"]["ts"] <= spans["inner"]["ts"]
+    assert (
+        spans["inner"]["ts"] + spans["inner"]["dur"] <= spans["outer"]["ts"] + spans["outer"]["dur"]
+    )
+
+    # THEN: each thread has its own named track
+    assert spans["outer"]["tid"] == spans["inner"]["tid"]
+    assert spans["outer"]["tid"] != spans["worker span"]["tid"]
+    track_names = {event["tid"]: event["args"]["name"] for event in events if event["ph"] == "M"}
+    assert track_names[spans["worker span"]["tid"]] == "worker"
+
+
+def test_tracing_failure(tmp_path: pathlib.Path):
+    # GIVEN: a trace file
+    trace_path = tmp_path / "trace.json"
+
+    # WHEN: the traced code fails
+    with (
+        pytest.raises(RuntimeError, match="failed"),
+        cimple.trace.tracing(trace_path),
+        cimple.trace.span("failing"),
+    ):
+        raise RuntimeError("failed")
+
+    # THEN: the trace is still written, including the failing span
+    events = json.loads(trace_path.read_text())["traceEvents"]
+    assert [event["name"] for event in events if event["ph"] == "X"] == ["failing"]
@@ -0,0 +1,36 @@
+import typing
+
+import cimple.trash
+import cimple.util
+
+if typing.TYPE_CHECKING:
+    import pathlib
+
+    from pytest_mock import MockerFixture
+
+
+def test_move_to_trash_reclaims_abandoned(tmp_path: pathlib.Path, mocker: MockerFixture):
+    # GIVEN: the trash of a process that exited before finishing deletion, and the trash of a
+    # running process with a container it has not filled yet
+    trash_dir = tmp_path / "trash"
+    mocker.patch("cimple.constants.cimple_trash_dir", trash_dir)
+    abandoned_path = trash_dir / "123-abandoned"
+    (abandoned_path / "workspace-abc" / "workspace").mkdir(parents=True)
+    (abandoned_path / "workspace-abc" / "workspace" / "main.o").write_text("object")
+    live_path = trash_dir / "456-live"
+    (live_path / "workspace-def").mkdir(parents=True)
+
+    with cimple.util.file_lock(trash_dir / "456-live.lock"):
+        # WHEN: moving a directory to the trash
+        path = tmp_path / "workspace"
+        path.mkdir()
+        cimple.trash.move_to_trash(path)
+        cimple.trash.wait_for_trash()
+
+        # THEN: the directory and the abandoned trash are deleted
+        assert not path.exists()
+        assert not abandoned_path.exists()
+        assert not (trash_dir / "123-abandoned.lock").exists()
+
+        # THEN: the trash of the running process is left alone
+        assert (live_path / "workspace-def").is_dir()
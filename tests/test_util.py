@@ -0,0 +1,63 @@
+import stat
+import typing
+
+import cimple.trash
+import cimple.util
+
+if typing.TYPE_CHECKING:
+    import pathlib
+
+    from pytest_mock import MockerFixture
+
+
+def _create_read_only_tree(root: pathlib.Path) -> None:
+    (root / "sub").mkdir(parents=True)
+    (root / "sub" / "file.txt").write_text("content")
+    (root / "file.txt").write_text("content")
+    (root / "link").symlink_to(root / "sub", target_is_directory=True)
+    cimple.util.make_read_only(root)
+
+
+def test_remove_tree_read_only(tmp_path: pathlib.Path):
+    # GIVEN: a read-only directory tree
+    root = tmp_path / "root"
+    _create_read_only_tree(root)
+    assert not (root / "sub").stat().st_mode & stat.S_IWUSR
+
+    # WHEN: removing the tree
+    cimple.util.remove_tree(root)
+
+    # THEN: the tree is removed
+    assert not root.exists()
+
+
+def test_clear_path(tmp_path: pathlib.Path):
+    # GIVEN: a directory with content
+    root = tmp_path / "root"
+    _create_read_only_tree(root)
+
+    # WHEN: clearing the directory
+    cimple.util.clear_path(root)
+
+    # THEN: the directory exists and is empty
+    assert root.is_dir()
+    assert list(root.iterdir()) == []
+
+
+def test_clear_path_background(tmp_path: pathlib.Path, mocker: MockerFixture):
+    # GIVEN: a directory with content, and a trash directory
+    trash_dir = tmp_path / "trash"
+    mocker.patch("cimple.constants.cimple_trash_dir", trash_dir)
+    root = tmp_path / "root"
+    _create_read_only_tree(root)
+
+    # WHEN: clearing the directory in the background
+    cimple.util.clear_path(root, background=True)
+
+    # THEN: the directory is empty right away
+    assert root.is_dir()
+    assert list(root.iterdir()) == []
+
+    # THEN: the old content is eventually deleted from the trash
+    cimple.trash.wait_for_trash()
+    assert list(trash_dir.glob("*/*")) == []
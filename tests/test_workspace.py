@@ -0,0 +1,66 @@
+import typing
+
+import pytest
+
+import cimple.trash
+import cimple.workspace
+
+if typing.TYPE_CHECKING:
+    import pathlib
+
+    from pytest_mock import MockerFixture
+
+
+@pytest.fixture(name="local_dir")
+def local_dir_fixture(tmp_path: pathlib.Path, mocker: MockerFixture) -> pathlib.Path:
+    mocker.patch("cimple.constants.cimple_workspace_dir", tmp_path / "workspace")
+    mocker.patch("cimple.constants.cimple_trash_dir", tmp_path / "trash")
+    return tmp_path
+
+
+@pytest.mark.usefixtures("local_dir")
+def test_allocate_unique_workspaces():
+    # WHEN: allocating workspaces for a bootstrap package and its normal variant
+    bootstrap_workspace = cimple.workspace.allocate_workspace("bootstrap:pkg1-1.0-1")
+    workspace = cimple.workspace.allocate_workspace("pkg1-1.0-1")
+
+    # THEN: the workspaces are distinct and have empty build, output and deps directories
+    assert bootstrap_workspace.path != workspace.path
+    assert ":" not in bootstrap_workspace.path.name
+    for ws in (bootstrap_workspace, workspace):
+        for directory in (ws.build_dir, ws.output_dir, ws.deps_dir):
+            assert directory.is_dir()
+            assert list(directory.iterdir()) == []
+
+
+def test_build_workspace_recycled(local_dir: pathlib.Path):
+    # WHEN: a build finishes successfully in a workspace
+    with cimple.workspace.build_workspace("pkg1-1.0-1") as workspace:
+        (workspace.build_dir / "main.o").write_text("object")
+
+    # THEN: the workspace is removed immediately, and deleted from the trash in the background
+    assert not workspace.path.exists()
+    cimple.trash.wait_for_trash()
+    assert list((local_dir / "trash").glob("*/*")) == []
+
+
+@pytest.mark.usefixtures("local_dir")
+def test_build_workspace_kept_on_failure():
+    # WHEN: a build fails in a workspace
+    with pytest.raises(RuntimeError), cimple.workspace.build_workspace("pkg1-1.0-1") as workspace:
+        raise RuntimeError("Build failed")
+
+    # THEN: the workspace is kept for inspection
+    assert workspace.build_dir.is_dir()
+
+
+def test_build_workspace_recycle_failure(local_dir: pathlib.Path, mocker: MockerFixture):
+    # GIVEN: workspaces cannot be moved into the trash
+    mocker.patch("cimple.trash.move_to_trash", side_effect=OSError("Device or resource busy"))
+
+    # WHEN: a build finishes successfully in a workspace
+    with cimple.workspace.build_workspace("pkg1-1.0-1") as workspace:
+        pass
+
+    # THEN: the build does not fail, and the workspace is left in place
+    assert workspace.path.is_dir()